@@ -0,0 +1,57 @@
+import atexit
+import os
+import threading
+import config
+
+# The application log. Callers only put records on a bounded queue; a
+# background QueueListener formats them as JSON lines and writes them to
+# config.LOG_PATH in batches, rolling the file over at LOG_MAX_BYTES. Nothing
+# is set up until the first get_logger() call, so importing main.py (or a
+# command that never logs) does not touch the log file or start a thread.
+#
+# Fields passed with extra= are written as keys of the JSON record, e.g.
+#   get_logger().info("Duty added.", extra={'project_id': pid, 'duty_id': did})
+
+LOGGER_NAME = 'trellomize'
+
+_logger = None
+_listener = None
+_setup_lock = threading.Lock()
+
+def get_logger():
+    global _logger, _listener
+    if _logger is not None:
+        return _logger
+    with _setup_lock:
+        if _logger is None:
+            directory = os.path.dirname(config.LOG_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            import logging
+            import queue
+            from loghandlers import (JsonFormatter, BatchingRotatingFileHandler, DroppingQueueHandler,
+                                     BatchingQueueListener)
+
+            log_queue = queue.Queue(config.LOG_QUEUE_SIZE)
+            handler = BatchingRotatingFileHandler(config.LOG_PATH, config.LOG_MAX_BYTES,
+                                                  config.LOG_BACKUPS, config.LOG_BATCH_SIZE)
+            handler.setFormatter(JsonFormatter())
+            _listener = BatchingQueueListener(log_queue, handler)
+            _listener.start()
+            atexit.register(shutdown)
+
+            logger = logging.getLogger(LOGGER_NAME)
+            logger.setLevel(config.LOG_LEVEL)
+            logger.addHandler(DroppingQueueHandler(log_queue))
+            logger.propagate = False
+            _logger = logger
+    return _logger
+
+# Writes out the queued records and stops the writer thread
+def shutdown():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,103 @@
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from indexes import finish_timestamp
+from instrumentation import add_count, measure
+
+# Hot/cold tiering of duties. ARCHIVED duties, and DONE duties that finished
+# before some time (config.ARCHIVE_DONE_AFTER ago), are moved out of the
+# project into its cold segments: the duties of one move, as JSON lines,
+# compressed into one gzip member. The project keeps only the hot duties, so
+# its snapshot, its indexes and every load of it stay about the size of the
+# work still going on; the cold ones are only read when asked for (see
+# Repository.iter_archived_duties).
+#
+# Moving writes the segment first and then removes the duties from the
+# project with a DUTIES_ARCHIVED journal record. A crash or conflict in
+# between leaves copies in both tiers; the project's copy is the one that
+# counts, so cold duties whose ID is also in the project are not shown, and
+# a later move just adds another copy, of which the last one is shown.
+
+def _archivable(duty, done_before):
+    if duty.get('Status') == 'ARCHIVED':
+        return True
+    finish = finish_timestamp(duty)
+    return duty.get('Status') == 'DONE' and finish is not None and finish < done_before
+
+# The duties to move out of a project, done_before in epoch seconds. A duty
+# sharing its ID with one of them goes too, as the move removes duties by ID.
+def archivable_duties(duties, done_before):
+    archived = {duty['ID'] for duty in duties if _archivable(duty, done_before)}
+    return [duty for duty in duties if duty['ID'] in archived]
+
+def encode_segment(duties):
+    with measure('serialize'):
+        return gzip.compress(''.join(json.dumps(duty) + '\n' for duty in duties).encode(), mtime=0)
+
+# The duties of concatenated segments, in order. A segment cut short by a
+# crash while it was written ends the data.
+def decode_segments(data):
+    duties = []
+    with measure('parse'):
+        while data:
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            try:
+                lines = decompressor.decompress(data)
+            except zlib.error:
+                break
+            if not decompressor.eof:
+                break
+            duties.extend(json.loads(line) for line in lines.splitlines())
+            data = decompressor.unused_data
+    return duties
+
+# The duties cold_duties (oldest segment first) holds that are not hot
+# (whose ID is not in hot_ids), the last copy of each
+def archived_duties(cold_duties, hot_ids):
+    latest = {}
+    for duty in cold_duties:
+        if duty['ID'] not in hot_ids:
+            latest.pop(duty['ID'], None)
+            latest[duty['ID']] = duty
+    return list(latest.values())
+
+# The cold segments of the JSON and sharded storage: one file per project in
+# directory, its segments appended one after the other
+class ColdStore:
+    def __init__(self, directory):
+        self._directory = directory
+
+    def path(self, project_id):
+        # project IDs are user input, so they are hashed into a safe file name
+        return os.path.join(self._directory, hashlib.sha1(str(project_id).encode()).hexdigest() + '.gz')
+
+    # A single write on an O_APPEND descriptor, synced before the duties are
+    # removed from the project
+    def add(self, project_id, duties):
+        data = encode_segment(duties)
+        os.makedirs(self._directory, exist_ok=True)
+        with measure('disk'):
+            fd = os.open(self.path(project_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        add_count('bytes_written', len(data))
+
+    def duties(self, project_id):
+        try:
+            with measure('disk'), open(self.path(project_id), 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return []
+        add_count('bytes_read', len(data))
+        return decode_segments(data)
+
+    def remove(self, project_id):
+        try:
+            os.remove(self.path(project_id))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,72 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# What moving the ARCHIVED and old DONE duties to the cold segments (see
+# archive.py) saves: the size of projects.json and the time a new process
+# takes to load it, before and after manager.py archive, against the size of
+# the archive and the time to list one project's archived duties. Generated
+# duties have random statuses and finish in 2024, so the DONE and ARCHIVED
+# ones, about two fifths, are cold.
+#
+#   python -m benchmarks.archive --projects 200 --duties 1000
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _load_time(storage, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        storage.Repository().refresh()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def _directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+def main():
+    sys.path.insert(0, ROOT)
+    parser = argparse.ArgumentParser(description='projects.json before and after archiving cold duties.')
+    parser.add_argument('--projects', type=int, default=200)
+    parser.add_argument('--duties', type=int, default=1000, help='Duties per project')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    import config
+    config.STORAGE_BACKEND = 'json'
+    import storage
+    from benchmarks.generate import generate
+    from manager import archive_duties
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.chdir(data_dir)
+        try:
+            generate('.', 1000, args.projects, 5, args.duties)
+            size = os.path.getsize('projects.json')
+            loaded = _load_time(storage, args.runs)
+            print(f"{args.projects * args.duties} duties: projects.json {size / 2 ** 20:8.1f} MiB, loads in {loaded:6.2f} s")
+
+            started = time.perf_counter()
+            archive_duties(None, None)
+            archived = time.perf_counter() - started
+            storage._repository = None
+            hot_size = os.path.getsize('projects.json')
+            hot_loaded = _load_time(storage, args.runs)
+            print(f"after archive:  projects.json {hot_size / 2 ** 20:8.1f} MiB, loads in {hot_loaded:6.2f} s "
+                  f"({size / hot_size:.1f}x smaller, {loaded / hot_loaded:.1f}x faster); archiving took {archived:.2f} s")
+
+            repo = storage.get_repository()
+            started = time.perf_counter()
+            count = len(list(repo.iter_archived_duties('project0')))
+            listed = time.perf_counter() - started
+            print(f"archive:        {_directory_size(config.ARCHIVE_DIR) / 2 ** 20:8.1f} MiB; "
+                  f"listing the {count} archived duties of one project takes {listed * 1000:.1f} ms")
+        finally:
+            os.chdir(cwd)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# What the reminder scheduler does on every wake-up, against a repository
+# with hundreds of thousands of open duties whose finish times are spread
+# over the next days: the due soon and overdue lookups for the time since
+# the last wake-up and the next deadline to sleep until, all from the
+# deadline index, against scanning every duty for the same answers. Also
+# times moving a deadline, which keeps the index sorted.
+#
+#   python -m benchmarks.deadlines --projects 1000 --duties 500 --wakes 200
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _projects(rng, projects, duties, now, spread):
+    from benchmarks.generate import make_projects
+    for project in make_projects(10, projects, 3, duties):
+        for duty in project['Duties']:
+            duty['Status'] = rng.choice(['BACKLOG', 'TODO', 'DOING', 'DOING', 'DONE'])
+            finish = now + rng.randrange(-spread, spread)
+            duty['FinishTime'] = datetime.fromtimestamp(finish).strftime("%Y-%m-%d %H:%M:%S")
+        yield project
+
+def _scan(projects, start, end):
+    from indexes import OPEN_STATUS_VALUES, finish_timestamp
+    found = []
+    for project in projects:
+        for duty in project['Duties']:
+            finish = finish_timestamp(duty)
+            if duty['Status'] in OPEN_STATUS_VALUES and finish is not None and start <= finish < end:
+                found.append((finish, project['ID'], duty['ID']))
+    found.sort()
+    return found
+
+def _wake(repo, start, end, lead):
+    due_soon = repo.get_deadlines(start + lead, end + lead)
+    overdue = repo.get_deadlines(start, end)
+    following = repo.get_deadlines(end + lead, None, 1) + repo.get_deadlines(end, None, 1)
+    return len(due_soon) + len(overdue), following
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+def _summary(timings):
+    timings = sorted(timings)
+    return (f"p50 {statistics.median(timings) * 1000:9.3f} ms  "
+            f"p95 {timings[int(0.95 * (len(timings) - 1))] * 1000:9.3f} ms  max {timings[-1] * 1000:9.3f} ms")
+
+def main():
+    sys.path.insert(0, ROOT)
+    parser = argparse.ArgumentParser(description='Deadline index against scanning every duty.')
+    parser.add_argument('--projects', type=int, default=1000)
+    parser.add_argument('--duties', type=int, default=500, help='Duties per project')
+    parser.add_argument('--spread', type=int, default=7 * 24 * 3600, help='Finish times are now plus or minus this many seconds')
+    parser.add_argument('--wakes', type=int, default=200, help='Scheduler wake-ups, SCHEDULER_POLL_INTERVAL apart')
+    parser.add_argument('--scans', type=int, default=5, help='Wake-ups also answered by scanning')
+    parser.add_argument('--moves', type=int, default=1000, help='Deadlines moved')
+    args = parser.parse_args()
+
+    import config
+    config.STORAGE_BACKEND = 'json'
+    import storage
+
+    rng = random.Random(0)
+    now = int(time.time())
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.chdir(data_dir)
+        try:
+            storage.SaveProjects(list(_projects(rng, args.projects, args.duties, now, args.spread)))
+            repo = storage.Repository()
+            loaded, _ = _timed(repo.refresh)
+            open_duties = len(repo.get_deadlines())
+            print(f"{args.projects * args.duties} duties in {args.projects} projects, {open_duties} open; "
+                  f"loaded in {loaded:.2f} s")
+
+            step = int(config.SCHEDULER_POLL_INTERVAL)
+            timings, reminders = [], 0
+            for number in range(args.wakes):
+                start = now + number * step
+                elapsed, (count, _) = _timed(_wake, repo, start, start + step, config.REMINDER_LEAD)
+                timings.append(elapsed)
+                reminders += count
+            print(f"wake-up, index  {_summary(timings)}  ({reminders / args.wakes:.1f} reminders each)")
+            projects = repo.get_projects()
+            scans = []
+            for number in range(args.scans):
+                start = now + number * step
+                scans.append(_timed(lambda: (_scan(projects, start + config.REMINDER_LEAD, start + step + config.REMINDER_LEAD),
+                                             _scan(projects, start, start + step),
+                                             _scan(projects, start + step, now + args.spread)[:1]))[0])
+            print(f"wake-up, scan   {_summary(scans)}")
+
+            repo.begin_batch()
+            timings = []
+            try:
+                for number in range(args.moves):
+                    project_id = f"project{rng.randrange(args.projects)}"
+                    duty_id = f"{project_id}-duty{rng.randrange(args.duties)}"
+                    finish = datetime.fromtimestamp(now + rng.randrange(-args.spread, args.spread))
+                    timings.append(_timed(repo.update_duty, project_id, duty_id,
+                                          {'FinishTime': finish.strftime("%Y-%m-%d %H:%M:%S")})[0])
+            finally:
+                repo.end_batch()
+            print(f"move deadline   {_summary(timings)}")
+        finally:
+            os.chdir(cwd)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import hashlib
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+# Deterministic synthetic data: the same arguments always produce the same
+# users and projects. The data is written through storage.SaveUsers and
+# storage.SaveProjects, so it lands in whichever backend is configured.
+#
+#   python -m benchmarks.generate --directory /tmp/data --users 1000 --projects 100 --members 10 --duties 100
+#
+# User i is "user<i>" with password "password<i>"; project j is "project<j>",
+# led by its first member; duty k of project j is "project<j>-duty<k>".
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRIORITIES = ("CRITICAL", "HIGH", "MEDIUM", "LOW")
+STATUSES = ("BACKLOG", "TODO", "DOING", "DONE", "ARCHIVED")
+
+# A fixed start, so the generated times do not depend on when this runs
+EPOCH = datetime(2024, 1, 1)
+
+def password_of(number):
+    return f"password{number}"
+
+def make_users(users):
+    for number in range(users):
+        yield {'username': f"user{number}", 'emailaddress': f"user{number}@example.com",
+               'password': hashlib.sha256(password_of(number).encode()).hexdigest(), 'role': ''}
+
+def make_projects(users, projects, members, duties, seed=0):
+    rng = random.Random(seed)
+    for number in range(projects):
+        usernames = [f"user{n}" for n in rng.sample(range(users), min(members, users))]
+        project = {'ID': f"project{number}", 'Title': f"Project {number}", 'Leader': usernames[0],
+                   'Members': usernames, 'Duties': [], 'Version': 1}
+        for duty_number in range(duties):
+            start = EPOCH + timedelta(minutes=rng.randrange(365 * 24 * 60))
+            assignees = rng.sample(usernames, min(len(usernames), rng.randint(1, 3)))
+            project['Duties'].append({
+                'ID': f"project{number}-duty{duty_number}",
+                'Title': f"Duty {duty_number}",
+                'Detail': f"Generated duty {duty_number} of project {number}",
+                'StartTime': start.strftime("%Y-%m-%d %H:%M:%S"),
+                'FinishTime': (start + timedelta(hours=rng.randint(1, 14 * 24))).strftime("%Y-%m-%d %H:%M:%S"),
+                'Priority': rng.choice(PRIORITIES),
+                'Status': rng.choice(STATUSES),
+                'Assignees': assignees,
+                'AssignedTo': assignees[0],
+            })
+        yield project
+
+# Writes the data into directory (created if needed) and returns the counts
+def generate(directory, users, projects, members, duties, seed=0):
+    sys.path.insert(0, ROOT)
+    import storage
+
+    os.makedirs(directory, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        storage.SaveUsers(list(make_users(users)))
+        storage.SaveProjects(list(make_projects(users, projects, members, duties, seed)))
+    finally:
+        os.chdir(cwd)
+    return {'users': users, 'projects': projects, 'members': members, 'duties': duties, 'seed': seed}
+
+def main():
+    parser = argparse.ArgumentParser(description='Write deterministic users and projects for benchmarks.')
+    parser.add_argument('--directory', default='.', help='Where to write the data files')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--projects', type=int, default=100)
+    parser.add_argument('--members', type=int, default=10, help='Members per project')
+    parser.add_argument('--duties', type=int, default=100, help='Duties per project')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    counts = generate(args.directory, args.users, args.projects, args.members, args.duties, args.seed)
+    print(f"Wrote {counts['users']} users and {counts['projects']} projects "
+          f"({counts['projects'] * counts['duties']} duties) to {args.directory}.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# Load test for server.py: generates a data tier (see benchmarks.operations),
+# starts the server on it and runs many concurrent keep-alive clients for a
+# fixed time. Each client mixes reads (project duties, duty queries, project
+# listings) with writes (assign a duty to a member, then change its status as
+# that member). Reports requests per second, latency percentiles and the
+# response statuses.
+#
+#   python -m benchmarks.load_http --tier small --clients 50 --duration 10
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+async def _request(reader, writer, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b'\r\n':
+            break
+        name, _, value = line.decode().partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+async def _client(port, counts, rng, deadline, writes, latencies, statuses):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        while time.perf_counter() < deadline:
+            project = f"project{rng.randrange(counts['projects'])}"
+            started = time.perf_counter()
+            if rng.random() < writes:
+                duty = f"{project}-duty{rng.randrange(counts['duties'])}"
+                status, result = await _request(reader, writer, 'GET', f"/projects/{project}")
+                member = rng.choice(result['Members'])
+                status, _ = await _request(reader, writer, 'POST', f"/projects/{project}/duties/{duty}/assign",
+                                           {'username': member})
+                if status == 200:
+                    status, _ = await _request(reader, writer, 'PATCH', f"/projects/{project}/duties/{duty}",
+                                               {'username': member, 'status': rng.choice(['TODO', 'DOING', 'DONE'])})
+            else:
+                choice = rng.random()
+                if choice < 0.5:
+                    status, _ = await _request(reader, writer, 'GET', f"/projects/{project}/duties?page_size=20")
+                elif choice < 0.8:
+                    status, _ = await _request(reader, writer, 'GET',
+                                               f"/duties?assignee=user{rng.randrange(counts['users'])}&status=open")
+                else:
+                    status, _ = await _request(reader, writer, 'GET', "/projects?page_size=20")
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+async def _run(port, counts, clients, duration, writes):
+    latencies = []
+    statuses = {}
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(port, counts, random.Random(number), deadline, writes, latencies, statuses)
+                           for number in range(clients)))
+    return time.perf_counter() - started, sorted(latencies), statuses
+
+def main():
+    sys.path.insert(0, ROOT)
+    from benchmarks.generate import generate
+    from benchmarks.operations import TIERS
+
+    parser = argparse.ArgumentParser(description='Concurrent clients against server.py.')
+    parser.add_argument('--tier', default='small', choices=list(TIERS))
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds')
+    parser.add_argument('--writes', type=float, default=0.2, help='Fraction of client iterations that write')
+    parser.add_argument('--port', type=int, default=18080)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        counts = generate(data_dir, *TIERS[args.tier])
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server.py'), '--port', str(args.port)],
+                                  cwd=data_dir, stdout=subprocess.PIPE, text=True)
+        try:
+            server.stdout.readline()
+            elapsed, latencies, statuses = asyncio.run(
+                _run(args.port, counts, args.clients, args.duration, args.writes))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{args.tier}: {args.clients} clients for {elapsed:.1f} s, {args.writes:.0%} writing")
+    print(f"{len(latencies) / elapsed:10.0f} iterations/s")
+    print(f"p50 {_percentile(latencies, 0.50) * 1000:8.2f} ms  p95 {_percentile(latencies, 0.95) * 1000:8.2f} ms  "
+          f"p99 {_percentile(latencies, 0.99) * 1000:8.2f} ms  max {latencies[-1] * 1000:8.2f} ms")
+    print("statuses: " + ', '.join(f"{status} x{count}" for status, count in sorted(statuses.items())))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Login of one account out of many, the way a new process logs in: through
+# the username index (storage.find_user, see user_index.py) against loading
+# users.json and looking the username up, which is what login did before.
+# Also times creating accounts, which adds each one to the index in place,
+# and writing the whole index, which SaveUsers and compaction do.
+#
+#   python -m benchmarks.login --users 1000000 --logins 1000
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+def _summary(timings):
+    timings = sorted(timings)
+    return (f"p50 {statistics.median(timings) * 1000:9.3f} ms  "
+            f"p95 {timings[int(0.95 * (len(timings) - 1))] * 1000:9.3f} ms  max {timings[-1] * 1000:9.3f} ms")
+
+# What a new process logging in did before the index
+def _login_by_load(storage, username):
+    repo = storage.Repository()
+    repo.refresh()
+    return repo.get_user(username)
+
+def main():
+    sys.path.insert(0, ROOT)
+    parser = argparse.ArgumentParser(description='Username index against loading every account.')
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--logins', type=int, default=1000, help='Logins through the index')
+    parser.add_argument('--loads', type=int, default=3, help='Logins by loading users.json')
+    parser.add_argument('--creates', type=int, default=1000, help='Accounts created afterwards')
+    args = parser.parse_args()
+
+    import config
+    config.STORAGE_BACKEND = 'json'
+    import storage
+    import user_index
+    from benchmarks.generate import make_users
+
+    rng = random.Random(0)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.chdir(data_dir)
+        try:
+            users = list(make_users(args.users))
+            storage.save_json_users(users)
+            indexed, _ = _timed(user_index.build, 'users.json', users, storage.file_signature('users.json'), 0, 0)
+            del users
+            print(f"{args.users} accounts: users.json {os.path.getsize('users.json') / 2 ** 20:.1f} MiB, "
+                  f"users.index {os.path.getsize('users.index') / 2 ** 20:.1f} MiB written in {indexed:.2f} s")
+
+            usernames = [f"user{rng.randrange(args.users)}" for _ in range(args.logins)]
+            timings = []
+            for username in usernames:
+                elapsed, user = _timed(storage.find_user, username)
+                assert user['username'] == username
+                timings.append(elapsed)
+            print(f"login, index    {_summary(timings)}")
+            elapsed, user = _timed(storage.find_user, 'nobody')
+            assert user is None
+            print(f"unknown user    {elapsed * 1000:9.3f} ms")
+
+            timings = []
+            for username in usernames[:args.loads]:
+                elapsed, user = _timed(_login_by_load, storage, username)
+                assert user['username'] == username
+                timings.append(elapsed)
+            print(f"login, load     {_summary(timings)}")
+
+            repo = storage.Repository()
+            repo.refresh()
+            timings = []
+            for number in range(args.creates):
+                username = f"new{number}"
+                timings.append(_timed(repo.add_user, {'username': username, 'emailaddress': f"{username}@example.com",
+                                                     'password': '', 'role': ''})[0])
+            print(f"create account  {_summary(timings)}")
+            assert user_index.lookup('users.json', f"new{args.creates - 1}") is not None
+        finally:
+            os.chdir(cwd)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Memory used by the domain objects for a project of many duties: the plain
+# __dict__ classes main.py used to have, against the slotted ones with
+# interned users, int-coded Priority/Status and epoch timestamps.
+#
+#   python -m benchmarks.memory_model --duties 100000 --users 50
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class _DictUser:
+    def __init__(self, U, P, E):
+        self._username = U
+        self._password = P
+        self._emailaddress = E
+        self._active = True
+
+class _DictDuty:
+    def __init__(self, Id, title, detail, assignees, assigned_to=None):
+        self._ID = Id
+        self._Title = title
+        self._Detail = detail
+        self._ST = datetime.now()
+        self._FT = self._ST + timedelta(hours=24)
+        self._Priority = None
+        self._Status = None
+        self._Assignees = assignees
+        self._AssignedTo = assigned_to
+
+def _stored_duties(duties, users):
+    for number in range(duties):
+        username = f"user{number % users}"
+        yield {'ID': f"d{number}", 'Title': f"Duty {number}", 'Detail': "benchmark",
+               'StartTime': "2024-05-01 09:00:00", 'FinishTime': "2024-05-02 09:00:00",
+               'Priority': "LOW", 'Status': "BACKLOG",
+               'Assignees': [{'username': username, 'password': "0" * 64,
+                              'emailaddress': f"{username}@example.com", 'active': True}],
+               'AssignedTo': None}
+
+# The old way: every duty gets its own User objects and enum/datetime fields
+def _build_dict_model(stored, Priority, Status):
+    duties = []
+    for data in stored:
+        assignees = [_DictUser(user['username'], user['password'], user['emailaddress']) for user in data['Assignees']]
+        duty = _DictDuty(data['ID'], data['Title'], data['Detail'], assignees)
+        duty._ST = datetime.fromisoformat(data['StartTime'])
+        duty._FT = datetime.fromisoformat(data['FinishTime'])
+        duty._Priority = Priority(data['Priority'])
+        duty._Status = Status(data['Status'])
+        duties.append(duty)
+    return duties
+
+def _build_slotted_model(stored, Duty):
+    return [Duty.from_dict(data) for data in stored]
+
+def _measure(build):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    model = build()
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del model
+    return current, peak, elapsed
+
+def main():
+    sys.path.insert(0, ROOT)
+    parser = argparse.ArgumentParser(description='Memory footprint of the duty object model.')
+    parser.add_argument('--duties', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=50, help='Distinct assignees shared by the duties')
+    args = parser.parse_args()
+
+    import core as app
+
+    results = [
+        ('dict model', _measure(lambda: _build_dict_model(_stored_duties(args.duties, args.users), app.Priority, app.Status))),
+        ('slotted model', _measure(lambda: _build_slotted_model(_stored_duties(args.duties, args.users), app.Duty))),
+    ]
+    print(f"{args.duties} duties, {args.users} users")
+    for name, (current, peak, elapsed) in results:
+        print(f"{name:>14}: {current / 1024 / 1024:8.1f} MiB retained, {peak / 1024 / 1024:8.1f} MiB peak, "
+              f"{current / args.duties:6.0f} B/duty, {elapsed:.2f}s")
+    print(f"retained memory reduced by {1 - results[1][1][0] / results[0][1][0]:.0%}")
+
+if __name__ == '__main__':
+    main()
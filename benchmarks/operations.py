@@ -0,0 +1,177 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+# Latency and memory of the public operations in main.py across data sizes.
+# Every tier is generated once with benchmarks.generate; every operation then
+# runs in a fresh process on its own copy of that data, so the peak RSS
+# reported for it is its own. Results are saved as JSON; pass an earlier
+# results file to --compare to see the change.
+#
+#   python -m benchmarks.operations --tiers small,medium --ops 100 --output results.json
+#   python -m benchmarks.operations --tiers small --compare results.json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# users, projects, members per project, duties per project
+TIERS = {
+    'small': (100, 10, 5, 20),
+    'medium': (1000, 100, 10, 100),
+    'large': (10000, 1000, 20, 100),
+}
+
+# Each operation picks its arguments (untimed) and returns the call to time
+def _create_an_account(main, rng, number, counts):
+    return main.create_an_account, (f"bench{number}", f"bench{number}@example.com", "benchmark"), {}
+
+def _login_user(main, rng, number, counts):
+    from benchmarks.generate import password_of
+    user = rng.randrange(counts['users'])
+    return main.login_user, (f"user{user}", password_of(user)), {}
+
+def _random_duty(main, rng, counts):
+    project = main.get_repository().get_project(f"project{rng.randrange(counts['projects'])}")
+    return project, rng.choice(project['Duties'])
+
+def _create_duty_in_project(main, rng, number, counts):
+    project_id = f"project{rng.randrange(counts['projects'])}"
+    return main.create_duty_in_project, (project_id, f"bench-duty{number}", "Benchmark duty", "",
+                                         [f"user{rng.randrange(counts['users'])}"]), {}
+
+def _assign_duty_to_member(main, rng, number, counts):
+    project, duty = _random_duty(main, rng, counts)
+    return main.assign_duty_to_member, (project['ID'], duty['ID'], rng.choice(project['Members'])), {}
+
+def _update_duty_details(main, rng, number, counts):
+    project, duty = _random_duty(main, rng, counts)
+    user = main.User(main._username_of(duty['AssignedTo']), '', '')
+    return main.update_duty_details, (user, project['ID'], duty['ID']), {'status': rng.choice(list(main.Status))}
+
+def _list_user_projects(main, rng, number, counts):
+    return main.list_user_projects, (main.User(f"user{rng.randrange(counts['users'])}", '', ''),), {}
+
+def _list_projects(main, rng, number, counts):
+    return main.list_projects, (), {'page': 1}
+
+def _list_users(main, rng, number, counts):
+    return main.list_users, (), {'page': 1}
+
+def _list_project_duties(main, rng, number, counts):
+    return main.list_project_duties, (f"project{rng.randrange(counts['projects'])}",), {'page': 1}
+
+def _print_board(main, rng, number, counts):
+    return main.print_board, (f"project{rng.randrange(counts['projects'])}",), {'page': 1, 'page_size': 10}
+
+def _print_board_summary(main, rng, number, counts):
+    return main.print_board_summary, (), {'page': 1}
+
+OPERATIONS = {
+    'create_an_account': _create_an_account,
+    'login_user': _login_user,
+    'create_duty_in_project': _create_duty_in_project,
+    'assign_duty_to_member': _assign_duty_to_member,
+    'update_duty_details': _update_duty_details,
+    'list_user_projects': _list_user_projects,
+    'list_projects': _list_projects,
+    'list_users': _list_users,
+    'list_project_duties': _list_project_duties,
+    'print_board': _print_board,
+    'print_board_summary': _print_board_summary,
+}
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def _worker(data_dir, operation, ops, counts, results):
+    sys.path.insert(0, ROOT)
+    os.chdir(data_dir)
+    import main
+    rng = random.Random(0)
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for number in range(ops):
+            call, args, kwargs = OPERATIONS[operation](main, rng, number, counts)
+            started = time.perf_counter()
+            call(*args, **kwargs)
+            timings.append(time.perf_counter() - started)
+    first = timings[0]
+    timings.sort()
+    results.put({
+        'ops': ops,
+        'first_ms': first * 1000,
+        'p50_ms': _percentile(timings, 0.50) * 1000,
+        'p95_ms': _percentile(timings, 0.95) * 1000,
+        'max_ms': timings[-1] * 1000,
+        # kilobytes on Linux
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+
+def _run_operation(tier_dir, operation, ops, counts):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    with tempfile.TemporaryDirectory() as run_dir:
+        data_dir = os.path.join(run_dir, 'data')
+        shutil.copytree(tier_dir, data_dir)
+        process = context.Process(target=_worker, args=(data_dir, operation, ops, counts, results))
+        process.start()
+        result = results.get()
+        process.join()
+    return result
+
+def _compare(results, previous_file):
+    with open(previous_file) as file:
+        previous = {(r['tier'], r['operation']): r for r in json.load(file)['results']}
+    print(f"\nCompared with {previous_file}:")
+    for result in results:
+        before = previous.get((result['tier'], result['operation']))
+        if before is None:
+            continue
+        print(f"{result['tier']:>8} {result['operation']:24} p50 x{result['p50_ms'] / before['p50_ms']:5.2f}  "
+              f"p95 x{result['p95_ms'] / before['p95_ms']:5.2f}  "
+              f"rss x{result['peak_rss_kb'] / before['peak_rss_kb']:5.2f}")
+
+def main():
+    sys.path.insert(0, ROOT)
+    parser = argparse.ArgumentParser(description='Time the main.py operations on generated data.')
+    parser.add_argument('--tiers', default='small,medium', help=f"Comma separated, from {', '.join(TIERS)}")
+    parser.add_argument('--operations', default=','.join(OPERATIONS), help='Comma separated operation names')
+    parser.add_argument('--ops', type=int, default=100, help='Calls per operation')
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to save the results')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    from benchmarks.generate import generate
+    import config
+
+    results = []
+    for tier in args.tiers.split(','):
+        with tempfile.TemporaryDirectory() as tier_dir:
+            counts = generate(tier_dir, *TIERS[tier])
+            print(f"{tier}: {counts['users']} users, {counts['projects']} projects, "
+                  f"{counts['members']} members and {counts['duties']} duties per project")
+            for operation in args.operations.split(','):
+                result = _run_operation(tier_dir, operation, args.ops, counts)
+                result.update(tier=tier, operation=operation)
+                results.append(result)
+                print(f"{tier:>8} {operation:24} p50 {result['p50_ms']:9.3f} ms  p95 {result['p95_ms']:9.3f} ms  "
+                      f"first {result['first_ms']:9.3f} ms  peak RSS {result['peak_rss_kb'] / 1024:7.1f} MiB")
+
+    with open(args.output, 'w') as file:
+        json.dump({'backend': config.STORAGE_BACKEND, 'python': platform.python_version(),
+                   'created': time.strftime("%Y-%m-%d %H:%M:%S"), 'ops': args.ops, 'results': results}, file, indent=4)
+    print(f"Saved results to {args.output}.")
+    if args.compare:
+        _compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
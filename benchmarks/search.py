@@ -0,0 +1,113 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Full-text search over generated duties whose titles and details are drawn
+# from a vocabulary of random words. Times loading the JSON repository with
+# and without the saved search index, then searches for whole words,
+# prefixes and two-word queries, against a scan of every duty for the same
+# words (what finding a duty took before the index).
+#
+#   python -m benchmarks.search --projects 1000 --duties 1000 --queries 200
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _vocabulary(rng, size):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return sorted({''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)})
+
+def _projects(rng, words, projects, duties):
+    from benchmarks.generate import make_projects
+    for project in make_projects(10, projects, 3, duties):
+        project['Title'] = ' '.join(rng.choices(words, k=2))
+        for duty in project['Duties']:
+            duty['Title'] = ' '.join(rng.choices(words, k=rng.randint(2, 5)))
+            duty['Detail'] = ' '.join(rng.choices(words, k=rng.randint(5, 20)))
+        yield project
+
+def _queries(rng, words, count):
+    queries = []
+    for number in range(count):
+        kind = number % 3
+        if kind == 0:
+            queries.append(rng.choice(words))
+        elif kind == 1:
+            queries.append(rng.choice(words)[:3])
+        else:
+            queries.append(' '.join(rng.sample(words, 2)))
+    return queries
+
+def _scan(projects, query, limit):
+    terms = query.lower().split()
+    found = []
+    for project in projects:
+        for duty in project['Duties']:
+            text = f"{duty['Title']} {duty['Detail']}".lower()
+            if all(term in text for term in terms):
+                found.append((project['ID'], duty['ID']))
+                if len(found) == limit:
+                    return found
+    return found
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+def _summary(timings):
+    timings = sorted(timings)
+    return (f"p50 {statistics.median(timings) * 1000:9.3f} ms  "
+            f"p95 {timings[int(0.95 * (len(timings) - 1))] * 1000:9.3f} ms  max {timings[-1] * 1000:9.3f} ms")
+
+def main():
+    sys.path.insert(0, ROOT)
+    parser = argparse.ArgumentParser(description='Search index against scanning every duty.')
+    parser.add_argument('--projects', type=int, default=1000)
+    parser.add_argument('--duties', type=int, default=100, help='Duties per project')
+    parser.add_argument('--words', type=int, default=20000, help='Vocabulary size')
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--scans', type=int, default=10, help='Queries also answered by scanning')
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    import config
+    config.STORAGE_BACKEND = 'json'
+    import storage
+
+    rng = random.Random(0)
+    words = _vocabulary(rng, args.words)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.chdir(data_dir)
+        try:
+            storage.SaveProjects(list(_projects(rng, words, args.projects, args.duties)))
+            print(f"{args.projects * args.duties} duties in {args.projects} projects, "
+                  f"{os.path.getsize('projects.json') / 2 ** 20:.0f} MiB")
+
+            built, repo = _timed(lambda: (lambda r: (r.refresh(), r)[1])(storage.Repository()))
+            print(f"load, building the index:    {built:8.2f} s")
+            compacted, _ = _timed(repo.compact)
+            print(f"compact, saving the index:   {compacted:8.2f} s  "
+                  f"({os.path.getsize(storage.search_path('projects.json')) / 2 ** 20:.0f} MiB)")
+            loaded, repo = _timed(lambda: (lambda r: (r.refresh(), r)[1])(storage.Repository()))
+            print(f"load, reading the index:     {loaded:8.2f} s")
+
+            queries = _queries(rng, words, args.queries)
+            timings = {}
+            for number, query in enumerate(queries):
+                elapsed, _ = _timed(repo.search, query, args.limit)
+                timings.setdefault(('word', 'prefix', 'two words')[number % 3], []).append(elapsed)
+            for kind, kind_timings in timings.items():
+                print(f"search, {kind:10}  {_summary(kind_timings)}")
+            projects = repo.get_projects()
+            scans = [_timed(_scan, projects, query, args.limit)[0] for query in queries[:args.scans]]
+            print(f"scan,   mixed       {_summary(scans)}")
+        finally:
+            os.chdir(cwd)
+
+if __name__ == '__main__':
+    main()
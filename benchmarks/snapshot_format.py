@@ -0,0 +1,61 @@
+import argparse
+import gc
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Cold load of a projects snapshot in the JSON format against the binary one
+# (see snapshot_codec.py), at several sizes: file size, the time to write it
+# and the median time of storage.load_json_projects() over --runs loads.
+# Each size is generated, written and loaded in turn, so only one copy of
+# the data is in memory at a time.
+#
+#   python -m benchmarks.snapshot_format --sizes 10000,100000,1000000
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _load_time(storage, path, runs):
+    timings = []
+    for _ in range(runs):
+        gc.collect()
+        started = time.perf_counter()
+        projects = storage.load_json_projects(path)
+        timings.append(time.perf_counter() - started)
+        del projects
+    return statistics.median(timings)
+
+def main():
+    sys.path.insert(0, ROOT)
+    parser = argparse.ArgumentParser(description='JSON against binary snapshots.')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='Numbers of duties, comma separated')
+    parser.add_argument('--duties', type=int, default=1000, help='Duties per project')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    import config
+    import storage
+    from benchmarks.generate import make_projects
+
+    print(f"{'duties':>9} {'format':7} {'size MiB':>9} {'write s':>8} {'load s':>8}")
+    with tempfile.TemporaryDirectory() as data_dir:
+        for size in (int(size) for size in args.sizes.split(',')):
+            results = {}
+            for snapshot_format in ('json', 'binary'):
+                path = os.path.join(data_dir, f"projects-{snapshot_format}.json")
+                config.SNAPSHOT_FORMAT = snapshot_format
+                projects = list(make_projects(1000, max(1, size // args.duties), 5, min(size, args.duties)))
+                started = time.perf_counter()
+                storage.save_json_projects(projects, path)
+                written = time.perf_counter() - started
+                del projects
+                loaded = _load_time(storage, path, args.runs)
+                results[snapshot_format] = (os.path.getsize(path), loaded)
+                print(f"{size:9} {snapshot_format:7} {os.path.getsize(path) / 2 ** 20:9.1f} {written:8.2f} {loaded:8.2f}")
+                os.remove(path)
+            (json_size, json_load), (binary_size, binary_load) = results['json'], results['binary']
+            print(f"{'':9} binary is {json_size / binary_size:.1f}x smaller and loads {json_load / binary_load:.1f}x faster")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Cold-start time of the one-shot entry points. Every target runs in fresh
+# interpreters; the time reported is the median over --runs minus that of a
+# bare interpreter, followed by the slowest imports from python -X importtime.
+# Exits with status 1 when a target is over its budget, or when importing
+# core (which scripts and manager.py use) pulls in rich or logging, which
+# are only meant to load once something is printed or logged.
+#
+#   python -m benchmarks.startup --runs 20 --budget-ms 150
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> interpreter arguments
+TARGETS = {
+    'import core': ['-c', 'import core'],
+    'import main': ['-c', 'import main'],
+    'manager.py --help': [os.path.join(ROOT, 'manager.py'), '--help'],
+}
+
+# Modules importing core must not load
+DEFERRED_MODULES = ('rich', 'logging', 'sqlite3', 'cProfile')
+
+def _run(arguments, extra=()):
+    return subprocess.run([sys.executable, *extra, *arguments], cwd=ROOT, check=True,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+def _median_ms(arguments, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        _run(arguments)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+# (cumulative microseconds, module) of the slowest imports
+def _slowest_imports(arguments, count):
+    imports = []
+    for line in _run(arguments, ['-X', 'importtime']).stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), name.rstrip()))
+    imports.sort(reverse=True)
+    return imports[:count]
+
+def _deferred_modules_loaded():
+    code = f"import sys, core; print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True, text=True)
+    return [module for module in result.stdout.strip().split(',') if module]
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure interpreter startup of the entry points.')
+    parser.add_argument('--runs', type=int, default=10, help='Fresh interpreters per target')
+    parser.add_argument('--budget-ms', type=float, default=150.0, help='Allowed startup on top of a bare interpreter')
+    parser.add_argument('--top', type=int, default=8, help='Slowest imports to list per target')
+    args = parser.parse_args()
+
+    baseline = _median_ms(['-c', 'pass'], args.runs)
+    print(f"bare interpreter: {baseline:.1f} ms")
+    over_budget = []
+    for name, arguments in TARGETS.items():
+        startup = _median_ms(arguments, args.runs) - baseline
+        print(f"\n{name}: {startup:.1f} ms" + ("  OVER BUDGET" if startup > args.budget_ms else ""))
+        if startup > args.budget_ms:
+            over_budget.append(name)
+        for cumulative, module in _slowest_imports(arguments, args.top):
+            print(f"    {cumulative / 1000:8.1f} ms  {module}")
+
+    loaded = _deferred_modules_loaded()
+    if loaded:
+        print(f"\nimport core loaded {', '.join(loaded)}, which should only be imported when used.")
+    if over_budget or loaded:
+        sys.exit(1)
+    print(f"\nAll entry points start within {args.budget_ms:.0f} ms.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# Multi-process stress test for the storage backends. Several processes
+# create duties at the same time, first all in one shared project and then
+# each in its own project, and afterwards every duty is looked for in the
+# stored data.
+#
+#   python -m benchmarks.stress_locking --processes 8 --ops 200
+#   TRELLOMIZE_STORAGE_BACKEND=sharded python -m benchmarks.stress_locking
+#   TRELLOMIZE_STORAGE_BACKEND=sqlite python -m benchmarks.stress_locking
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _worker(data_dir, worker, ops, project_ids, ready):
+    sys.path.insert(0, ROOT)
+    os.chdir(data_dir)
+    import core
+    # start timing only once every process has paid its import cost
+    ready.wait()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for op in range(ops):
+            project_id = project_ids[op % len(project_ids)]
+            core.create_duty_in_project(project_id, f"w{worker}-d{op}", f"Duty {op}", f"from worker {worker}", [])
+
+def _run(data_dir, processes, ops, shared):
+    import storage
+    os.chdir(data_dir)
+    # the backend the workers write to, chosen the same way
+    storage._repository = None
+    repo = storage.get_repository()
+    repo.add_user({'username': 'leader', 'emailaddress': 'leader@example.com', 'password': ''})
+    project_sets = []
+    for worker in range(processes):
+        project_id = 'shared' if shared else f"p{worker}"
+        if repo.get_project(project_id) is None:
+            repo.add_project({'ID': project_id, 'Title': project_id, 'Leader': 'leader',
+                              'Members': ['leader'], 'Duties': []})
+        project_sets.append([project_id])
+
+    context = multiprocessing.get_context('spawn')
+    ready = context.Barrier(processes + 1)
+    workers = [context.Process(target=_worker, args=(data_dir, worker, ops, project_sets[worker], ready))
+               for worker in range(processes)]
+    for process in workers:
+        process.start()
+    ready.wait()
+    started = time.perf_counter()
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    duty_ids = [duty['ID'] for project in storage.LoadProjects() for duty in project['Duties']]
+    expected = {f"w{worker}-d{op}" for worker in range(processes) for op in range(ops)}
+    lost = len(expected - set(duty_ids))
+    duplicated = len(duty_ids) - len(set(duty_ids))
+    # the log is only created once something is logged
+    lines = ''
+    if os.path.exists('project_log.log'):
+        with open('project_log.log') as log:
+            lines = log.read()
+    return elapsed, lost, duplicated, lines.count('Retrying'), lines.count('gave up')
+
+def main():
+    sys.path.insert(0, ROOT)
+    parser = argparse.ArgumentParser(description='Concurrent writers against the storage.')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=200, help='Duties created by each process')
+    args = parser.parse_args()
+
+    total = args.processes * args.ops
+    failed = False
+    for shared in (True, False):
+        with tempfile.TemporaryDirectory() as data_dir:
+            cwd = os.getcwd()
+            try:
+                elapsed, lost, duplicated, retries, gave_up = _run(data_dir, args.processes, args.ops, shared)
+            finally:
+                os.chdir(cwd)
+        layout = 'one shared project' if shared else 'one project per process'
+        print(f"{layout:24} {args.processes} processes x {args.ops} ops: "
+              f"{total / elapsed:8.0f} ops/s, {retries} conflicts retried, {gave_up} gave up, "
+              f"{lost} lost, {duplicated} duplicated")
+        # a duty whose operation gave up was never acknowledged, so it is not a lost update
+        failed = failed or lost > gave_up or duplicated
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
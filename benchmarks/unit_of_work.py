@@ -0,0 +1,75 @@
+import argparse
+import contextlib
+import glob
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# What a change through core.UnitOfWork writes: the bytes the data files grow
+# by and the time taken, for changing one field of a duty, for changing
+# nothing (assigning a duty to whoever it is already assigned to) and, for
+# scale, for saving the whole projects file, which is what a change that
+# rebuilds the project list writes.
+#
+#   python -m benchmarks.unit_of_work --projects 100 --duties 1000 --changes 200
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _data_size():
+    return sum(os.path.getsize(path) for path in glob.glob('*') if os.path.isfile(path) and not path.endswith('.log'))
+
+def _measure(change, calls):
+    size = _data_size()
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for args in calls:
+            started = time.perf_counter()
+            change(*args)
+            timings.append(time.perf_counter() - started)
+    return (_data_size() - size) / len(calls), statistics.median(timings)
+
+def main():
+    sys.path.insert(0, ROOT)
+    parser = argparse.ArgumentParser(description='Bytes written per change through the unit of work.')
+    parser.add_argument('--projects', type=int, default=100)
+    parser.add_argument('--duties', type=int, default=1000, help='Duties per project')
+    parser.add_argument('--changes', type=int, default=200)
+    args = parser.parse_args()
+
+    import config
+    config.STORAGE_BACKEND = 'json'
+    # keep the changed duties where they are
+    config.ARCHIVE_ON_SAVE = 0
+    import core
+    import storage
+    from benchmarks.generate import generate
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.chdir(data_dir)
+        try:
+            generate('.', 1000, args.projects, 5, args.duties)
+            repo = storage.get_repository()
+            duties = [(project['ID'], duty['ID'], core._username_of(duty.get('AssignedTo')))
+                      for project in repo.get_projects()[:args.changes] for duty in project['Duties'][:1]]
+            duties = [duty for duty in duties if duty[2]]
+
+            def update(project_id, duty_id, username):
+                core.update_duty_details(core.User(username, '', ''), project_id, duty_id, detail=f"{duty_id} {time.time()}")
+
+            written, elapsed = _measure(update, duties)
+            print(f"change one field {written:12.0f} B/change  p50 {elapsed * 1000:8.2f} ms")
+            written, elapsed = _measure(core.assign_duty_to_member, duties)
+            print(f"change nothing   {written:12.0f} B/change  p50 {elapsed * 1000:8.2f} ms")
+            started = time.perf_counter()
+            storage.save_json_projects(repo.get_projects())
+            print(f"save everything  {os.path.getsize('projects.json'):12.0f} B/change  "
+                  f"    {(time.perf_counter() - started) * 1000:8.2f} ms")
+        finally:
+            os.chdir(cwd)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import os
+
+# Storage and display settings. Each one can be overridden with an environment variable
+# of the same name prefixed with TRELLOMIZE_.
+
+def _setting(name, default):
+    value = os.environ.get(f"TRELLOMIZE_{name}")
+    if value is None:
+        return default
+    return type(default)(value)
+
+# Storage engine: 'json' (users.json / projects.json plus journals),
+# 'sharded' (users.json plus one file per project in PROJECTS_DIR, see
+# manager.py shard-projects) or 'sqlite' (tables in DATABASE_PATH, see
+# manager.py migrate-sqlite).
+STORAGE_BACKEND = _setting('STORAGE_BACKEND', 'json')
+DATABASE_PATH = _setting('DATABASE_PATH', 'trellomize.db')
+PROJECTS_DIR = _setting('PROJECTS_DIR', 'projects')
+
+# Format of the snapshots the json and sharded storage write: 'json' or
+# 'binary' (see snapshot_codec.py, and manager.py export-binary and
+# import-binary). Snapshots in either format are read.
+SNAPSHOT_FORMAT = _setting('SNAPSHOT_FORMAT', 'json')
+
+# How many project journals the sharded storage keeps open for appending
+SHARD_JOURNALS_OPEN = _setting('SHARD_JOURNALS_OPEN', 64)
+
+# How many times an operation is re-run when another process changed the
+# same project (or created the same account) while it was running.
+CONFLICT_RETRIES = _setting('CONFLICT_RETRIES', 10)
+
+# The journal is fsynced after this many appended records, or when the last
+# fsync is older than JOURNAL_FSYNC_INTERVAL seconds, whichever comes first.
+JOURNAL_FSYNC_EVERY = _setting('JOURNAL_FSYNC_EVERY', 32)
+JOURNAL_FSYNC_INTERVAL = _setting('JOURNAL_FSYNC_INTERVAL', 1.0)
+
+# A journal is compacted into its snapshot once it is bigger than the
+# snapshot itself (and at least this many bytes), so replay on startup never
+# costs more than reading the data twice.
+JOURNAL_COMPACT_MIN_BYTES = _setting('JOURNAL_COMPACT_MIN_BYTES', 64 * 1024)
+
+# Rows per table page in the project, user and duty listings
+PAGE_SIZE = _setting('PAGE_SIZE', 50)
+
+# The change history (see history.py) stores the whole duty or project again
+# after this many changes to it, so showing it as of some time never replays
+# more changes than that
+HISTORY_CHECKPOINT_EVERY = _setting('HISTORY_CHECKPOINT_EVERY', 20)
+
+# Hot/cold tiering (see archive.py): ARCHIVED duties, and DONE duties that
+# finished more than ARCHIVE_DONE_AFTER seconds ago, are moved out of their
+# project into compressed segments in ARCHIVE_DIR (a table with the sqlite
+# storage) by manager.py archive, and with ARCHIVE_ON_SAVE (0 to turn it
+# off) also whenever a duty of the project changes.
+ARCHIVE_DIR = _setting('ARCHIVE_DIR', 'archive')
+ARCHIVE_DONE_AFTER = _setting('ARCHIVE_DONE_AFTER', 30 * 24 * 3600)
+ARCHIVE_ON_SAVE = _setting('ARCHIVE_ON_SAVE', 1)
+
+# How many of the best matches a search shows
+SEARCH_LIMIT = _setting('SEARCH_LIMIT', 20)
+
+# Operation timings (see instrumentation.py) are merged into STATS_PATH at
+# most every STATS_FLUSH_INTERVAL seconds and when the process exits. With
+# PROFILE_DIR set, every operation leaves a cProfile dump there.
+STATS_PATH = _setting('STATS_PATH', 'stats.json')
+STATS_FLUSH_INTERVAL = _setting('STATS_FLUSH_INTERVAL', 10.0)
+PROFILE_DIR = _setting('PROFILE_DIR', '')
+
+# The application log (see applog.py): JSON lines in LOG_PATH, rolled over
+# to LOG_BACKUPS numbered files at LOG_MAX_BYTES, so it never takes more than
+# about LOG_MAX_BYTES * (LOG_BACKUPS + 1) of disk. Records are written in
+# batches of up to LOG_BATCH_SIZE, at least every LOG_FLUSH_INTERVAL seconds;
+# when more than LOG_QUEUE_SIZE are waiting, new ones are dropped.
+LOG_PATH = _setting('LOG_PATH', 'project_log.log')
+LOG_LEVEL = _setting('LOG_LEVEL', 'INFO')
+LOG_MAX_BYTES = _setting('LOG_MAX_BYTES', 10 * 1024 * 1024)
+LOG_BACKUPS = _setting('LOG_BACKUPS', 5)
+LOG_BATCH_SIZE = _setting('LOG_BATCH_SIZE', 256)
+LOG_FLUSH_INTERVAL = _setting('LOG_FLUSH_INTERVAL', 1.0)
+LOG_QUEUE_SIZE = _setting('LOG_QUEUE_SIZE', 10000)
+
+# manager.py scheduler: reminders (JSON lines) go to OUTBOX_PATH when an
+# open duty is REMINDER_LEAD seconds from its finish time and again when it
+# is overdue. How far it got is kept in SCHEDULER_STATE_PATH; between
+# deadlines it checks for changed data every SCHEDULER_POLL_INTERVAL seconds.
+OUTBOX_PATH = _setting('OUTBOX_PATH', 'outbox.jsonl')
+SCHEDULER_STATE_PATH = _setting('SCHEDULER_STATE_PATH', 'scheduler.json')
+REMINDER_LEAD = _setting('REMINDER_LEAD', 3600)
+SCHEDULER_POLL_INTERVAL = _setting('SCHEDULER_POLL_INTERVAL', 30.0)
+
+# server.py: where it listens, how long a change waits for others to join
+# its commit (not with the sqlite storage, see server.Writer), and how often
+# the data is re-read when no changes come in
+SERVER_HOST = _setting('SERVER_HOST', '127.0.0.1')
+SERVER_PORT = _setting('SERVER_PORT', 8080)
+SERVER_COMMIT_DELAY = _setting('SERVER_COMMIT_DELAY', 0.005)
+SERVER_REFRESH_INTERVAL = _setting('SERVER_REFRESH_INTERVAL', 1.0)
@@ -0,0 +1,859 @@
+import functools
+import hashlib
+import random
+import re
+import time
+import weakref
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import List
+import config
+from applog import get_logger
+from history import set_actor
+from instrumentation import instrumented
+from locking import ConflictError
+from storage import find_user, get_repository
+
+# The models and the operations on the stored users and projects, without
+# the menus and tables of main.py, for scripts and commands that only need
+# the data. rich is only imported once something is printed.
+
+def get_console():
+    from rich import get_console as rich_console
+    return rich_console()
+
+# print() with rich markup, e.g. print("[green]Done.[/green]")
+def print(*objects, sep=' ', end='\n'):
+    get_console().print(*objects, sep=sep, end=end)
+
+def validate_email(email):
+    pattern = r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$"
+    if re.match(pattern, email):
+        return True
+    else:
+        return False
+
+# enum for Priority
+class Priority(Enum):
+    CRITICAL = "CRITICAL"
+    HIGH = "HIGH"
+    MEDIUM = "MEDIUM"
+    LOW = "LOW"
+
+# enum for Status
+class Status(Enum):
+    BACKLOG = "BACKLOG"
+    TODO = "TODO"
+    DOING = "DOING"
+    DONE = "DONE"
+    ARCHIVED = "ARCHIVED"
+
+class User:
+    # Users are held by every duty they are assigned to, so they are slotted
+    # and shared through intern_user() instead of copied per duty.
+    __slots__ = ('_username', '_password', '_emailaddress', '_active', '__weakref__')
+
+    def __init__(self, U, P, E):
+        self._username = U
+        self._password = P
+        self._emailaddress = E
+        self._active = True
+
+    def get_username(self):
+        return self._username
+
+    def get_password(self):
+        return self._password
+
+    def get_emailaddress(self):
+        return self._emailaddress
+
+    def is_active(self):
+        return self._active
+
+    def set_username(self, U):
+        self._username = U
+
+    def set_password(self, P):
+        self._password = P
+
+    def set_emailaddress(self, E):
+        self._emailaddress = E
+
+    def set_active(self, A):
+        self._active = A
+
+    def login(self, U, P):
+        return self._username == U and self._password == hashed_password(P)
+
+    def disable(self):
+        self._active = False
+
+    def to_dict(self):
+        return {
+            "username": self._username,
+            "password": self._password,
+            "emailaddress": self._emailaddress,
+            "active": self._active
+        }
+
+# One User object per username while anything still refers to it
+_interned_users = weakref.WeakValueDictionary()
+
+def intern_user(username, password='', emailaddress=''):
+    user = _interned_users.get(username)
+    if user is None:
+        user = User(username, password, emailaddress)
+        _interned_users[username] = user
+    else:
+        if password:
+            user.set_password(password)
+        if emailaddress:
+            user.set_emailaddress(emailaddress)
+    return user
+
+# Duties store Assignees and AssignedTo as usernames (older files hold
+# whole user dicts instead)
+def _username_of(user):
+    if isinstance(user, dict):
+        return user.get('username')
+    return user
+
+# The shared User for a stored reference, filled in from get_user (for
+# example Repository.get_user) when given
+def _user_ref(user, get_user=None):
+    username = _username_of(user)
+    if not username:
+        return None
+    stored = get_user(username) if get_user else None
+    if stored:
+        return intern_user(username, stored.get('password', ''), stored.get('emailaddress', ''))
+    return intern_user(username)
+
+# Stored duties use 'ST', 'StartTime' or 'Start Time' depending on which
+# function wrote them, either isoformat or "%Y-%m-%d %H:%M:%S".
+def _stored_time(data, *keys):
+    for key in keys:
+        if data.get(key):
+            return int(datetime.fromisoformat(data[key]).timestamp())
+    return None
+
+_PRIORITIES = tuple(Priority)
+_PRIORITY_CODES = {priority: code for code, priority in enumerate(_PRIORITIES)}
+_STATUSES = tuple(Status)
+_STATUS_CODES = {status: code for code, status in enumerate(_STATUSES)}
+
+class Duty:
+    # Priority and Status are kept as indexes into the enums and ST/FT as
+    # epoch seconds; the getters and setters still speak enums and datetimes.
+    __slots__ = ('_ID', '_Title', '_Detail', '_ST', '_FT', '_Priority', '_Status', '_Assignees', '_AssignedTo')
+
+    # A new duty starts now and finishes a day later unless st / ft (epoch
+    # seconds) say otherwise
+    def __init__(self, Id, title: str, detail: str, assignees: List[User], assigned_to: User = None, st=None, ft=None):
+        self._ID = Id
+        self._Title = title
+        self._Detail = detail
+        self._ST = st if st is not None else int(time.time())
+        self._FT = ft if ft is not None else self._ST + 24 * 3600
+        self._Priority = _PRIORITY_CODES[Priority.LOW]
+        self._Status = _STATUS_CODES[Status.BACKLOG]
+        self._Assignees = assignees
+        self._AssignedTo = assigned_to
+
+    @classmethod
+    def from_dict(cls, data, get_user=None):
+        assignees = [user for user in (_user_ref(a, get_user) for a in data.get('Assignees', [])) if user]
+        assigned_to = _user_ref(data.get('AssignedTo') or data.get('Assigned To'), get_user)
+        duty = cls(data['ID'], data.get('Title', ''), data.get('Detail', ''), assignees, assigned_to,
+                   _stored_time(data, 'ST', 'StartTime', 'Start Time'), _stored_time(data, 'FT', 'FinishTime', 'End Time'))
+        if data.get('Priority'):
+            duty.set_priority(Priority(data['Priority']))
+        if data.get('Status'):
+            duty.set_status(Status(data['Status']))
+        return duty
+
+    # Assignees are stored as usernames and resolved against the users on read
+    def to_dict(self):
+        return {
+            'ID': self._ID,
+            'Title': self._Title,
+            'Detail': self._Detail,
+            'StartTime': self.get_st().strftime("%Y-%m-%d %H:%M:%S"),
+            'FinishTime': self.get_ft().strftime("%Y-%m-%d %H:%M:%S"),
+            'Priority': self.get_priority().value,
+            'Status': self.get_status().value,
+            'Assignees': [assignee.get_username() for assignee in self._Assignees],
+            'AssignedTo': self._AssignedTo.get_username() if self._AssignedTo else None
+        }
+
+    def get_ID(self):
+        return self._ID
+
+    def get_title(self):
+        return self._Title
+
+    def get_detail(self):
+        return self._Detail
+
+    def get_st(self):
+        return datetime.fromtimestamp(self._ST)
+
+    def get_ft(self):
+        return datetime.fromtimestamp(self._FT)
+
+    def get_priority(self):
+        return _PRIORITIES[self._Priority]
+
+    def get_status(self):
+        return _STATUSES[self._Status]
+
+    def get_assignees(self):
+        return self._Assignees
+
+    def get_assigned_to(self):
+        return self._AssignedTo
+
+    def set_ID(self, Id):
+        self._ID = Id
+
+    def set_title(self, title):
+        self._Title = title
+
+    def set_detail(self, detail):
+        self._Detail = detail
+
+    def set_st(self, value: datetime):
+        self._ST = int(value.timestamp())
+
+    def set_ft(self, value: datetime):
+        self._FT = int(value.timestamp())
+
+    def set_priority(self, value: Priority):
+        self._Priority = _PRIORITY_CODES[value]
+
+    def set_status(self, value: Status):
+        self._Status = _STATUS_CODES[value]
+
+    def set_assignees(self, value: List[User]):
+        self._Assignees = value
+
+    def set_assigned_to(self, user: User):
+        self._AssignedTo = user
+
+    def add_assignee(self, user: User):
+        if user not in self._Assignees:
+            self._Assignees.append(user)
+
+    def delete_assignee(self, user: User):
+        if user in self._Assignees:
+            self._Assignees.remove(user)
+
+class Project:
+    __slots__ = ('_ID', '_Title', '_Leader', '_Members', '_Duties')
+
+    def __init__(self, Id, T, leader, members: List[User] = None, duties: List[Duty] = None):
+        self._ID = Id
+        self._Title = T
+        self._Leader = leader
+        self._Members = members if members is not None else []
+        self._Duties = duties if duties is not None else []
+
+    @classmethod
+    def from_dict(cls, data, get_user=None):
+        members = [user for user in (_user_ref(m, get_user) for m in data.get('Members', [])) if user]
+        duties = [Duty.from_dict(duty, get_user) for duty in data.get('Duties', [])]
+        return cls(data['ID'], data.get('Title', ''), data.get('Leader'), members, duties)
+
+    def get_id(self):
+        return self._ID
+
+    def get_T(self):
+        return self._Title
+
+    def get_leader(self):
+        return self._Leader
+
+    def get_members(self):
+        return self._Members
+
+    def get_duties(self):
+        return self._Duties
+
+    def set_ID(self, Id):
+        self._ID = Id
+
+    def set_Title(self, T):
+        self._Title = T
+
+    def set_Leader(self, leader):
+        self._Leader = leader
+
+    def set_Members(self, members: List[User]):
+        self._Members = members
+
+    def set_duties(self, duties: List[Duty]):
+        self._Duties = duties
+
+    def add_duty(self, Id, title: str, detail: str, assignees: List[User]):
+        new_duty = Duty(Id, title, detail, assignees)
+        self._Duties.append(new_duty)
+        get_logger().info(f"Duty '{title}' added to project '{self._Title}'.", extra={'project_id': self._ID, 'duty_id': Id})
+        return new_duty
+
+    def add_member(self, user: User):
+        if user not in self._Members:
+            self._Members.append(user)
+            get_logger().info(f"User '{user.get_username()}' added to project '{self._Title}'.", extra={'project_id': self._ID, 'username': user.get_username()})
+
+    def remove_member(self, user: User):
+        if user in self._Members:
+            self._Members.remove(user)
+        get_logger().info(f"User '{user.get_username()}' removed from project '{self._Title}'.", extra={'project_id': self._ID, 'username': user.get_username()})
+
+    def delete_project(self):
+        get_logger().info(f"Project '{self._Title}' deleted.", extra={'project_id': self._ID})
+        pass
+
+    def assign_duty(self, duty_id, username):
+        for duty in self._Duties:
+            if duty.get_ID() == duty_id:
+                assignee = next((member for member in self._Members if member.get_username() == username), None)
+                if assignee:
+                    duty.set_assigned_to(assignee)
+                    get_logger().info(f"Duty '{duty.get_title()}' assigned to '{username}' in project '{self._Title}'.", extra={'project_id': self._ID, 'duty_id': duty_id, 'username': username})
+                    print(f"[green]Duty '{duty.get_title()}' assigned to '{username}' successfully.[/green]")
+                else:
+                    get_logger().error(f"Error! User '{username}' is not a member of the project '{self._Title}'.", extra={'project_id': self._ID, 'duty_id': duty_id, 'username': username})
+                    print(f"[red]Error! User '{username}' is not a member of this project.[/red]")
+                return
+        get_logger().error(f"Error! Duty with ID '{duty_id}' not found in project '{self._Title}'.", extra={'project_id': self._ID, 'duty_id': duty_id})
+        print(f"[red]Error! Duty with ID '{duty_id}' not found.[/red]")
+
+    def unassign_duty(self, duty_id):
+        for duty in self._Duties:
+            if duty.get_ID() == duty_id:
+                duty.set_assigned_to(None)
+                get_logger().info(f"Duty '{duty.get_title()}' unassigned in project '{self._Title}'.", extra={'project_id': self._ID, 'duty_id': duty_id})
+                print(f"[green]Duty '{duty.get_title()}' unassigned successfully.[/green]")
+                return
+        get_logger().error(f"Error! Duty with ID '{duty_id}' not found in project '{self._Title}'.", extra={'project_id': self._ID, 'duty_id': duty_id})
+        print(f"[red]Error! Duty with ID '{duty_id}' not found.[/red]")
+
+    def print_duties(self):
+        from rich.table import Table
+        table = Table(title="Project Duties")
+
+        table.add_column("ID", justify="center", style="cyan", no_wrap=True)
+        table.add_column("Title", style="magenta")
+        table.add_column("Detail", style="green")
+        table.add_column("Start Time", justify="center", style="yellow")
+        table.add_column("Status", justify="center", style="red")
+
+        for duty in self._Duties:
+            table.add_row(
+                duty.get_ID(),
+                duty.get_title(),
+                duty.get_detail(),
+                duty.get_st().strftime("%Y-%m-%d %H:%M:%S"),
+                duty.get_status().value
+            )
+
+        get_console().print(table)
+
+# Re-runs an operation whose commit lost a race with another process. Each
+# attempt starts from get_repository() again, so it re-validates against the
+# data the other process wrote.
+def retry_on_conflict(operation):
+    @functools.wraps(operation)
+    def wrapper(*args, **kwargs):
+        for attempt in range(config.CONFLICT_RETRIES):
+            try:
+                return operation(*args, **kwargs)
+            except ConflictError as error:
+                get_logger().warning(f"{error} Retrying {operation.__name__} ({attempt + 1}/{config.CONFLICT_RETRIES}).", extra={'operation': operation.__name__})
+                # randomized exponential backoff, so the racing processes spread out
+                time.sleep(random.uniform(0, min(0.2, 0.002 * 2 ** attempt)))
+        print("[red]Error! The data was changed by someone else too many times, please try again.[/red]")
+        get_logger().error(f"Error! {operation.__name__} gave up after {config.CONFLICT_RETRIES} conflicts.", extra={'operation': operation.__name__})
+    return wrapper
+
+# A duty's fields as the duty-field records store them
+def _duty_fields(duty):
+    assigned_to = duty.get_assigned_to()
+    return {
+        'Title': duty.get_title(),
+        'Detail': duty.get_detail(),
+        'ST': duty.get_st().isoformat(),
+        'FT': duty.get_ft().isoformat(),
+        'Priority': duty.get_priority().value,
+        'Status': duty.get_status().value,
+        'Assignees': [assignee.get_username() for assignee in duty.get_assignees()],
+        'AssignedTo': assigned_to.get_username() if assigned_to else None
+    }
+
+# Loads duties as Duty objects and on commit() writes only the fields that
+# differ from what was loaded, so a duty that was not changed, or was set to
+# what it already held, writes nothing. What was loaded is kept here, per
+# unit of work, not on the (shared) objects.
+#
+# Each changed duty is written as one record through the repository, so
+# commit() is not atomic across duties: when one loses a race
+# (ConflictError), the ones before it are already written. Run it under
+# retry_on_conflict; the next attempt loads those as they now are and finds
+# them unchanged.
+#
+# Only duties are loaded through it. Members join and leave a project one
+# at a time, each change already a single record naming the member, and
+# nothing changes a project's title or leader, or an account, once it is
+# created, so there is nothing of theirs to track.
+class UnitOfWork:
+    def __init__(self, repo=None):
+        self._repo = repo if repo is not None else get_repository()
+        # (project ID, duty ID) -> [Duty, its fields as loaded or last
+        # committed, whether it is stored under the older 'Assigned To']
+        self._duties = {}
+
+    def duty(self, project_id, duty_id):
+        key = (project_id, duty_id)
+        if key not in self._duties:
+            stored = self._repo.get_duty(project_id, duty_id)
+            if stored is None:
+                return None
+            duty = Duty.from_dict(stored)
+            self._duties[key] = [duty, _duty_fields(duty), 'Assigned To' in stored]
+        return self._duties[key][0]
+
+    def _write(self, project_id, duty_id, fields, older_key):
+        if list(fields) == ['AssignedTo']:
+            write = self._repo.assign_duty if fields['AssignedTo'] else self._repo.unassign_duty
+        else:
+            write = self._repo.update_duty
+        if 'AssignedTo' in fields and older_key:
+            # readers look at 'AssignedTo' first but fall back to the older key
+            fields['Assigned To'] = fields['AssignedTo']
+        write(project_id, duty_id, fields)
+
+    # Writes the changed duties and returns how many there were
+    def commit(self):
+        changed = []
+        for (project_id, duty_id), entry in self._duties.items():
+            duty, loaded, older_key = entry
+            if duty.get_ID() != duty_id:
+                raise ValueError(f"The ID of duty '{duty_id}' cannot be changed.")
+            now = _duty_fields(duty)
+            fields = {field: value for field, value in now.items() if loaded[field] != value}
+            if fields:
+                changed.append((project_id, duty_id, fields, older_key, entry, now))
+        for project_id, duty_id, fields, older_key, entry, now in changed:
+            self._write(project_id, duty_id, fields, older_key)
+            entry[1] = now
+        return len(changed)
+
+def hashed_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+@instrumented
+@retry_on_conflict
+def create_an_account(username, emailaddress, password):
+    repo = get_repository()
+    if repo.get_user(username) or repo.get_user_by_email(emailaddress):
+        print("[red]Error! Username or email already exists.[/red]")
+        return
+
+    new_user = {'username': username, 'emailaddress': emailaddress, 'password': hashed_password(password)}
+    repo.add_user(new_user)
+    print("[green]Account created successfully![/green]")
+    get_logger().info(f"Account created for user '{username}'.", extra={'username': username})
+
+@instrumented
+def login_user(username, password):
+    user = find_user(username)
+    if user:
+        if hashed_password(password) == user['password']:
+            print("[green]Login successful[/green]")
+            # the changes made from now on are recorded as made by this user
+            set_actor(user['username'])
+            return intern_user(user['username'], user['password'], user['emailaddress'])
+        else:
+            print("[red]Error! Invalid password[/red]")
+            return None
+    print("[red]Error! Invalid username or password.[/red]")
+    return None
+
+@instrumented
+@retry_on_conflict
+def create_project(ID, Title,username):
+    repo = get_repository()
+    if repo.get_project(ID):
+        print("[red]Error! Project ID already exists.[/red]")
+        return
+    if repo.get_user(username):
+        new_project = {'ID': ID, 'Title': Title, 'Leader': username, 'Members': [username], 'Duties': []}
+        repo.add_project(new_project)
+        print("[green]Project created successfully![/green]")
+        return
+
+    print("[red]Error! Leader not found.[/red]")
+
+@instrumented
+@retry_on_conflict
+def create_a_new_project(title, leader):
+    repo = get_repository()
+
+    project_id = str(repo.get_project_count() + 1)
+    leader_obj = repo.get_user(leader)
+    if not leader_obj:
+        print("[red]Error! Leader username not found.[/red]")
+        get_logger().error(f"Error! Leader username '{leader}' not found.", extra={'username': leader})
+        return
+
+    new_project = {
+        'ID': project_id,
+        'Title': title,
+        'Leader': leader,
+        'Members': [],
+        'Duties': []
+    }
+    repo.add_project(new_project)
+    print("[green]Project created successfully![/green]")
+    get_logger().info(f"Project '{title}' created with leader '{leader}'.", extra={'project_id': project_id, 'username': leader})
+
+@instrumented
+@retry_on_conflict
+def create_duty(project_id, duty_id, title, detail, assignees_usernames):
+    repo = get_repository()
+
+    project = repo.get_project(project_id)
+    if not project:
+        print(f"[red]Error! Project with ID '{project_id}' not found.[/red]")
+        return
+
+    assignees = [intern_user(user['username'], user['password'], user['emailaddress']) for user in map(repo.get_user, dict.fromkeys(assignees_usernames)) if user]
+
+    if len(assignees) != len(assignees_usernames):
+        print("[red]Error! One or more assignees not found.[/red]")
+        return
+
+    if repo.get_duty(project_id, duty_id):
+        print(f"[red]Error! Duty with ID '{duty_id}' already exists in project '{project_id}'.[/red]")
+        return
+
+    new_duty = Duty(duty_id, title, detail, assignees)
+    repo.add_duty(project_id, new_duty.to_dict())
+    print("[green]Duty created successfully![/green]")
+
+# Statuses of duties that still need work
+OPEN_STATUSES = (Status.BACKLOG, Status.TODO, Status.DOING)
+
+# Duties of every project matching all the given conditions, answered from
+# the repository's duty indexes: assigned to assignee (a username), in one of
+# statuses / priorities (Status / Priority members), finishing within
+# due_within (a timedelta) from now. Returns (project ID, duty) pairs,
+# soonest finish time first.
+@instrumented
+def query_duties(assignee=None, statuses=None, priorities=None, due_within=None):
+    due_after = due_before = None
+    if due_within is not None:
+        due_after = int(time.time())
+        due_before = due_after + int(due_within.total_seconds())
+    return get_repository().query_duties(
+        assignee,
+        [status.value for status in statuses] if statuses is not None else None,
+        [priority.value for priority in priorities] if priorities is not None else None,
+        due_after, due_before)
+
+# Open duties whose finish time has passed, most overdue first, from the
+# repository's deadline index. Returns (project ID, duty) pairs.
+@instrumented
+def overdue_duties(limit=None):
+    deadlines = get_repository().get_deadlines(None, int(time.time()), limit)
+    return [(project_id, duty) for finish, project_id, duty in deadlines]
+
+# Open duties finishing within within (a timedelta) from now, soonest first
+@instrumented
+def duties_due_soon(within, limit=None):
+    now = int(time.time())
+    deadlines = get_repository().get_deadlines(now, now + int(within.total_seconds()), limit)
+    return [(project_id, duty) for finish, project_id, duty in deadlines]
+
+# Changes to a duty, or to a project and its duties when duty_id is None,
+# made after since (a datetime; all of them when None), oldest first. Each is
+# a history entry (see history.py).
+@instrumented
+def duty_history(project_id, duty_id=None, since=None):
+    return get_repository().get_changes(project_id, duty_id, since.timestamp() if since is not None else None)
+
+# A duty as it was at when (a datetime), or None when it did not exist then
+@instrumented
+def duty_as_of(project_id, duty_id, when):
+    return get_repository().get_as_of(project_id, duty_id, when.timestamp())
+
+# Duties whose title or detail contains every word of query, or a word
+# starting with it, and projects whose title does, best match first.
+# Answered from the repository's search index. Returns (project ID, duty,
+# score) triples; duty is None where the project title matched.
+@instrumented
+def search_duties(query, limit=None):
+    repo = get_repository()
+    results = []
+    for project_id, duty_id, score in repo.search(query, limit or config.SEARCH_LIMIT):
+        duty = repo.get_duty(project_id, duty_id) if duty_id is not None else None
+        if duty_id is None or duty is not None:
+            results.append((project_id, duty, score))
+    return results
+
+#To add a member to a project
+@instrumented
+@retry_on_conflict
+def add_member_to_project(project_id, username):
+    repo = get_repository()
+    project = repo.get_project(project_id)
+
+    if not project:
+        print("[red]Error! Project ID not found.[/red]")
+        get_logger().error(f"Error! Project ID '{project_id}' not found.", extra={'project_id': project_id, 'username': username})
+        return
+
+    if not repo.get_user(username):
+        print(f"Error! User '{username}' not found.")
+        get_logger().error(f"Error! Username '{username}' not found.", extra={'project_id': project_id, 'username': username})
+        return
+    if username in project['Members']:
+        print("[red]Error! User is already a member of this project.[/red]")
+        get_logger().error(f"Error! User '{username}' is already a member of project '{project['Title']}'.", extra={'project_id': project_id, 'username': username})
+        return
+
+    repo.add_member(project_id, username)
+    print("[green]Member added to project successfully![/green]")
+    get_logger().info(f"User '{username}' added to project '{project['Title']}'.", extra={'project_id': project_id, 'username': username})
+
+#To remove a member from a project
+@instrumented
+@retry_on_conflict
+def remove_member_from_project(project_id, username):
+    repo = get_repository()
+    project = repo.get_project(project_id)
+
+    if not project:
+        print("[red]Error! Project ID not found.[/red]")
+        get_logger().error(f"Error! Project ID '{project_id}' not found.", extra={'project_id': project_id, 'username': username})
+        return
+
+    if username not in project['Members']:
+        print("[red]Error! User is not a member of this project.[/red]")
+        get_logger().error(f"Error! User '{username}' is not a member of project '{project['Title']}'.", extra={'project_id': project_id, 'username': username})
+        return
+
+    repo.remove_member(project_id, username)
+    print("[green]Member removed from project successfully![/green]")
+    get_logger().info(f"User '{username}' removed from project '{project['Title']}'.", extra={'project_id': project_id, 'username': username})
+
+@instrumented
+@retry_on_conflict
+def add_duty_to_project(project_id, duty_id, title, detail, assignees):
+    repo = get_repository()
+    project = repo.get_project(project_id)
+
+    if not project:
+        print("[red]Error! Project ID not found.[/red]")
+        get_logger().error(f"Error! Project ID '{project_id}' not found.", extra={'project_id': project_id, 'duty_id': duty_id})
+        return
+
+    for assignee in assignees:
+        if assignee not in project['Members']:
+            print(f"[red]Error! User '{assignee}' is not a member of this project.[/red]")
+            get_logger().error(f"Error! User '{assignee}' is not a member of project '{project['Title']}'.", extra={'project_id': project_id, 'duty_id': duty_id, 'username': assignee})
+            return
+
+    new_duty = {
+        'ID': duty_id,
+        'Title': title,
+        'Detail': detail,
+        'Start Time': datetime.now().isoformat(),
+        'End Time': (datetime.now() + timedelta(hours=24)).isoformat(),
+        'Priority': 'LOW',
+        'Status': 'BACKLOG',
+        'Assignees': assignees,
+        'Assigned To': None
+    }
+    repo.add_duty(project_id, new_duty)
+    print("[green]Duty added to project successfully![/green]")
+    get_logger().info(f"Duty '{title}' added to project '{project['Title']}'.", extra={'project_id': project_id, 'duty_id': duty_id})
+
+#To delete a project
+@instrumented
+@retry_on_conflict
+def delete_project(project_id, username):
+    repo = get_repository()
+    project = repo.get_project(project_id)
+
+    if project:
+        if project['Leader'] !=username:
+            print(f"[red]Error! Only the leader can delete the project.[/red]")
+            return
+        repo.remove_project(project_id)
+        print(f"[green]Project with ID '{project_id}' deleted successfully.[/green]")
+        return
+    print(f"[red]Error! Project with ID '{project_id}' not found.[/red]")
+
+# To assign a duty to a member
+@instrumented
+@retry_on_conflict
+def assign_duty_to_member(project_id, duty_id, username):
+    repo = get_repository()
+    project = repo.get_project(project_id)
+
+    if project:
+        work = UnitOfWork(repo)
+        duty = work.duty(project_id, duty_id)
+        if not duty:
+            get_logger().error(f"Error! Duty with ID '{duty_id}' not found in project '{project['Title']}'.", extra={'project_id': project_id, 'duty_id': duty_id, 'username': username})
+            print(f"[red]Error! Duty with ID '{duty_id}' not found.[/red]")
+            return
+        if username not in project['Members']:
+            get_logger().error(f"Error! User '{username}' is not a member of the project '{project['Title']}'.", extra={'project_id': project_id, 'duty_id': duty_id, 'username': username})
+            print(f"[red]Error! User '{username}' is not a member of this project.[/red]")
+            return
+
+        # Only the assigned duty is written, and nothing when it already was
+        duty.set_assigned_to(intern_user(username))
+        work.commit()
+        get_logger().info(f"Duty '{duty.get_title()}' assigned to '{username}' in project '{project['Title']}'.", extra={'project_id': project_id, 'duty_id': duty_id, 'username': username})
+        print(f"[green]Duty '{duty.get_title()}' assigned to '{username}' successfully.[/green]")
+        return
+    print(f"Error! Project with ID '{project_id}' not found.")
+
+#To unassign a duty from a member
+@instrumented
+@retry_on_conflict
+def unassign_duty_from_member(project_id, duty_id):
+    work = UnitOfWork()
+    duty = work.duty(project_id, duty_id)
+
+    if duty:
+        duty.set_assigned_to(None)
+        work.commit()
+        print(f"[green]Duty '{duty_id}' unassigned successfully.[/green]")
+        return
+    print(f"[red]Error! Project with ID '{project_id}' or duty with ID '{duty_id}' not found.[/red]")
+
+@instrumented
+@retry_on_conflict
+def assign_duty_to_user(project_id, duty_id, username):
+    repo = get_repository()
+    project = repo.get_project(project_id)
+    user = repo.get_user(username)
+
+    if not project:
+        print("[red]Error! Project ID not found.[/red]")
+        get_logger().error(f"Error! Project ID '{project_id}' not found.", extra={'project_id': project_id, 'duty_id': duty_id, 'username': username})
+        return
+
+    if not user:
+        print("[red]Error! Username not found.[/red]")
+        get_logger().error(f"Error! Username '{username}' not found.", extra={'project_id': project_id, 'duty_id': duty_id, 'username': username})
+        return
+
+    work = UnitOfWork(repo)
+    duty = work.duty(project_id, duty_id)
+
+    if not duty:
+        print("[red]Error! Duty ID not found.[/red]")
+        get_logger().error(f"Error! Duty ID '{duty_id}' not found in project '{project['Title']}'.", extra={'project_id': project_id, 'duty_id': duty_id, 'username': username})
+        return
+
+    if username not in project['Members']:
+        print(f"[red]Error! User '{username}' is not a member of this project.[/red]")
+        get_logger().error(f"Error! User '{username}' is not a member of project '{project['Title']}'.", extra={'project_id': project_id, 'duty_id': duty_id, 'username': username})
+        return
+
+    duty.set_assigned_to(intern_user(username))
+    work.commit()
+    print("[green]Duty assigned to user successfully![/green]")
+    get_logger().info(f"Duty '{duty.get_title()}' assigned to user '{username}' in project '{project['Title']}'.", extra={'project_id': project_id, 'duty_id': duty_id, 'username': username})
+
+@instrumented
+@retry_on_conflict
+def unassign_duty_from_user(project_id, duty_id):
+    repo = get_repository()
+    project = repo.get_project(project_id)
+
+    if not project:
+        print("[red]Error! Project ID not found.[/red]")
+        get_logger().error(f"Error! Project ID '{project_id}' not found.", extra={'project_id': project_id, 'duty_id': duty_id})
+        return
+
+    work = UnitOfWork(repo)
+    duty = work.duty(project_id, duty_id)
+
+    if not duty:
+        print("[red]Error! Duty ID not found.[/red]")
+        get_logger().error(f"Error! Duty ID '{duty_id}' not found in project '{project['Title']}'.", extra={'project_id': project_id, 'duty_id': duty_id})
+        return
+
+    duty.set_assigned_to(None)
+    work.commit()
+    print("[green]Duty unassigned successfully![/green]")
+    get_logger().info(f"Duty '{duty.get_title()}' unassigned in project '{project['Title']}'.", extra={'project_id': project_id, 'duty_id': duty_id})
+
+#New function to update duty details by a member
+@instrumented
+@retry_on_conflict
+def update_duty_details(user: User, project_id, duty_id, **kwargs):
+    repo = get_repository()
+    project = repo.get_project(project_id)
+
+    if project:
+        work = UnitOfWork(repo)
+        duty = work.duty(project_id, duty_id)
+        if duty:
+            assigned_to = duty.get_assigned_to()
+            if assigned_to and assigned_to.get_username() == user.get_username():
+                if 'title' in kwargs:
+                    duty.set_title(kwargs['title'])
+                if 'detail' in kwargs:
+                    duty.set_detail(kwargs['detail'])
+                if 'st' in kwargs:
+                    duty.set_st(kwargs['st'])
+                if 'ft' in kwargs:
+                    duty.set_ft(kwargs['ft'])
+                if 'priority' in kwargs:
+                    duty.set_priority(kwargs['priority'])
+                if 'status' in kwargs:
+                    duty.set_status(kwargs['status'])
+
+                # Only the fields that changed are written, none when none did
+                work.commit()
+                print(f"Duty '{duty_id}' updated successfully.")
+                return
+            else:
+                print(f"Error! User '{user.get_username()}' is not assigned to this duty.")
+                return
+
+    print(f"Error! Project with ID '{project_id}' not found.")
+
+# To create Duty
+@instrumented
+@retry_on_conflict
+def create_duty_in_project(project_id, duty_id, title, detail, assignees_usernames):
+    repo = get_repository()
+
+    project = repo.get_project(project_id)
+    if not project:
+        print(f"[red]Error! Project with ID '{project_id}' not found.[/red]")
+        return
+
+    assignees = [intern_user(user['username'], user['password'], user['emailaddress']) for user in map(repo.get_user, dict.fromkeys(assignees_usernames)) if user]
+
+    if len(assignees) != len(assignees_usernames):
+        print("[red]Error! One or more assignees not found.[/red]")
+        return
+
+    if repo.get_duty(project_id, duty_id):
+        print(f"[red]Error! Duty with ID '{duty_id}' already exists in project '{project_id}'.[/red]")
+        return
+
+    new_duty = Duty(duty_id, title, detail, assignees)
+    repo.add_duty(project_id, new_duty.to_dict())
+    print("[green]Duty created successfully![/green]")
@@ -0,0 +1,371 @@
+import contextvars
+import copy
+import hashlib
+import json
+import os
+from bisect import bisect_right
+import config
+from instrumentation import measure
+from locking import atomic_write, file_lock, lock_path
+from journal import (Journal, USER_CREATED, PROJECT_CREATED, PROJECT_DELETED, MEMBER_ADDED, MEMBER_REMOVED, DUTY_CREATED,
+                     DUTY_FIELD_RECORDS, DUTIES_ARCHIVED, read_journal)
+
+# Change history of projects and duties. Every change adds one entry for each
+# project or duty it touched, holding only what changed:
+#
+#   {'kind': 'changed', 'project_id': ..., 'duty_id': ... (None for the
+#    project itself), 'time': epoch seconds, 'actor': username or None,
+#    'changes': {field: [old, new]}}
+#
+# Membership changes carry {'added': {'Members': [username]}} or 'removed'
+# instead of the whole member list. 'created' entries hold the new duty or
+# project (without its duties) as 'state', 'deleted' entries nothing.
+# 'checkpoint' entries hold the whole state again: one is written after every
+# HISTORY_CHECKPOINT_EVERY changes of the same duty or project, so finding
+# its state at some time replays at most that many entries, and one before
+# the first change of a duty or project that existed before it had a
+# history (its state up to that change).
+
+BASE_KINDS = ('created', 'checkpoint')
+
+# Who the changes made by this thread are made by, e.g. the logged in user
+_actor = contextvars.ContextVar('actor', default=None)
+
+def set_actor(username):
+    _actor.set(username)
+
+def current_actor():
+    return _actor.get()
+
+def history_path(file_path):
+    return os.path.splitext(file_path)[0] + '.history'
+
+def project_state(project):
+    return copy.deepcopy({key: value for key, value in project.items() if key not in ('Duties', 'Version')})
+
+def _entry(kind, project_id, duty_id, when, actor, **data):
+    return dict(kind=kind, project_id=project_id, duty_id=duty_id, time=when, actor=actor, **data)
+
+# (entry, state before it) pairs for a journal record, from the data as it
+# is before the record is applied. A change that sets fields to the values
+# they already have adds nothing.
+def entries(record, get_project, get_duty, when, actor):
+    kind = record['type']
+    # archiving moves duties to the cold tier without changing them
+    if kind in (USER_CREATED, DUTIES_ARCHIVED):
+        return []
+    if kind == PROJECT_CREATED:
+        project = record['project']
+        pairs = [(_entry('created', project['ID'], None, when, actor, state=project_state(project)), None)]
+        for duty in project.get('Duties', []):
+            pairs.append((_entry('created', project['ID'], duty['ID'], when, actor, state=copy.deepcopy(duty)), None))
+        return pairs
+    project_id = record['project_id']
+    if kind == DUTY_CREATED:
+        duty = record['duty']
+        return [(_entry('created', project_id, duty['ID'], when, actor, state=copy.deepcopy(duty)), None)]
+    if kind in DUTY_FIELD_RECORDS:
+        duty = get_duty(project_id, record['duty_id'])
+        if duty is None:
+            return []
+        changes = {field: [duty.get(field), value] for field, value in record['fields'].items()
+                   if duty.get(field) != value}
+        if not changes:
+            return []
+        return [(_entry('changed', project_id, duty['ID'], when, actor, changes=copy.deepcopy(changes)),
+                 copy.deepcopy(duty))]
+    project = get_project(project_id)
+    if project is None:
+        return []
+    if kind == PROJECT_DELETED:
+        pairs = [(_entry('deleted', project_id, None, when, actor), project_state(project))]
+        for duty in project['Duties']:
+            pairs.append((_entry('deleted', project_id, duty['ID'], when, actor), copy.deepcopy(duty)))
+        return pairs
+    if kind in (MEMBER_ADDED, MEMBER_REMOVED):
+        if (record['username'] in project['Members']) == (kind == MEMBER_ADDED):
+            return []
+        change = 'added' if kind == MEMBER_ADDED else 'removed'
+        return [(_entry('changed', project_id, None, when, actor, **{change: {'Members': [record['username']]}}),
+                 project_state(project))]
+    return []
+
+# The state after entry, given the state before it
+def apply_entry(state, entry):
+    kind = entry['kind']
+    if kind in BASE_KINDS:
+        return copy.deepcopy(entry['state'])
+    if kind == 'deleted' or state is None:
+        return None
+    state = copy.deepcopy(state)
+    for field, (old, new) in entry.get('changes', {}).items():
+        state[field] = copy.deepcopy(new)
+    for field, values in entry.get('added', {}).items():
+        state.setdefault(field, []).extend(value for value in values if value not in state[field])
+    for field, values in entry.get('removed', {}).items():
+        state[field] = [value for value in state.get(field, []) if value not in values]
+    return state
+
+# The state of a duty or project after entries, its entries up to some time
+# starting at a 'created' or 'checkpoint' one
+def replay(entries):
+    state = None
+    for entry in entries:
+        state = apply_entry(state, entry)
+    return state
+
+# The entries to store for (entry, state before) pairs: the entries, with the
+# checkpoints that are due added. changes_since_checkpoint(key) is the number
+# of changes stored for a (project ID, duty ID) key since its last
+# checkpoint, or None when it has no history yet; counts holds those numbers
+# for the keys already seen, across calls within a batch.
+def with_checkpoints(pairs, changes_since_checkpoint, counts):
+    stored = []
+    for entry, before in pairs:
+        key = (entry['project_id'], entry['duty_id'])
+        count = counts[key] if key in counts else changes_since_checkpoint(key)
+        if count is None and entry['kind'] != 'created':
+            stored.append(_entry('checkpoint', key[0], key[1], entry['time'], entry['actor'], state=before))
+        stored.append(entry)
+        if entry['kind'] == 'changed':
+            count = (count or 0) + 1
+            if count >= config.HISTORY_CHECKPOINT_EVERY:
+                stored.append(_entry('checkpoint', key[0], key[1], entry['time'], entry['actor'],
+                                     state=apply_entry(before, entry)))
+                count = 0
+        else:
+            count = 0
+        counts[key] = count
+    return stored
+
+# Number of 'changed' kinds after the last base kind in kinds (oldest first),
+# None when there are none at all
+def count_since_base(kinds):
+    if not kinds:
+        return None
+    count = 0
+    for kind in reversed(kinds):
+        if kind in BASE_KINDS:
+            break
+        count += kind == 'changed'
+    return count
+
+# The history of the JSON and sharded storage: entries appended as JSON lines
+# to one file, so a query reads only the lines it needs through an index of
+# their offsets. The index is kept on disk next to the file (history_index_dir),
+# one file per project of [duty ID, time, kind, offset] rows, and a state
+# file with the history file's identity and how much of it is indexed.
+# Whoever looks next indexes what was appended since, under the index lock,
+# so a process reads the rows of the projects it asks about plus the latest
+# entries, not the whole history. A purged or replaced history file is
+# indexed again from the start.
+#
+# A crash while indexing leaves the state behind the rows already written;
+# indexing that tail again repeats their rows, which are skipped as their
+# offsets are not past the last row read, and a row cut short is dropped.
+# Nothing in the index is fsynced, so a change costs no more syncs than its
+# journal append. A process crash loses none of it, as it is still in the
+# page cache; what a power failure or OS crash lost cannot be told apart, so
+# the identity includes the boot the index was written in, and after a
+# reboot the index is built again like for a replaced history file.
+
+# Changes once per boot; None where the system does not tell
+def _boot_id():
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+def history_index_dir(path):
+    return path + '-index'
+
+class HistoryLog:
+    def __init__(self, path):
+        self._path = path
+        self._journal = Journal(path)
+        self._index_dir = history_index_dir(path)
+        self._state_path = os.path.join(self._index_dir, 'state')
+        self._lock_path = lock_path(path + '.index')
+        self._boot = _boot_id()
+        self._clear()
+        # in batch mode, the entries waiting for commit_batch() and the
+        # changes since a checkpoint counted for them
+        self._batch = None
+        self._batch_counts = None
+
+    def _clear(self):
+        self._identity = None
+        # project ID -> _ProjectIndex of the index rows read so far
+        self._projects = {}
+
+    def _project_index_path(self, project_id):
+        # project IDs are user input, so they are hashed into a safe file name
+        return os.path.join(self._index_dir, hashlib.sha1(str(project_id).encode()).hexdigest())
+
+    def _read_state(self):
+        try:
+            with open(self._state_path) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    # Indexes the entries appended since the state was written. Returns the
+    # state, or None when there is no history.
+    def _index_tail(self):
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            return None
+        identity = [stat.st_dev, stat.st_ino, self._boot]
+        state = self._read_state()
+        if state is not None and state['identity'] == identity and state['offset'] == stat.st_size:
+            return state
+        with file_lock(self._lock_path):
+            state = self._read_state()
+            size = os.stat(self._path).st_size
+            if state is None or state['identity'] != identity or state['offset'] > size:
+                self._drop_index()
+                state = {'identity': identity, 'offset': 0}
+            if state['offset'] == size:
+                return state
+            rows = {}
+            start = state['offset']
+            for entry, end in read_journal(self._path, start):
+                rows.setdefault(entry['project_id'], []).append(
+                    json.dumps([entry['duty_id'], entry['time'], entry['kind'], start]) + '\n')
+                start = end
+            os.makedirs(self._index_dir, exist_ok=True)
+            with measure('disk'):
+                for project_id, lines in rows.items():
+                    _append_rows(self._project_index_path(project_id), ''.join(lines).encode())
+            state = {'identity': identity, 'offset': start}
+            atomic_write(self._state_path, lambda file: json.dump(state, file), sync=False)
+        return state
+
+    def _drop_index(self):
+        if os.path.isdir(self._index_dir):
+            for name in os.listdir(self._index_dir):
+                os.remove(os.path.join(self._index_dir, name))
+
+    # The index of a project's entries, brought up to date
+    def _project(self, project_id):
+        state = self._index_tail()
+        if state is None:
+            self._clear()
+            return _ProjectIndex()
+        if state['identity'] != self._identity:
+            self._clear()
+            self._identity = state['identity']
+        index = self._projects.get(project_id)
+        path = self._project_index_path(project_id)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            size = 0
+        if index is None or size < index.position:
+            index = self._projects[project_id] = _ProjectIndex()
+        for (duty_id, when, kind, offset), end in read_journal(path, index.position):
+            index.position = end
+            if offset > index.last_offset:
+                index.add(project_id, duty_id, when, kind, offset)
+        return index
+
+    def _read(self, offsets):
+        if not offsets:
+            return []
+        with measure('disk'), open(self._path, 'rb') as file:
+            lines = []
+            for offset in offsets:
+                file.seek(offset)
+                lines.append(file.readline())
+        with measure('parse'):
+            return [json.loads(line) for line in lines]
+
+    def _changes_since_checkpoint(self, key):
+        found = self._project(key[0]).by_key.get(key, ())
+        return count_since_base([kind for time, kind, offset in found[-config.HISTORY_CHECKPOINT_EVERY - 1:]])
+
+    # Stores the (entry, state before) pairs of a change. Called with the
+    # project locked, so no other process adds to the same keys meanwhile.
+    def add(self, pairs):
+        if not pairs:
+            return
+        if self._batch is not None:
+            self._batch.extend(with_checkpoints(pairs, self._changes_since_checkpoint, self._batch_counts))
+            return
+        self._journal.append_all(with_checkpoints(pairs, self._changes_since_checkpoint, {}))
+
+    # Entries of a project, its duties included, or of one of its duties,
+    # made after since (epoch seconds; every one when None), oldest first
+    def changes(self, project_id, duty_id=None, since=None):
+        index = self._project(project_id)
+        if duty_id is None:
+            found = index.entries
+            found = found[bisect_right(found, since, key=lambda item: item[0]):] if since is not None else found
+            return self._read([offset for time, offset in found])
+        found = index.by_key.get((project_id, duty_id), [])
+        found = found[bisect_right(found, since, key=lambda item: item[0]):] if since is not None else found
+        return self._read([offset for time, kind, offset in found if kind != 'checkpoint'])
+
+    # A duty (or a project's own fields, duty_id None) as it was at when:
+    # None when it did not exist then. Before its history starts, a duty that
+    # existed earlier is shown as it was when its first change was made.
+    def as_of(self, project_id, duty_id, when):
+        found = self._project(project_id).by_key.get((project_id, duty_id), [])
+        position = bisect_right(found, when, key=lambda item: item[0])
+        if position == 0:
+            if found and found[0][1] == 'checkpoint':
+                return self._read([found[0][2]])[0]['state']
+            return None
+        start = position - 1
+        while start > 0 and found[start][1] not in BASE_KINDS:
+            start -= 1
+        return replay(self._read([offset for time, kind, offset in found[start:position]]))
+
+    def begin_batch(self):
+        self._batch = []
+        self._batch_counts = {}
+
+    def commit_batch(self):
+        if self._batch:
+            self._journal.append_all(self._batch)
+        self._batch = []
+        self._batch_counts = {}
+
+    def end_batch(self):
+        self._batch = None
+        self._batch_counts = None
+
+    def close(self):
+        self._journal.close()
+
+# The index rows of one project read so far
+class _ProjectIndex:
+    def __init__(self):
+        # bytes of its index file read
+        self.position = 0
+        self.last_offset = -1
+        # (project ID, duty ID) -> [(time, kind, offset)], in file order
+        self.by_key = {}
+        # [(time, offset)] of the project's and its duties' entries other
+        # than checkpoints
+        self.entries = []
+
+    def add(self, project_id, duty_id, when, kind, offset):
+        self.by_key.setdefault((project_id, duty_id), []).append((when, kind, offset))
+        if kind != 'checkpoint':
+            self.entries.append((when, offset))
+        self.last_offset = offset
+
+# Appends rows to an index file, first dropping a row a crash cut short
+def _append_rows(path, data):
+    with open(path, 'ab+') as file:
+        size = file.seek(0, os.SEEK_END)
+        if size:
+            tail_start = max(0, size - 4096)
+            file.seek(tail_start)
+            tail = file.read()
+            if not tail.endswith(b'\n'):
+                file.truncate(tail_start + tail.rfind(b'\n') + 1)
+        file.write(data)
@@ -0,0 +1,509 @@
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import datetime
+from journal import PROJECT_CREATED, PROJECT_DELETED, DUTY_CREATED, DUTY_FIELD_RECORDS, DUTIES_ARCHIVED
+
+# Secondary indexes over the projects held in memory by storage.Repository.
+# They are kept up to date record by record: the repository calls apply()
+# after every journal record it applies and reset() whenever it reloads a
+# snapshot, so a query never has to walk every duty of every project.
+
+def _username_of(user):
+    # members and assignees are stored either as usernames or as user dicts
+    if isinstance(user, dict):
+        return user.get('username')
+    return user
+
+# Duties written by different functions keep the finish time under 'FT',
+# 'FinishTime' or 'End Time'. Returns epoch seconds, or None.
+def finish_timestamp(duty):
+    for key in ('FT', 'FinishTime', 'End Time'):
+        if duty.get(key):
+            try:
+                return int(datetime.fromisoformat(duty[key]).timestamp())
+            except ValueError:
+                return None
+    return None
+
+# Stored statuses of duties that still need work; only these have deadlines
+OPEN_STATUS_VALUES = ('BACKLOG', 'TODO', 'DOING')
+
+# Usernames a duty is indexed under: its assignees and whoever it is assigned to
+def duty_usernames(duty):
+    usernames = {_username_of(assignee) for assignee in duty.get('Assignees', [])}
+    usernames.add(_username_of(duty.get('AssignedTo') or duty.get('Assigned To')))
+    usernames.discard(None)
+    return usernames
+
+# Adds delta to counts[status][priority], dropping counts that reach zero
+def _count(counts, status, priority, delta):
+    by_priority = counts.setdefault(status, {})
+    count = by_priority.get(priority, 0) + delta
+    if count:
+        by_priority[priority] = count
+    else:
+        del by_priority[priority]
+        if not by_priority:
+            del counts[status]
+
+# {status: {priority: number of duties}} of a list of duties
+def duty_counts(duties):
+    counts = {}
+    seen = set()
+    for duty in duties:
+        if duty['ID'] not in seen:
+            seen.add(duty['ID'])
+            _count(counts, duty.get('Status'), duty.get('Priority'), 1)
+    return counts
+
+class DutyIndex:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # (project ID, duty ID) -> (duty, usernames, status, priority, finish)
+        self._entries = {}
+        # project ID -> {status: {priority: number of duties}}, and the same
+        # over every project, kept up to date as duties are (re)indexed
+        self._counts = {}
+        self._totals = {}
+        self._by_project = {}
+        self._by_user = {}
+        self._by_status = {}
+        self._by_priority = {}
+        # (finish, project ID, duty ID), sorted, for range queries; the same
+        # for the open duties only, the deadlines
+        self._by_finish = []
+        self._deadlines = []
+
+    # Re-indexes everything, e.g. after the projects were reloaded
+    def reset(self, projects):
+        self.clear()
+        for project in projects:
+            self.index_project(project)
+
+    def index_project(self, project):
+        self.remove_project(project['ID'])
+        for duty in project.get('Duties', []):
+            self.index_duty(project['ID'], duty)
+
+    def remove_project(self, project_id):
+        for duty_id in list(self._by_project.get(project_id, ())):
+            self.remove_duty(project_id, duty_id)
+        self._by_project.pop(project_id, None)
+        self._counts.pop(project_id, None)
+
+    def index_duty(self, project_id, duty):
+        key = (project_id, duty['ID'])
+        self.remove_duty(*key)
+        entry = (duty, duty_usernames(duty), duty.get('Status'), duty.get('Priority'), finish_timestamp(duty))
+        self._entries[key] = entry
+        self._by_project.setdefault(project_id, set()).add(duty['ID'])
+        for username in entry[1]:
+            self._by_user.setdefault(username, set()).add(key)
+        self._by_status.setdefault(entry[2], set()).add(key)
+        self._by_priority.setdefault(entry[3], set()).add(key)
+        _count(self._counts.setdefault(project_id, {}), entry[2], entry[3], 1)
+        _count(self._totals, entry[2], entry[3], 1)
+        if entry[4] is not None:
+            insort(self._by_finish, (entry[4], project_id, duty['ID']))
+            if entry[2] in OPEN_STATUS_VALUES:
+                insort(self._deadlines, (entry[4], project_id, duty['ID']))
+
+    def remove_duty(self, project_id, duty_id):
+        key = (project_id, duty_id)
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._by_project.get(project_id, set()).discard(duty_id)
+        for username in entry[1]:
+            self._by_user[username].discard(key)
+        self._by_status[entry[2]].discard(key)
+        self._by_priority[entry[3]].discard(key)
+        _count(self._counts[project_id], entry[2], entry[3], -1)
+        _count(self._totals, entry[2], entry[3], -1)
+        if entry[4] is not None:
+            position = bisect_left(self._by_finish, (entry[4], project_id, duty_id))
+            del self._by_finish[position]
+            if entry[2] in OPEN_STATUS_VALUES:
+                del self._deadlines[bisect_left(self._deadlines, (entry[4], project_id, duty_id))]
+
+    # Called with the project as it is after the record was applied (None
+    # when it no longer exists)
+    def apply(self, record, project):
+        kind = record['type']
+        if kind == PROJECT_CREATED:
+            if project is not None:
+                self.index_project(project)
+        elif kind == PROJECT_DELETED:
+            self.remove_project(record['project_id'])
+            # a duplicate project with the same ID took its place
+            if project is not None:
+                self.index_project(project)
+        elif kind == DUTY_CREATED or kind in DUTY_FIELD_RECORDS:
+            duty_id = record['duty']['ID'] if kind == DUTY_CREATED else record['duty_id']
+            duty = next((d for d in project['Duties'] if d['ID'] == duty_id), None) if project else None
+            if duty is not None:
+                self.index_duty(record['project_id'], duty)
+        elif kind == DUTIES_ARCHIVED:
+            for duty_id in record['duty_ids']:
+                self.remove_duty(record['project_id'], duty_id)
+
+    def get(self, project_id, duty_id):
+        entry = self._entries.get((project_id, duty_id))
+        return entry[0] if entry is not None else None
+
+    # (finish, project ID, duty) of the open duties finishing at or after
+    # due_after and before due_before (epoch seconds), soonest first, at most
+    # limit of them. Costs a binary search plus the entries returned.
+    def deadlines(self, due_after=None, due_before=None, limit=None):
+        start = bisect_left(self._deadlines, (due_after,)) if due_after is not None else 0
+        end = bisect_left(self._deadlines, (due_before,)) if due_before is not None else len(self._deadlines)
+        if limit is not None:
+            end = min(end, start + limit)
+        return [(finish, project_id, self._entries[(project_id, duty_id)][0])
+                for finish, project_id, duty_id in self._deadlines[start:end]]
+
+    # {status: {priority: number of duties}} of a project, or of every
+    # project when project_id is None; a copy the caller may keep
+    def counts(self, project_id=None):
+        counts = self._totals if project_id is None else self._counts.get(project_id, {})
+        return {status: dict(by_priority) for status, by_priority in counts.items()}
+
+    # (project ID, duty) pairs matching every given condition, ordered by
+    # finish time (duties without one last). statuses and priorities are
+    # collections of stored values, e.g. {'TODO', 'DOING'}; due_after and
+    # due_before are epoch seconds (inclusive, exclusive).
+    def query(self, assignee=None, statuses=None, priorities=None, due_after=None, due_before=None):
+        candidates = []
+        if assignee is not None:
+            candidates.append(self._by_user.get(assignee, set()))
+        if statuses is not None:
+            candidates.append(set().union(*(self._by_status.get(s, set()) for s in statuses)))
+        if priorities is not None:
+            candidates.append(set().union(*(self._by_priority.get(p, set()) for p in priorities)))
+
+        if due_after is not None or due_before is not None:
+            start = bisect_left(self._by_finish, (due_after,)) if due_after is not None else 0
+            end = bisect_left(self._by_finish, (due_before,)) if due_before is not None else len(self._by_finish)
+            keys = [(project_id, duty_id) for _, project_id, duty_id in self._by_finish[start:end]]
+            keys = [key for key in keys if all(key in keys_of for keys_of in candidates)]
+        else:
+            if candidates:
+                candidates.sort(key=len)
+                keys = set(candidates[0]).intersection(*candidates[1:])
+            else:
+                keys = set(self._entries)
+            keys = sorted(keys, key=lambda key: (self._entries[key][4] is None, self._entries[key][4] or 0, key))
+
+        return [(key[0], self._entries[key][0]) for key in keys]
+
+# Which projects each user leads and which they belong to, as a member or as
+# an assignee of one of the duties. Fed like DutyIndex; projects can be full
+# project dicts or manifest summaries, which list the assignees of their
+# duties under 'Assignees'.
+class MembershipIndex:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # project ID -> (leader, usernames of members and assignees)
+        self._projects = {}
+        # project ID -> duty ID -> usernames, and project ID -> username -> duties
+        self._duty_users = {}
+        self._duty_refs = {}
+        # username -> {project ID: None}, dicts keep the order projects came in
+        self._led = {}
+        self._joined = {}
+
+    def reset(self, projects):
+        self.clear()
+        for project in projects:
+            self.index_project(project)
+
+    def index_project(self, project):
+        project_id = project['ID']
+        self._duty_users[project_id] = {}
+        self._duty_refs[project_id] = Counter()
+        for duty in project.get('Duties', []):
+            self._set_duty_users(project_id, duty)
+        self._update(project_id, project)
+
+    def remove_project(self, project_id):
+        leader, usernames = self._projects.pop(project_id, (None, set()))
+        self._led.get(leader, {}).pop(project_id, None)
+        for username in usernames:
+            self._joined[username].pop(project_id, None)
+        self._duty_users.pop(project_id, None)
+        self._duty_refs.pop(project_id, None)
+
+    def _set_duty_users(self, project_id, duty):
+        refs = self._duty_refs[project_id]
+        refs.subtract(self._duty_users[project_id].get(duty['ID'], ()))
+        usernames = duty_usernames(duty)
+        refs.update(usernames)
+        self._duty_users[project_id][duty['ID']] = usernames
+
+    def _drop_duty_users(self, project_id, duty_id):
+        self._duty_refs[project_id].subtract(self._duty_users[project_id].pop(duty_id, ()))
+
+    # Brings the project's leader and user set up to date, touching only the
+    # users that were added or dropped
+    def _update(self, project_id, project):
+        leader = _username_of(project.get('Leader'))
+        usernames = {_username_of(member) for member in project.get('Members', [])}
+        usernames.update(project.get('Assignees', []))
+        usernames.update(username for username, count in self._duty_refs.get(project_id, {}).items() if count > 0)
+        old_leader, old_usernames = self._projects.get(project_id, (None, set()))
+        if old_leader != leader:
+            self._led.get(old_leader, {}).pop(project_id, None)
+            self._led.setdefault(leader, {})[project_id] = None
+        for username in old_usernames - usernames:
+            self._joined[username].pop(project_id, None)
+        for username in usernames - old_usernames:
+            self._joined.setdefault(username, {})[project_id] = None
+        self._projects[project_id] = (leader, usernames)
+
+    def apply(self, record, project):
+        kind = record['type']
+        if kind == PROJECT_DELETED:
+            self.remove_project(record['project_id'])
+        if project is None:
+            return
+        if kind in (PROJECT_CREATED, PROJECT_DELETED):
+            self.index_project(project)
+        elif kind == DUTY_CREATED or kind in DUTY_FIELD_RECORDS:
+            duty_id = record['duty']['ID'] if kind == DUTY_CREATED else record['duty_id']
+            duty = next((d for d in project['Duties'] if d['ID'] == duty_id), None)
+            if duty is not None:
+                self._set_duty_users(project['ID'], duty)
+            self._update(project['ID'], project)
+        elif kind == DUTIES_ARCHIVED:
+            for duty_id in record['duty_ids']:
+                self._drop_duty_users(project['ID'], duty_id)
+            self._update(project['ID'], project)
+        else:
+            self._update(project['ID'], project)
+
+    # IDs of the projects username leads, and of the ones they are in
+    # without leading them
+    def projects_of(self, username):
+        led = list(self._led.get(username, {}))
+        joined = [project_id for project_id in self._joined.get(username, {})
+                  if self._projects[project_id][0] != username]
+        return led, joined
+
+# ---- full-text search ----
+
+# Words are runs of letters, digits and underscores, compared in lower case
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# How much one occurrence of a word counts in each field, and how much less a
+# word that only starts with a query term counts than the term itself
+TITLE_WEIGHT = 3.0
+DETAIL_WEIGHT = 1.0
+PROJECT_TITLE_WEIGHT = 3.0
+PREFIX_FACTOR = 0.5
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower()) if isinstance(text, str) else []
+
+# token -> weight of a searchable document, from (text, weight) pairs
+def document_terms(*fields):
+    terms = {}
+    for text, weight in fields:
+        for token in tokenize(text):
+            terms[token] = terms.get(token, 0.0) + weight
+    return terms
+
+def duty_terms(duty):
+    return document_terms((duty.get('Title'), TITLE_WEIGHT), (duty.get('Detail'), DETAIL_WEIGHT))
+
+def project_terms(project):
+    return document_terms((project.get('Title'), PROJECT_TITLE_WEIGHT))
+
+# The documents matching every query term, best first, as (project ID, duty
+# ID, score); the duty ID is None where the project title matched. matches
+# holds, for each query term, (exact, postings) pairs for the indexed words
+# the term is a prefix of, postings mapping document -> weight of the word in
+# it. A document scores, for each term, the weight times the inverse
+# document frequency of its best matching word.
+def rank(matches, document_count, limit):
+    scores = None
+    for term_matches in sorted(matches, key=lambda pairs: sum(len(postings) for _, postings in pairs)):
+        best = {}
+        for exact, postings in term_matches:
+            factor = math.log(1 + document_count / len(postings)) * (1.0 if exact else PREFIX_FACTOR)
+            for document, weight in postings.items():
+                if scores is not None and document not in scores:
+                    continue
+                score = weight * factor
+                if score > best.get(document, 0.0):
+                    best[document] = score
+        scores = best if scores is None else {document: scores[document] + score for document, score in best.items()}
+        if not scores:
+            return []
+    if scores is None:
+        return []
+    top = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0][0], item[0][1] or ''))
+    return [(project_id, duty_id, round(score, 3)) for (project_id, duty_id), score in top]
+
+# Inverted index over duty titles and details and project titles, fed like
+# DutyIndex. Documents are keyed (project ID, duty ID), or (project ID, None)
+# for the project itself.
+class SearchIndex:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # document -> its tokens
+        self._documents = {}
+        # token -> {document: weight}
+        self._postings = {}
+        # the tokens in _postings, sorted, for prefix lookups
+        self._tokens = []
+        # project ID -> its documents
+        self._by_project = {}
+
+    def reset(self, projects):
+        self.clear()
+        self.add_projects(projects)
+
+    # Indexes projects that are not indexed yet. When they bring many
+    # documents next to the tokens already indexed, the sorted token list is
+    # rebuilt once at the end instead of growing by insertion.
+    def add_projects(self, projects):
+        documents = _unique_documents(projects)
+        bulk = len(documents) * 8 > len(self._tokens)
+        if bulk:
+            self._tokens = None
+        for project_id, duty_id, terms in documents:
+            self._add((project_id, duty_id), terms)
+        if bulk:
+            self._tokens = sorted(self._postings)
+
+    # Like add_projects, from what saved_search_index() made of them, without
+    # tokenizing anything
+    def load_saved(self, saved):
+        keys = [(project_id, duty_id) for project_id, duty_id, _ in saved['documents']]
+        for key, (_, _, tokens) in zip(keys, saved['documents']):
+            self._documents[key] = tuple(tokens)
+            self._by_project.setdefault(key[0], set()).add(key)
+        new_tokens = []
+        for token, (numbers, weights) in saved['postings'].items():
+            postings = self._postings.get(token)
+            if postings is None:
+                self._postings[token] = dict(zip(map(keys.__getitem__, numbers), weights))
+                new_tokens.append(token)
+            else:
+                postings.update(zip(map(keys.__getitem__, numbers), weights))
+        if len(new_tokens) * 8 > len(self._tokens):
+            self._tokens = sorted(self._postings)
+        else:
+            for token in new_tokens:
+                insort(self._tokens, token)
+
+    def index_project(self, project):
+        self.remove_project(project['ID'])
+        for project_id, duty_id, terms in search_documents(project):
+            self._add((project_id, duty_id), terms)
+
+    def remove_project(self, project_id):
+        for document in list(self._by_project.get(project_id, ())):
+            self._remove(document)
+        self._by_project.pop(project_id, None)
+
+    def index_duty(self, project_id, duty):
+        self._add((project_id, duty['ID']), duty_terms(duty))
+
+    def _add(self, document, terms):
+        self._remove(document)
+        self._documents[document] = tuple(terms)
+        self._by_project.setdefault(document[0], set()).add(document)
+        for token, weight in terms.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                if self._tokens is not None:
+                    insort(self._tokens, token)
+            postings[document] = weight
+
+    def _remove(self, document):
+        tokens = self._documents.pop(document, None)
+        if tokens is None:
+            return
+        self._by_project.get(document[0], set()).discard(document)
+        for token in tokens:
+            postings = self._postings[token]
+            del postings[document]
+            if not postings:
+                del self._postings[token]
+                if self._tokens is not None:
+                    del self._tokens[bisect_left(self._tokens, token)]
+
+    def apply(self, record, project):
+        kind = record['type']
+        if kind == PROJECT_CREATED:
+            if project is not None:
+                self.index_project(project)
+        elif kind == PROJECT_DELETED:
+            self.remove_project(record['project_id'])
+            if project is not None:
+                self.index_project(project)
+        elif kind == DUTY_CREATED or (kind in DUTY_FIELD_RECORDS and
+                                      ('Title' in record['fields'] or 'Detail' in record['fields'])):
+            duty_id = record['duty']['ID'] if kind == DUTY_CREATED else record['duty_id']
+            duty = next((d for d in project['Duties'] if d['ID'] == duty_id), None) if project else None
+            if duty is not None:
+                self.index_duty(record['project_id'], duty)
+        elif kind == DUTIES_ARCHIVED:
+            for duty_id in record['duty_ids']:
+                self._remove((record['project_id'], duty_id))
+
+    # See rank(); an empty query matches nothing
+    def search(self, query, limit):
+        matches = []
+        for term in dict.fromkeys(tokenize(query)):
+            start = bisect_left(self._tokens, term)
+            end = bisect_left(self._tokens, term + '\U0010ffff', start)
+            matches.append([(token == term, self._postings[token]) for token in self._tokens[start:end]])
+        if not matches:
+            return []
+        return rank(matches, len(self._documents), limit)
+
+# (project ID, duty ID, terms) of a project's title and duties; duty IDs
+# that repeat within the project are indexed once, like get_duty finds the first
+def search_documents(project):
+    documents = {None: project_terms(project)}
+    for duty in project.get('Duties', []):
+        documents.setdefault(duty['ID'], duty_terms(duty))
+    return [(project['ID'], duty_id, terms) for duty_id, terms in documents.items()]
+
+# The documents of projects, the first of any that share an ID
+def _unique_documents(projects):
+    seen = set()
+    documents = []
+    for project in projects:
+        if project['ID'] not in seen:
+            seen.add(project['ID'])
+            documents.extend(search_documents(project))
+    return documents
+
+# The search index of projects in a form that loads without tokenizing:
+#   {'documents': [[project ID, duty ID, [token, ...]], ...],
+#    'postings': {token: [[document number, ...], [weight, ...]], ...}}
+def saved_search_index(projects):
+    documents = []
+    postings = {}
+    for number, (project_id, duty_id, terms) in enumerate(_unique_documents(projects)):
+        documents.append([project_id, duty_id, list(terms)])
+        for token, weight in terms.items():
+            entry = postings.get(token)
+            if entry is None:
+                entry = postings[token] = [[], []]
+            entry[0].append(number)
+            entry[1].append(weight)
+    return {'documents': documents, 'postings': postings}
@@ -0,0 +1,205 @@
+import atexit
+import functools
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+import config
+from applog import get_logger
+from locking import atomic_write, file_lock, lock_path
+
+# Timing of the top-level operations in main.py. Each call of an operation
+# wrapped with @instrumented records its wall time and, from the storage
+# code, the time spent parsing, serializing and on disk, the bytes read and
+# written and the records scanned. Aggregates are kept in this process as
+# histograms and merged into config.STATS_PATH every STATS_FLUSH_INTERVAL
+# seconds and at exit; manager.py stats prints them.
+#
+# With TRELLOMIZE_PROFILE_DIR set, every operation also runs under cProfile
+# and leaves a <operation>-<pid>-<n>.prof file there (see python -m pstats).
+
+PHASES = ('parse', 'serialize', 'disk')
+COUNTERS = ('bytes_read', 'bytes_written', 'records_scanned')
+
+# Name storage work done outside any operation (manager.py commands,
+# benchmarks) is recorded under
+OUTSIDE = '(outside operations)'
+
+# Durations go into power-of-two buckets of microseconds, so a histogram is a
+# few dozen integers however many calls it has seen
+class Histogram:
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self, count=0, total=0.0, maximum=0.0, buckets=None):
+        self.count = count
+        self.total = total
+        self.max = maximum
+        self.buckets = buckets if buckets is not None else {}
+
+    def add(self, seconds):
+        bucket = max(0, math.ceil(math.log2(seconds * 1e6))) if seconds > 0 else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    # Upper bound of the bucket holding the given fraction of the calls
+    def percentile(self, fraction):
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= fraction * self.count:
+                return min(2 ** bucket / 1e6, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'total': self.total, 'max': self.max,
+                'buckets': {str(bucket): count for bucket, count in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['count'], data['total'], data['max'],
+                   {int(bucket): count for bucket, count in data['buckets'].items()})
+
+# operation -> {'wall' or phase: Histogram, counter: total}
+_stats = {}
+_lock = threading.Lock()
+_local = threading.local()
+_last_flush = time.monotonic()
+_profiles = 0
+
+def _empty_stats():
+    return {'wall': Histogram(), **{phase: Histogram() for phase in PHASES}, **{counter: 0 for counter in COUNTERS}}
+
+def _operation_stats(operation):
+    stats = _stats.get(operation)
+    if stats is None:
+        stats = _stats[operation] = _empty_stats()
+    return stats
+
+def _current():
+    return getattr(_local, 'operation', None)
+
+# Called by the storage code
+def add_time(phase, seconds):
+    current = _current()
+    if current is not None:
+        current[phase] += seconds
+    else:
+        with _lock:
+            _operation_stats(OUTSIDE)[phase].add(seconds)
+
+def add_count(counter, amount):
+    current = _current()
+    if current is not None:
+        current[counter] += amount
+    else:
+        with _lock:
+            _operation_stats(OUTSIDE)[counter] += amount
+
+@contextmanager
+def measure(phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(phase, time.perf_counter() - started)
+
+def _profile_path(name):
+    global _profiles
+    _profiles += 1
+    return os.path.join(config.PROFILE_DIR, f"{name}-{os.getpid()}-{_profiles}.prof")
+
+def instrumented(operation):
+    name = operation.__name__
+
+    @functools.wraps(operation)
+    def wrapper(*args, **kwargs):
+        # operations calling other operations are counted once, as the outer one
+        if _current() is not None:
+            return operation(*args, **kwargs)
+        current = dict.fromkeys(PHASES + COUNTERS, 0)
+        _local.operation = current
+        profiler = None
+        if config.PROFILE_DIR:
+            import cProfile
+            profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            if profiler is None:
+                return operation(*args, **kwargs)
+            return profiler.runcall(operation, *args, **kwargs)
+        finally:
+            wall = time.perf_counter() - started
+            _local.operation = None
+            with _lock:
+                stats = _operation_stats(name)
+                stats['wall'].add(wall)
+                for phase in PHASES:
+                    stats[phase].add(current[phase])
+                for counter in COUNTERS:
+                    stats[counter] += current[counter]
+            if profiler is not None:
+                os.makedirs(config.PROFILE_DIR, exist_ok=True)
+                profiler.dump_stats(_profile_path(name))
+            if time.monotonic() - _last_flush >= config.STATS_FLUSH_INTERVAL:
+                flush()
+    return wrapper
+
+def _read_stats(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        data = json.load(file)
+    return {operation: {key: Histogram.from_dict(value) if isinstance(value, dict) else value
+                        for key, value in stats.items()}
+            for operation, stats in data.items()}
+
+# Stats of every process that flushed into path, plus this one's unflushed ones
+def load_stats(path=None):
+    path = path or config.STATS_PATH
+    with file_lock(lock_path(path), shared=True):
+        merged = _read_stats(path)
+    with _lock:
+        _merge(merged, _stats)
+    return merged
+
+def _merge(into, stats):
+    for operation, values in stats.items():
+        target = into.setdefault(operation, _empty_stats())
+        for key, value in values.items():
+            if isinstance(value, Histogram):
+                target[key].merge(value)
+            else:
+                target[key] += value
+
+# Adds this process's aggregates to the stats file and starts over
+def flush(path=None):
+    global _stats, _last_flush
+    path = path or config.STATS_PATH
+    with _lock:
+        stats, _stats = _stats, {}
+        _last_flush = time.monotonic()
+    if not stats:
+        return
+    try:
+        with file_lock(lock_path(path)):
+            merged = _read_stats(path)
+            _merge(merged, stats)
+            data = {operation: {key: value.to_dict() if isinstance(value, Histogram) else value
+                                for key, value in values.items()}
+                    for operation, values in merged.items()}
+            atomic_write(path, lambda file: json.dump(data, file))
+    except (OSError, ValueError) as error:
+        get_logger().warning(f"Could not write operation stats to {path}: {error}")
+
+atexit.register(flush)
@@ -0,0 +1,178 @@
+import atexit
+import json
+import os
+import time
+import config
+from instrumentation import add_count, add_time, measure
+
+# Mutation record types. Every change to users.json / projects.json is
+# written as one of these instead of rewriting the whole file.
+USER_CREATED = 'user_created'
+PROJECT_CREATED = 'project_created'
+PROJECT_DELETED = 'project_deleted'
+MEMBER_ADDED = 'member_added'
+MEMBER_REMOVED = 'member_removed'
+DUTY_CREATED = 'duty_created'
+DUTY_ASSIGNED = 'duty_assigned'
+DUTY_UNASSIGNED = 'duty_unassigned'
+DUTY_UPDATED = 'duty_updated'
+STATUS_CHANGED = 'status_changed'
+# Duties moved to the project's cold segments (see archive.py)
+DUTIES_ARCHIVED = 'duties_archived'
+# Only in the sharded manifest: the usernames assigned to a project's duties,
+# and how many of its duties have each status and priority
+ASSIGNEES_CHANGED = 'assignees_changed'
+COUNTS_CHANGED = 'counts_changed'
+
+# Record types that only set fields on an existing duty
+DUTY_FIELD_RECORDS = (DUTY_ASSIGNED, DUTY_UNASSIGNED, DUTY_UPDATED, STATUS_CHANGED)
+
+def journal_path(file_path):
+    return os.path.splitext(file_path)[0] + '.journal'
+
+# Yields (record, offset after the record). A trailing line without a newline
+# is a write still in progress (or cut short by a crash) and is left alone.
+def read_journal(path, offset=0):
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    start = offset
+    records = 0
+    parse_time = 0.0
+    try:
+        with file:
+            file.seek(offset)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    return
+                offset += len(line)
+                started = time.perf_counter()
+                record = json.loads(line)
+                parse_time += time.perf_counter() - started
+                records += 1
+                yield record, offset
+    finally:
+        add_time('parse', parse_time)
+        add_count('bytes_read', offset - start)
+        add_count('records_scanned', records)
+
+# Applying a record is idempotent, so replaying records that are already part
+# of the snapshot (a crash between writing the snapshot and truncating the
+# journal) gives the same state.
+def apply_user_mutation(users, users_by_name, record):
+    if record['type'] == USER_CREATED:
+        user = record['user']
+        if user['username'] not in users_by_name:
+            users.append(user)
+            users_by_name[user['username']] = user
+
+def apply_project_mutation(projects, projects_by_id, record):
+    kind = record['type']
+    if kind == PROJECT_CREATED:
+        project = record['project']
+        if project['ID'] not in projects_by_id:
+            projects.append(project)
+            projects_by_id[project['ID']] = project
+        return
+
+    project = projects_by_id.get(record['project_id'])
+    if project is None:
+        return
+    if 'version' in record:
+        project['Version'] = record['version']
+
+    if kind == PROJECT_DELETED:
+        projects.remove(project)
+        del projects_by_id[project['ID']]
+        # a later project reusing the same ID becomes the one lookups find
+        duplicate = next((p for p in projects if p['ID'] == project['ID']), None)
+        if duplicate is not None:
+            projects_by_id[project['ID']] = duplicate
+    elif kind == MEMBER_ADDED:
+        if record['username'] not in project['Members']:
+            project['Members'].append(record['username'])
+    elif kind == MEMBER_REMOVED:
+        if record['username'] in project['Members']:
+            project['Members'].remove(record['username'])
+    elif kind == DUTY_CREATED:
+        duty = record['duty']
+        if not any(d['ID'] == duty['ID'] for d in project['Duties']):
+            project['Duties'].append(duty)
+    elif kind in DUTY_FIELD_RECORDS:
+        duty = next((d for d in project['Duties'] if d['ID'] == record['duty_id']), None)
+        if duty is not None:
+            duty.update(record['fields'])
+    elif kind == DUTIES_ARCHIVED:
+        archived = set(record['duty_ids'])
+        project['Duties'][:] = [d for d in project['Duties'] if d['ID'] not in archived]
+    elif kind == ASSIGNEES_CHANGED:
+        project['Assignees'] = list(record['assignees'])
+    elif kind == COUNTS_CHANGED:
+        project['Counts'] = record['counts']
+
+# The journal lines of records
+def encode_records(records):
+    with measure('serialize'):
+        return ''.join(json.dumps(record) + '\n' for record in records).encode()
+
+# Journals with an open descriptor, closed (and so synced) when the process
+# exits. A journal is only held here while it is open, so the ones a
+# long-running process drops along the way (closed shards, the stores
+# compaction throws away) are not kept alive.
+_open_journals = set()
+
+def _close_open_journals():
+    for journal in list(_open_journals):
+        journal.close()
+
+atexit.register(_close_open_journals)
+
+# Appends records to a journal file. Each append is a single os.write() on an
+# O_APPEND descriptor, so its records land as whole lines. fsync is batched: it
+# runs every JOURNAL_FSYNC_EVERY records or JOURNAL_FSYNC_INTERVAL seconds,
+# and once more when the journal is closed, at the latest when the process
+# exits.
+class Journal:
+    def __init__(self, path):
+        self._path = path
+        self._fd = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def get_path(self):
+        return self._path
+
+    def append(self, record):
+        return self.append_all([record])
+
+    # Several records in a single write, e.g. a bulk import
+    def append_all(self, records):
+        return self.append_encoded(encode_records(records), len(records))
+
+    # count records already turned into lines by encode_records()
+    def append_encoded(self, data, count):
+        with measure('disk'):
+            if self._fd is None:
+                self._fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                _open_journals.add(self)
+            written = os.write(self._fd, data)
+            self._pending += count
+            if (self._pending >= config.JOURNAL_FSYNC_EVERY
+                    or time.monotonic() - self._last_sync >= config.JOURNAL_FSYNC_INTERVAL):
+                self.sync()
+        add_count('bytes_written', written)
+        return written
+
+    def sync(self):
+        if self._fd is not None and self._pending:
+            os.fsync(self._fd)
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._fd is not None:
+            self.sync()
+            os.close(self._fd)
+            self._fd = None
+            _open_journals.discard(self)
@@ -0,0 +1,46 @@
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+
+# Advisory fcntl locks shared by every process working on the same data
+# files. Lock files live in a .locks directory next to the data they guard.
+
+class ConflictError(Exception):
+    pass
+
+def lock_path(file_path, name=None):
+    directory = os.path.join(os.path.dirname(file_path), '.locks')
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    if name is None:
+        return os.path.join(directory, f"{stem}.lock")
+    # project IDs are user input, so they are hashed into a safe file name
+    digest = hashlib.sha1(str(name).encode()).hexdigest()
+    return os.path.join(directory, f"{stem}-{digest}.lock")
+
+@contextmanager
+def file_lock(path, shared=False):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        # closing the descriptor releases the lock
+        os.close(fd)
+
+# Writes a file through a temporary file and a rename, so readers see either
+# the old contents or the new ones, never a half-written file. sync=False
+# skips the fsync, for files that can be rebuilt after a crash.
+def atomic_write(path, write, mode='w', sync=True):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, mode) as file:
+            write(file)
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
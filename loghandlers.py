@@ -0,0 +1,109 @@
+import json
+import logging
+import logging.handlers
+import queue
+import time
+import config
+
+# The pieces of the logging pipeline set up by applog.get_logger(). They are
+# kept out of applog.py so importing it does not import logging.
+
+# extra= keys copied into the JSON records
+FIELDS = ('project_id', 'duty_id', 'username', 'operation')
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%d %H:%M:%S'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+# A RotatingFileHandler that keeps formatted lines in memory until flush(),
+# so a burst of records costs one write instead of one per record
+class BatchingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    def __init__(self, filename, max_bytes, backups, batch_size):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backups, delay=True)
+        self._batch_size = batch_size
+        self._lines = []
+        self._pending = 0
+
+    def emit(self, record):
+        try:
+            line = self.format(record) + self.terminator
+        except Exception:
+            self.handleError(record)
+            return
+        self._lines.append(line)
+        self._pending += len(line.encode())
+        if len(self._lines) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self._lines:
+                return
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0 and self.stream.tell() and self.stream.tell() + self._pending > self.maxBytes:
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+            self.stream.write(''.join(self._lines))
+            self.stream.flush()
+            self._lines = []
+            self._pending = 0
+
+    def close(self):
+        self.flush()
+        super().close()
+
+# Drops records instead of blocking the caller when the writer falls behind;
+# the number dropped is logged once the queue has room again
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.dropped:
+            notice = logging.makeLogRecord({
+                'name': record.name, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"{self.dropped} log records were dropped, the log writer fell behind.",
+            })
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                self.dropped += 1
+                return
+            self.dropped = 0
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+# Writes whatever the queue holds, then flushes once it is empty (or a
+# batch is full, see BatchingRotatingFileHandler.emit) or the last flush is
+# LOG_FLUSH_INTERVAL seconds old
+class BatchingQueueListener(logging.handlers.QueueListener):
+    def __init__(self, log_queue, handler):
+        super().__init__(log_queue, handler, respect_handler_level=True)
+        self._last_flush = time.monotonic()
+
+    def handle(self, record):
+        super().handle(record)
+        if self.queue.empty() or time.monotonic() - self._last_flush >= config.LOG_FLUSH_INTERVAL:
+            for handler in self.handlers:
+                handler.flush()
+            self._last_flush = time.monotonic()
+
+    def enqueue_sentinel(self):
+        # wait for room, the records before it must still be written
+        self.queue.put(self._sentinel)
@@ -1,863 +1,418 @@
-import email
-import json
-import os
-import hashlib
 from datetime import datetime, timedelta
-from enum import Enum
-from typing import List
-from rich.console import Console
-from rich.prompt import Prompt
-from rich.table import Table
-from rich import print
-import logging
-import re
-
-def validate_email(email):
-    pattern = r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$"
-    if re.match(pattern, email):
-        return True
-    else:
-        return False
-
-# Configure logging
-logging.basicConfig(filename='project_log.log', level=logging.INFO, 
-                    format='%(asctime)s - %(levelname)s - %(message)s')
-
-# enum for Priority
-class Priority(Enum):
-    CRITICAL = "CRITICAL"
-    HIGH = "HIGH"
-    MEDIUM = "MEDIUM"
-    LOW = "LOW"
-
-# enum for Status
-class Status(Enum):
-    BACKLOG = "BACKLOG"
-    TODO = "TODO"
-    DOING = "DOING"
-    DONE = "DONE"
-    ARCHIVED = "ARCHIVED"
-
-class User:
-    def __init__(self, U, P, E):
-        self._username = U
-        self._password = P
-        self._emailaddress = E
-        self._active = True
-
-    def get_username(self):
-        return self._username
-
-    def get_password(self):
-        return self._password
-
-    def get_emailaddress(self):
-        return self._emailaddress
-
-    def is_active(self):
-        return self._active
-
-    def set_username(self, U):
-        self._username = U
-
-    def set_password(self, P):
-        self._password = P
-
-    def set_emailaddress(self, E):
-        self._emailaddress = E
-
-    def set_active(self, A):
-        self._active = A
-
-    def login(self, U, P):
-        return self._username == U and self._password == hashed_password(P)
-
-    def disable(self):
-        self._active = False
-
-    def to_dict(self):
-        return {
-            "username": self._username,
-            "password": self._password,
-            "emailaddress": self._emailaddress,
-            "active": self._active
-        }
-
-class Duty:
-    def __init__(self, Id, title: str, detail: str, assignees: List[User], assigned_to: User = None):
-        self._ID = Id
-        self._Title = title
-        self._Detail = detail
-        self._ST = datetime.now()
-        self._FT = self._ST + timedelta(hours=24)
-        self._Priority = Priority.LOW
-        self._Status = Status.BACKLOG
-        self._Assignees = assignees
-        self._AssignedTo = assigned_to
-
-    def get_ID(self):
-        return self._ID
-
-    def get_title(self):
-        return self._Title
-
-    def get_detail(self):
-        return self._Detail
-
-    def get_st(self):
-        return self._ST
-
-    def get_ft(self):
-        return self._FT
-
-    def get_priority(self):
-        return self._Priority
-
-    def get_status(self):
-        return self._Status
-
-    def get_assignees(self):
-        return self._Assignees
-
-    def get_assigned_to(self):
-        return self._AssignedTo
-
-    def set_ID(self, Id):
-        self._ID = Id
-
-    def set_title(self, title):
-        self._Title = title
-
-    def set_detail(self, detail):
-        self._Detail = detail
-
-    def set_st(self, value):
-        self._ST = value
-
-    def set_ft(self, value):
-        self._FT = value
-
-    def set_priority(self, value: Priority):
-        self._Priority = value
-
-    def set_status(self, value: Status):
-        self._Status = value
-
-    def set_assignees(self, value: List[User]):
-        self._Assignees = value
-
-    def set_assigned_to(self, user: User):
-        self._AssignedTo = user
-
-    def add_assignee(self, user: User):
-        if user not in self._Assignees:
-            self._Assignees.append(user)
-
-    def delete_assignee(self, user: User):
-        if user in self._Assignees:
-            self._Assignees.remove(user)
-
-class Project:
-    def __init__(self, Id, T, leader, members: List[User] = [], duties: List[Duty] = []):
-        self._ID = Id
-        self._Title = T
-        self._Leader = leader
-        self._Members = members
-        self._Duties = duties
-
-    def get_id(self):
-        return self._ID
-
-    def get_T(self):
-        return self._Title
-
-    def get_leader(self):
-        return self._Leader
-
-    def get_members(self):
-        return self._Members
-
-    def get_duties(self):
-        return self._Duties
-
-    def set_ID(self, Id):
-        self._ID = Id
-
-    def set_Title(self, T):
-        self._Title = T
-
-    def set_Leader(self, leader):
-        self._Leader = leader
-
-    def set_Members(self, members: List[User]):
-        self._Members = members
-
-    def set_duties(self, duties: List[Duty]):
-        self._Duties = duties
-
-    def add_duty(self, Id, title: str, detail: str, assignees: List[User]):
-        new_duty = Duty(Id, title, detail, assignees)
-        self._Duties.append(new_duty)
-        logging.info(f"Duty '{title}' added to project '{self._Title}'.")
-        return new_duty
-
-    def add_member(self, user: User):
-        if user not in self._Members:
-            self._Members.append(user)
-            logging.info(f"User '{user.get_username()}' added to project '{self._Title}'.")
-
-    def remove_member(self, user: User):
-        if user in self._Members:
-            self._Members.remove(user)
-        logging.info(f"User '{user.get_username()}' removed from project '{self._Title}'.")
-
-    def delete_project(self):
-        logging.info(f"Project '{self._Title}' deleted.")
-        pass
-
-    def assign_duty(self, duty_id, username):
-        for duty in self._Duties:
-            if duty.get_ID() == duty_id:
-                assignee = next((member for member in self._Members if member.get_username() == username), None)
-                if assignee:
-                    duty.set_assigned_to(assignee)
-                    logging.info(f"Duty '{duty.get_title()}' assigned to '{username}' in project '{self._Title}'.")
-                    print(f"[green]Duty '{duty.get_title()}' assigned to '{username}' successfully.[/green]")
-                else:
-                    logging.error(f"Error! User '{username}' is not a member of the project '{self._Title}'.")
-                    print(f"[red]Error! User '{username}' is not a member of this project.[/red]")
-                return
-            logging.error(f"Error! Duty with ID '{duty_id}' not found in project '{self._Title}'.")
-        print(f"[red]Error! Duty with ID '{duty_id}' not found.[/red]")
-
-    def unassign_duty(self, duty_id):
-        for duty in self._Duties:
-            if duty.get_ID() == duty_id:
-                duty.set_assigned_to(None)
-                logging.info(f"Duty '{duty.get_title()}' unassigned in project '{self._Title}'.")
-                print(f"[green]Duty '{duty.get_title()}' unassigned successfully.[/green]")
-                return
-            logging.error(f"Error! Duty with ID '{duty_id}' not found in project '{self._Title}'.")
-        print(f"[red]Error! Duty with ID '{duty_id}' not found.[/red]")
-
-    def print_duties(self):
-        console = Console()
-        table = Table(title="Project Duties")
-
-        table.add_column("ID", justify="center", style="cyan", no_wrap=True)
-        table.add_column("Title", style="magenta")
-        table.add_column("Detail", style="green")
-        table.add_column("Start Time", justify="center", style="yellow")
-        table.add_column("Status", justify="center", style="red")
-
-        for duty in self._Duties:
-            table.add_row(
-                duty.get_ID(),
-                duty.get_title(),
-                duty.get_detail(),
-                duty.get_st().strftime("%Y-%m-%d %H:%M:%S"),
-                duty.get_status().value
-            )
-
-        console.print(table)
-
-def LoadUsers(file_path='users.json'):
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as file:
-            users = json.load(file)
-            for user in users:
-                if 'role' not in user:
-                    user['role'] = ''
-            return users
-    return []
-
-def SaveUsers(users, file_path='users.json'):
-    with open(file_path, 'w') as file:
-        json.dump(users, file, indent=4)
-
-def LoadProjects(file_path='projects.json'):
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as file:
-            return json.load(file)
-    return []
-
-def SaveProjects(projects, file_path='projects.json'):
-    with open(file_path, 'w') as file:
-        json.dump(projects, file, indent=4)
-
-def hashed_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def create_an_account(username, emailaddress, password):
-    users = LoadUsers()
-    for user in users:
-        if user['username'] == username or user['emailaddress'] == emailaddress:
-            print("[red]Error! Username or email already exists.[/red]")
-            return
-
-    new_user = {'username': username, 'emailaddress': emailaddress, 'password': hashed_password(password)}
-    users.append(new_user)
-    SaveUsers(users)
-    print("[green]Account created successfully![/green]")
-    logging.info(f"Account created for user '{username}'.")
-
-def login_user(username, password):
-    users = LoadUsers()
-    for user in users:
-        if user['username'] == username:
-            if hashed_password(password) == user['password']:
-                print("[green]Login successful[/green]")
-                return User(user['username'], user['password'], user['emailaddress'])
-            else:
-                print("[red]Error! Invalid password[/red]")
-                return None
-    print("[red]Error! Invalid username or password.[/red]")
-    return None
-
-def create_project(ID, Title,username):
-    projects = LoadProjects()
-    for project in projects:
-        if project['ID'] == ID:
-            print("[red]Error! Project ID already exists.[/red]")
+from itertools import islice
+import config
+from core import (Priority, Status, User, Duty, Project, intern_user, validate_email, hashed_password,
+                  retry_on_conflict, print, _username_of, get_repository, create_an_account,
+                  login_user, create_project, create_a_new_project, create_duty, OPEN_STATUSES, query_duties,
+                  search_duties, overdue_duties, duties_due_soon, duty_history, duty_as_of,
+                  add_member_to_project, remove_member_from_project, add_duty_to_project, delete_project,
+                  assign_duty_to_member, unassign_duty_from_member, assign_duty_to_user, unassign_duty_from_user,
+                  update_duty_details, create_duty_in_project)
+from applog import get_logger
+from instrumentation import instrumented
+
+# The terminal interface: menus, prompts and paged tables over the
+# operations in core.py, which are re-exported here for existing callers.
+# rich is imported when the first table or prompt is shown.
+
+def _ask(prompt, **kwargs):
+    from rich.prompt import Prompt
+    return Prompt.ask(prompt, **kwargs)
+
+# Asks until parse accepts the answer, which it signals by not raising
+# ValueError. A blank answer is None.
+def _input_parsed(prompt, parse):
+    while True:
+        answer = input(prompt).strip()
+        if not answer:
+            return None
+        try:
+            return parse(answer)
+        except ValueError as error:
+            print(f"[red]Invalid input ({error}). Please try again.[/red]")
+
+# Parses a number of hours into a timedelta
+def _hours(answer):
+    try:
+        return timedelta(hours=float(answer))
+    except OverflowError:
+        raise ValueError(f"{answer} hours is too long")
+
+# Parses a comma separated list of the names of enum's members
+def _enum_names(enum, answer):
+    names = [name.strip().upper() for name in answer.split(',')]
+    unknown = [name for name in names if name not in enum.__members__]
+    if unknown:
+        raise ValueError(f"{', '.join(unknown)} is not one of {'/'.join(enum.__members__)}")
+    return [enum[name] for name in names]
+
+# Tables are printed a page at a time from a generator of rows, so the
+# first rows show up before the rest are even read and memory does not grow
+# with the number of rows. Columns are (header, Table.add_column options).
+def _new_table(title, columns):
+    from rich.table import Table
+    table = Table(title=title)
+    for header, options in columns:
+        table.add_column(header, **options)
+    return table
+
+def _pages(rows, page_size):
+    rows = iter(rows)
+    while True:
+        page = list(islice(rows, page_size))
+        if not page:
             return
-    users = LoadUsers()
-    for user in users:
-        if user['username'] == username:
-            leader = User(user['username'], user['password'], user['emailaddress'])
-            new_project = {'ID': ID, 'Title': Title, 'Leader': username, 'Members': [username], 'Duties': []}
-            projects.append(new_project)
-            SaveProjects(projects)
-            print("[green]Project created successfully![/green]")
+        yield page
+
+# Prints every page, or only the given one (numbered from 1). Returns the
+# number of rows printed.
+def print_paged(title, columns, rows, page=None, page_size=None):
+    page_size = page_size or config.PAGE_SIZE
+    first = page or 1
+    if page is not None:
+        rows = islice(rows, (page - 1) * page_size, page * page_size)
+    printed = 0
+    for number, rows_of_page in enumerate(_pages(rows, page_size), start=first):
+        table = _new_table(title if number == 1 else f"{title} (page {number})", columns)
+        for row in rows_of_page:
+            table.add_row(*row)
+        print(table)
+        printed += len(rows_of_page)
+    if printed == 0:
+        print(_new_table(title if first == 1 else f"{title} (page {first})", columns))
+    return printed
+
+# Shows one page at a time with next/previous prompts. make_rows is called
+# for every page, so each page reflects the current data.
+def browse_pages(title, columns, make_rows, page_size=None):
+    page_size = page_size or config.PAGE_SIZE
+    page = 1
+    while True:
+        printed = print_paged(title, columns, make_rows(), page, page_size)
+        choices = ['q']
+        if printed == page_size:
+            choices.insert(0, 'n')
+        if page > 1:
+            choices.insert(0, 'p')
+        choice = _ask("[bold yellow]n = next page, p = previous page, q = back[/bold yellow]",
+                            choices=choices, default='q')
+        if choice == 'n':
+            page += 1
+        elif choice == 'p':
+            page -= 1
+        else:
             return
 
-    print("[red]Error! Leader not found.[/red]")
-
-def create_a_new_project(title, leader):
-    projects = LoadProjects()
-    users = LoadUsers()
-
-    project_id = str(len(projects) + 1)
-    leader_obj = next((user for user in users if user['username'] == leader), None)
-    if not leader_obj:
-        print("[red]Error! Leader username not found.[/red]")
-        logging.error(f"Error! Leader username '{leader}' not found.")
-        return
-
-    new_project = {
-        'ID': project_id,
-        'Title': title,
-        'Leader': leader,
-        'Members': [],
-        'Duties': []
-    }
-    projects.append(new_project)
-    SaveProjects(projects)
-    print("[green]Project created successfully![/green]")
-    logging.info(f"Project '{title}' created with leader '{leader}'.")
-
-def print_projects():
-    projects = LoadProjects()
-    console = Console()
-    table = Table(title="Projects")
-
-    table.add_column("ID", justify="center", style="cyan", no_wrap=True)
-    table.add_column("Title", style="magenta")
-    table.add_column("Leader", style="green")
-    table.add_column("Members", style="yellow")
-
-    for project in projects:
-        member_names = ", ".join([member['username'] for member in project['Members']])
-        table.add_row(
-            project['ID'],
-            project['Title'],
-            project['Leader']['username'],
-            member_names
-        )
-
-    console.print(table)
-
-def create_duty(project_id, duty_id, title, detail, assignees_usernames):
-    projects = LoadProjects()
-    users = LoadUsers()
-
-    project = next((proj for proj in projects if proj['ID'] == project_id), None)
-    if not project:
-        print(f"[red]Error! Project with ID '{project_id}' not found.[/red]")
-        return
-
-    assignees = [User(user['username'], user['password'], user['emailaddress']) for user in users if user['username'] in assignees_usernames]
-
-    if len(assignees) != len(assignees_usernames):
-        print("[red]Error! One or more assignees not found.[/red]")
-        return
-
-    if any(duty['ID'] == duty_id for duty in project['Duties']):
-        print(f"[red]Error! Duty with ID '{duty_id}' already exists in project '{project_id}'.[/red]")
-        return
+def _show(title, columns, make_rows, page, page_size, interactive):
+    if interactive:
+        browse_pages(title, columns, make_rows, page_size)
+    else:
+        print_paged(title, columns, make_rows(), page, page_size)
+
+PROJECT_COLUMNS = [
+    ("ID", {'justify': "center", 'style': "cyan", 'no_wrap': True}),
+    ("Title", {'style': "magenta"}),
+    ("Leader", {'style': "green"}),
+]
+
+PROJECT_MEMBER_COLUMNS = PROJECT_COLUMNS + [("Members", {'style': "yellow"})]
+
+USER_COLUMNS = [
+    ("Username", {'style': "cyan"}),
+    ("Email Address", {'style': "magenta"}),
+    ("Role", {'style': "green"}),
+]
+
+DUTY_COLUMNS = [
+    ("ID", {'justify': "center", 'style': "cyan", 'no_wrap': True}),
+    ("Title", {'style': "magenta"}),
+    ("Detail", {'style': "green"}),
+    ("Start Time", {'justify': "center", 'style': "yellow"}),
+    ("End Time", {'justify': "center", 'style': "yellow"}),
+    ("Status", {'justify': "center", 'style': "red"}),
+    ("Priority", {'justify': "center", 'style': "red"}),
+]
+
+@instrumented
+def print_projects(page=None, page_size=None, interactive=False):
+    def rows():
+        for project in get_repository().iter_project_summaries():
+            member_names = ", ".join([_username_of(member) for member in project['Members']])
+            yield project['ID'], project['Title'], _username_of(project['Leader']), member_names
+
+    _show("Projects", PROJECT_MEMBER_COLUMNS, rows, page, page_size, interactive)
+
+@instrumented
+def list_projects(page=None, page_size=None, interactive=False):
+    def rows():
+        for project in get_repository().iter_project_summaries():
+            yield project['ID'], project['Title'], _username_of(project['Leader'])
+
+    _show("Projects List", PROJECT_COLUMNS, rows, page, page_size, interactive)
+
+@instrumented
+def list_users(page=None, page_size=None, interactive=False):
+    def rows():
+        for user in get_repository().iter_users():
+            yield user['username'], user['emailaddress'], user['role']
+
+    _show("Users List", USER_COLUMNS, rows, page, page_size, interactive)
+
+QUERY_COLUMNS = [
+    ("Project", {'justify': "center", 'style': "cyan", 'no_wrap': True}),
+    ("ID", {'justify': "center", 'style': "cyan", 'no_wrap': True}),
+    ("Title", {'style': "magenta"}),
+    ("Assigned To", {'style': "green"}),
+    ("End Time", {'justify': "center", 'style': "yellow"}),
+    ("Status", {'justify': "center", 'style': "red"}),
+    ("Priority", {'justify': "center", 'style': "red"}),
+]
+
+def print_query_results(results, page=None, page_size=None, interactive=False, title="Duties"):
+    def rows():
+        for project_id, duty in results:
+            yield (
+                project_id,
+                duty['ID'],
+                duty['Title'],
+                _username_of(duty.get('AssignedTo') or duty.get('Assigned To')) or '',
+                _stored_field(duty, 'FT', 'FinishTime', 'End Time'),
+                duty['Status'],
+                duty['Priority']
+            )
 
-    new_duty = Duty(duty_id, title, detail, assignees)
-    project['Duties'].append({
-        'ID': new_duty.get_ID(),
-        'Title': new_duty.get_title(),
-        'Detail': new_duty.get_detail(),
-        'StartTime': new_duty.get_st().strftime("%Y-%m-%d %H:%M:%S"),
-        'FinishTime': new_duty.get_ft().strftime("%Y-%m-%d %H:%M:%S"),
-        'Priority': new_duty.get_priority().value,
-        'Status': new_duty.get_status().value,
-        'Assignees': [assignee.to_dict() for assignee in new_duty.get_assignees()],
-        'AssignedTo': new_duty.get_assigned_to().to_dict() if new_duty.get_assigned_to() else None
-    })
-    SaveProjects(projects)
-    print("[green]Duty created successfully![/green]")
-
-def list_projects():
-    projects = LoadProjects()
-    console = Console()
-    table = Table(title="Projects List")
-
-    table.add_column("ID", justify="center", style="cyan", no_wrap=True)
-    table.add_column("Title", style="magenta")
-    table.add_column("Leader", style="green")
-
-    for project in projects:
-        table.add_row(project['ID'], project['Title'], project['Leader'])
-
-    console.print(table)
-
-def list_users():
-    users = LoadUsers()
-    console = Console()
-    table = Table(title="Users List")
-
-    table.add_column("Username", style="cyan")
-    table.add_column("Email Address", style="magenta")
-    table.add_column("Role", style="green")
-
-    for user in users:
-        table.add_row(user['username'], user['emailaddress'], user['role'])
-
-    console.print(table)
-
-#To add a member to a project
-def add_member_to_project(project_id, username):
-    projects = LoadProjects()
-    users = LoadUsers()
-   
-    for project in projects:
-        if project['ID'] == project_id:
-            user_to_add = next((u for u in users if u['username'] == username), None)
-            if not user_to_add:
-                print(f"Error User '{username}' not found.")
-                return
-            if username in [member['username'] for member in project['Members']]:
-                print("[red]Error User is already a member of this project.[/red]")
-                return
-            project['Members'].append(username)
-            SaveProjects(projects)
-            print(f"Member {username} added to project {project_id}.")
-            return
-    print(f"Error Project with ID '{project_id}' not found.")
-    user_to_add = next((u for u in users if u['username'] == username), None)
-    if not project:
+    _show(title, QUERY_COLUMNS, rows, page, page_size, interactive)
+
+SEARCH_COLUMNS = [
+    ("Project", {'justify': "center", 'style': "cyan", 'no_wrap': True}),
+    ("ID", {'justify': "center", 'style': "cyan", 'no_wrap': True}),
+    ("Title", {'style': "magenta"}),
+    ("Status", {'justify': "center", 'style': "red"}),
+    ("Score", {'justify': "right", 'style': "yellow"}),
+]
+
+# Project matches show the project title and no duty ID
+def print_search_results(results):
+    def rows():
+        repo = get_repository()
+        for project_id, duty, score in results:
+            if duty is None:
+                project = repo.get_project(project_id)
+                yield project_id, '', project['Title'] if project else '', '', f"{score:.2f}"
+            else:
+                yield project_id, duty['ID'], duty['Title'], duty['Status'], f"{score:.2f}"
+
+    print_paged("Search Results", SEARCH_COLUMNS, rows())
+
+BOARD_COLUMNS = [
+    ("ID", {'justify': "center", 'style': "cyan", 'no_wrap': True}),
+    ("Title", {'style': "magenta"}),
+    ("Priority", {'justify': "center", 'style': "red"}),
+    ("Assigned To", {'style': "green"}),
+    ("End Time", {'justify': "center", 'style': "yellow"}),
+]
+
+def _column_total(counts, status):
+    return sum(counts.get(status.value, {}).values())
+
+# "CRITICAL: 2" lines of a board column, in Priority order
+def _priority_breakdown(by_priority):
+    known = [priority.value for priority in Priority]
+    ordered = [p for p in known if p in by_priority] + [p for p in by_priority if p not in known]
+    return '\n'.join(f"{priority}: {by_priority[priority]}" for priority in ordered)
+
+# A Kanban board: a header with the number of duties in each status column
+# and their priorities, taken from the repository's counters, then a page
+# (the first unless page is given) of each column's duties. Interactively,
+# a column can then be browsed page by page.
+@instrumented
+def print_board(project_id, page=None, page_size=None, interactive=False):
+    board = get_repository().get_board(project_id)
+    if not board:
         print("[red]Error! Project ID not found.[/red]")
-        logging.error(f"Error! Project ID '{project_id}' not found.")
-        return
-    
-    if not user_to_add:
-        print(f"Error! User '{username}' not found.")
-        logging.error(f"Error! Username '{username}' not found.")
-        return
-    if username in project['Members']:
-        print("[red]Error! User is already a member of this project.[/red]")
-        logging.error(f"Error! User '{username}' is already a member of project '{project['Title']}'.")
         return
-
-    project['members'].append(username)
-    print(f"Member {username} added to project {project_id}.")
-    SaveProjects(projects)
-    print("[green]Member added to project successfully![/green]")
-    logging.info(f"User '{username}' added to project '{project['Title']}'.")
-
-    for project in projects:
-        if project['ID'] == project_id:
-            if any(member['username'] == username for member in project['Members']):
-                print(f"[bold white]Error! User '{username}' is already a member of the project![/bold white]")
-                return
-            project['Members'].append(user_to_add)
-            SaveProjects(projects)
-            print(f"User '{username}' added to project '{project['Title']}' successfully.")
+    counts = board['Counts']
+    header = _new_table(f"Board - {board['Title']}",
+                        [(f"{status.value} ({_column_total(counts, status)})", {'justify': "center", 'style': "red"})
+                         for status in Status])
+    header.add_row(*(_priority_breakdown(counts.get(status.value, {})) for status in Status))
+    print(header)
+
+    def column_rows(status):
+        def rows():
+            for duty in get_repository().iter_duties(project_id, status.value):
+                yield (
+                    duty['ID'],
+                    duty['Title'],
+                    duty['Priority'],
+                    _username_of(duty.get('AssignedTo') or duty.get('Assigned To')) or '',
+                    _stored_field(duty, 'FT', 'FinishTime', 'End Time')
+                )
+        return rows
+
+    for status in Status:
+        if _column_total(counts, status):
+            print_paged(f"{status.value} ({_column_total(counts, status)})", BOARD_COLUMNS,
+                        column_rows(status)(), page or 1, page_size)
+    while interactive:
+        column = input("Browse a column (BACKLOG/TODO/DOING/DONE/ARCHIVED, or leave blank to go back): ").strip().upper()
+        if not column:
             return
+        if column not in Status.__members__:
+            print("[red]Error! Unknown status.[/red]")
+            continue
+        status = Status[column]
+        browse_pages(f"{status.value} ({_column_total(counts, status)})", BOARD_COLUMNS, column_rows(status), page_size)
+
+SUMMARY_COLUMNS = [
+    ("Project", {'justify': "center", 'style': "cyan", 'no_wrap': True}),
+    ("Title", {'style': "magenta"}),
+] + [(status.value, {'justify': "right", 'style': "red"}) for status in Status] + [
+    ("Total", {'justify': "right", 'style': "yellow"}),
+]
+
+# Duties per status of every project, and of all of them together, from the
+# repository's counters
+@instrumented
+def print_board_summary(page=None, page_size=None, interactive=False):
+    boards = get_repository().get_board_summary()
+
+    def rows():
+        for board in boards:
+            totals = [_column_total(board['Counts'], status) for status in Status]
+            yield (board['ID'], board['Title'], *map(str, totals), str(sum(totals)))
+
+    _show("Board Summary", SUMMARY_COLUMNS, rows, page, page_size, interactive)
+    totals = [sum(_column_total(board['Counts'], status) for board in boards) for status in Status]
+    table = _new_table(f"All {len(boards)} projects", SUMMARY_COLUMNS[2:])
+    table.add_row(*map(str, totals), str(sum(totals)))
+    print(table)
+
+HISTORY_COLUMNS = [
+    ("Time", {'justify': "center", 'style': "yellow", 'no_wrap': True}),
+    ("By", {'style': "green"}),
+    ("Duty", {'justify': "center", 'style': "cyan", 'no_wrap': True}),
+    ("Change", {'style': "magenta"}),
+]
+
+def _describe_change(entry):
+    if entry['kind'] != 'changed':
+        return entry['kind']
+    parts = [f"{field}: {old} -> {new}" for field, (old, new) in entry.get('changes', {}).items()]
+    parts += [f"{field} + {', '.join(map(str, values))}" for field, values in entry.get('added', {}).items()]
+    parts += [f"{field} - {', '.join(map(str, values))}" for field, values in entry.get('removed', {}).items()]
+    return '; '.join(parts)
+
+# Changes to a project and its duties, or to one duty, oldest first
+def print_history(project_id, duty_id=None, since=None, page=None, page_size=None, interactive=False):
+    def rows():
+        for entry in duty_history(project_id, duty_id, since):
+            yield (
+                datetime.fromtimestamp(entry['time']).strftime("%Y-%m-%d %H:%M:%S"),
+                entry['actor'] or '',
+                entry['duty_id'] or '(project)',
+                _describe_change(entry)
+            )
 
-    print(f"Error! Project with ID '{project_id}' not found.")
-
-#To remove a member from a project
-def remove_member_from_project(project_id, username):
-    projects = LoadProjects()
-    project = next((proj for proj in projects if proj['ID'] == project_id), None)
-
-    if not project:
-        print("[red]Error! Project ID not found.[/red]")
-        logging.error(f"Error! Project ID '{project_id}' not found.")
-        return
-
-    if username not in project['Members']:
-        print("[red]Error! User is not a member of this project.[/red]")
-        logging.error(f"Error! User '{username}' is not a member of project '{project['Title']}'.")
-        return
-
-    project['Members'].remove(username)
-    SaveProjects(projects)
-    print("[green]Member removed from project successfully![/green]")
-    logging.info(f"User '{username}' removed from project '{project['Title']}'.")
-
-def add_duty_to_project(project_id, duty_id, title, detail, assignees):
-    projects = LoadProjects()
-    users = LoadUsers()
-    project = next((proj for proj in projects if proj['ID'] == project_id), None)
+    _show(f"History - {project_id}" + (f" / {duty_id}" if duty_id else ''), HISTORY_COLUMNS, rows,
+          page, page_size, interactive)
 
-    if not project:
-        print("[red]Error! Project ID not found.[/red]")
-        logging.error(f"Error! Project ID '{project_id}' not found.")
+def print_duty_as_of(project_id, duty_id, when):
+    duty = duty_as_of(project_id, duty_id, when)
+    if duty is None:
+        print(f"[red]Error! Duty '{duty_id}' did not exist at {when}.[/red]")
         return
+    row = (duty['ID'], duty.get('Title', ''), duty.get('Detail', ''),
+           _stored_field(duty, 'ST', 'StartTime', 'Start Time'), _stored_field(duty, 'FT', 'FinishTime', 'End Time'),
+           duty.get('Status', ''), duty.get('Priority', ''))
+    print_paged(f"Duty {duty_id} as of {when}", DUTY_COLUMNS, [row])
 
-    for assignee in assignees:
-        if assignee not in project['Members']:
-            print(f"[red]Error! User '{assignee}' is not a member of this project.[/red]")
-            logging.error(f"Error! User '{assignee}' is not a member of project '{project['Title']}'.")
-            return
-
-    new_duty = {
-        'ID': duty_id,
-        'Title': title,
-        'Detail': detail,
-        'Start Time': datetime.now().isoformat(),
-        'End Time': (datetime.now() + timedelta(hours=24)).isoformat(),
-        'Priority': 'LOW',
-        'Status': 'BACKLOG',
-        'Assignees': assignees,
-        'Assigned To': None
-    }
-    project['Duties'].append(new_duty)
-    SaveProjects(projects)
-    print("[green]Duty added to project successfully![/green]")
-    logging.info(f"Duty '{title}' added to project '{project['Title']}'.")
-
-#To delete a project
-def delete_project(project_id, username):
-    projects = LoadProjects()
-
-    for project in projects:
-        if project['ID'] == project_id:
-            if project['Leader'] !=username:
-                print(f"[red]Error! Only the leader can delete the project.[/red]")
-                return
-            projects.remove(project)
-            SaveProjects(projects)
-            print(f"[green]Project with ID '{project_id}' deleted successfully.[/green]")
-            return
-    print(f"[red]Error! Project with ID '{project_id}' not found.[/red]")
-
-# To assign a duty to a member
-def assign_duty_to_member(project_id, duty_id, username):
-    projects = LoadProjects()
-
-    for project in projects:
-        if project['ID'] == project_id:
-            leader = User(project['Leader'], '', '')  # Assuming leader does not need a role
-
-            # Create Project instance with proper User and Duty objects
-            members = [User(m['username'], '', '') for m in project['Members']]
-            duties = [
-                Duty(
-                    d['ID'],
-                    d['Title'],
-                    d['Detail'],
-                    [User(a['username'], '', '') for a in d['Assignees']],
-                    User(d['AssignedTo']['username'], '', '') if d['AssignedTo'] else None
-                ) for d in project['Duties']
-            ]
-
-            project_instance = Project(project['ID'], project['Title'], leader, members, duties)
-
-            # Assign the duty to the user
-            project_instance.assign_duty(duty_id, username)
-            
-            # Update the project duties in the original data structure
-            project['Duties'] = [
-                {
-                    'ID': duty.get_ID(),
-                    'Title': duty.get_title(),
-                    'Detail': duty.get_detail(),
-                    'ST': duty.get_st().isoformat(),
-                    'FT': duty.get_ft().isoformat(),
-                    'Priority': duty.get_priority().value,
-                    'Status': duty.get_status().value,
-                    'Assignees': [{'username': user.get_username(), 'password': user.get_password(), 'emailaddress': user.get_emailaddress(), 'active': user.is_active()} for user in duty.get_assignees()],
-                    'AssignedTo': {'username': duty.get_assigned_to().get_username(), 'password': duty.get_assigned_to().get_password(), 'emailaddress': duty.get_assigned_to().get_emailaddress(), 'active': duty.get_assigned_to().is_active()} if duty.get_assigned_to() else None
-                } for duty in project_instance.get_duties()
-            ]
-            
-            SaveProjects(projects)
-            return
-    print(f"Error! Project with ID '{project_id}' not found.")
-
-#To unassign a duty from a member
-def unassign_duty_from_member(project_id, duty_id):
-    projects = LoadProjects()
-
-    for project in projects:
-        if project['ID'] == project_id:
-            for duty in project['Duties']:
-                if duty['ID'] == duty_id:
-                    duty['AssignedTo'] = None
-                    SaveProjects(projects)
-                    print(f"[green]Duty '{duty_id}' unassigned successfully.[/green]")
-                    return
-    print(f"[red]Error! Project with ID '{project_id}' or duty with ID '{duty_id}' not found.[/red]")
+# Duties written by different functions name their times differently
+def _stored_field(duty, *keys):
+    return next((duty[key] for key in keys if duty.get(key)), '')
 
 #New function to list duties of a project for a member
-def list_project_duties(project_id):
-    projects = LoadProjects()
-    project = next((proj for proj in projects if proj['ID'] == project_id), None)
-
-    if not project:
-        print("[red]Error! Project ID not found.[/red]")
-        logging.error(f"Error! Project ID '{project_id}' not found.")
-        return
-
-    console = Console()
-    table = Table(title=f"Project Duties - {project['Title']}")
-
-    table.add_column("ID", justify="center", style="cyan", no_wrap=True)
-    table.add_column("Title", style="magenta")
-    table.add_column("Detail", style="green")
-    table.add_column("Start Time", justify="center", style="yellow")
-    table.add_column("End Time", justify="center", style="yellow")
-    table.add_column("Status", justify="center", style="red")
-    table.add_column("Priority", justify="center", style="red")
-
-    for duty in project['Duties']:
-        table.add_row(
-            duty['ID'],
-            duty['Title'],
-            duty['Detail'],
-            duty['Start Time'],
-            duty['End Time'],
-            duty['Status'],
-            duty['Priority']
-        )
-
-    console.print(table)
-
-def assign_duty_to_user(project_id, duty_id, username):
-    projects = LoadProjects()
-    users = LoadUsers()
-    project = next((proj for proj in projects if proj['ID'] == project_id), None)
-    user = next((usr for usr in users if usr['username'] == username), None)
+# The project's duties; with archived, the ones moved out of it to the
+# archive (see archive.py) instead, which are only read then
+@instrumented
+def list_project_duties(project_id, page=None, page_size=None, interactive=False, archived=False):
+    repo = get_repository()
+    project = repo.get_project(project_id)
 
     if not project:
         print("[red]Error! Project ID not found.[/red]")
-        logging.error(f"Error! Project ID '{project_id}' not found.")
+        get_logger().error(f"Error! Project ID '{project_id}' not found.", extra={'project_id': project_id})
         return
 
-    if not user:
-        print("[red]Error! Username not found.[/red]")
-        logging.error(f"Error! Username '{username}' not found.")
-        return
-
-    duty = next((dty for dty in project['Duties'] if dty['ID'] == duty_id), None)
-
-    if not duty:
-        print("[red]Error! Duty ID not found.[/red]")
-        logging.error(f"Error! Duty ID '{duty_id}' not found in project '{project['Title']}'.")
-        return
-
-    if username not in project['Members']:
-        print(f"[red]Error! User '{username}' is not a member of this project.[/red]")
-        logging.error(f"Error! User '{username}' is not a member of project '{project['Title']}'.")
-        return
-
-    duty['Assigned To'] = username
-    SaveProjects(projects)
-    print("[green]Duty assigned to user successfully![/green]")
-    logging.info(f"Duty '{duty['Title']}' assigned to user '{username}' in project '{project['Title']}'.")
-
-def unassign_duty_from_user(project_id, duty_id):
-    projects = LoadProjects()
-    project = next((proj for proj in projects if proj['ID'] == project_id), None)
-
-    if not project:
-        print("[red]Error! Project ID not found.[/red]")
-        logging.error(f"Error! Project ID '{project_id}' not found.")
-        return
-
-    duty = next((dty for dty in project['Duties'] if dty['ID'] == duty_id), None)
-
-    if not duty:
-        print("[red]Error! Duty ID not found.[/red]")
-        logging.error(f"Error! Duty ID '{duty_id}' not found in project '{project['Title']}'.")
-        return
-
-    duty['Assigned To'] = None
-    SaveProjects(projects)
-    print("[green]Duty unassigned successfully![/green]")
-    logging.info(f"Duty '{duty['Title']}' unassigned in project '{project['Title']}'.")
-
-#New function to update duty details by a member
-def update_duty_details(user: User, project_id, duty_id, **kwargs):
-    projects = LoadProjects()
-
-    for project in projects:
-        if project['ID'] == project_id:
-            # Create a proper Project instance
-            leader = User(project['Leader'], '', '')  # Assuming leader does not need a role
-            members = [User(m['username'], m['password'], m.get('emailaddress', '')) for m in project['Members']]
-            duties = [
-                Duty(
-                    d['ID'],
-                    d['Title'],
-                    d['Detail'],
-                    [User(a['username'], a['password'], a.get('emailaddress', '')) for a in d['Assignees']],
-                    User(d['AssignedTo']['username'], '', '') if d['AssignedTo'] else None
-                ) for d in project['Duties']
-            ]
-            
-            project_instance = Project(project['ID'], project['Title'], leader, members, duties)
-            
-            for duty in project_instance.get_duties():
-                if duty.get_ID() == duty_id:
-                    if duty.get_assigned_to() and duty.get_assigned_to().get_username() == user.get_username():
-                        if 'title' in kwargs:
-                            duty.set_title(kwargs['title'])
-                        if 'detail' in kwargs:
-                            duty.set_detail(kwargs['detail'])
-                        if 'st' in kwargs:
-                            duty.set_st(kwargs['st'])
-                        if 'ft' in kwargs:
-                            duty.set_ft(kwargs['ft'])
-                        if 'priority' in kwargs:
-                            duty.set_priority(kwargs['priority'])
-                        if 'status' in kwargs:
-                            duty.set_status(kwargs['status'])
-                        
-                        # Update the project duties in the original data structure
-                        project['Duties'] = [
-                            {
-                                'ID': duty.get_ID(),
-                                'Title': duty.get_title(),
-                                'Detail': duty.get_detail(),
-                                'ST': duty.get_st().isoformat(),
-                                'FT': duty.get_ft().isoformat(),
-                                'Priority': duty.get_priority().value,
-                                'Status': duty.get_status().value,
-                                'Assignees': [{'username': user.get_username(), 'password': user.get_password(), 'emailaddress': user.get_emailaddress(), 'active': user.is_active()} for user in duty.get_assignees()],
-                                'AssignedTo': {'username': duty.get_assigned_to().get_username(), 'password': duty.get_assigned_to().get_password(), 'emailaddress': duty.get_assigned_to().get_emailaddress(), 'active': duty.get_assigned_to().is_active()} if duty.get_assigned_to() else None
-                            } for duty in project_instance.get_duties()
-                        ]
-                        SaveProjects(projects)
-                        print(f"Duty '{duty_id}' updated successfully.")
-                        return
-                    else:
-                        print(f"Error! User '{user.get_username()}' is not assigned to this duty.")
-                        return
+    def rows():
+        repo = get_repository()
+        for duty in repo.iter_archived_duties(project_id) if archived else repo.iter_duties(project_id):
+            yield (
+                duty['ID'],
+                duty['Title'],
+                duty['Detail'],
+                _stored_field(duty, 'ST', 'StartTime', 'Start Time'),
+                _stored_field(duty, 'FT', 'FinishTime', 'End Time'),
+                duty['Status'],
+                duty['Priority']
+            )
 
-    print(f"Error! Project with ID '{project_id}' not found.")
+    _show(f"{'Archived' if archived else 'Project'} Duties - {project['Title']}", DUTY_COLUMNS, rows, page, page_size,
+          interactive)
 
 #To view the list of projects
+@instrumented
 def list_user_projects(user: User):
-    projects = LoadProjects()
-    leader_projects = []
-    member_projects = []
-
-    for project_data in projects:
-        leader = project_data['Leader']
-        if leader == user.get_username():
-            leader_projects.append(project_data['Title'])
-        else:
-            for duty in project_data['Duties']:
-                for assignee in duty['Assignees']:
-                    if assignee['username'] == user.get_username():
-                        member_projects.append(project_data['Title'])
-                        break
-
-    print(f"Projects led by {user.get_username()}: {leader_projects}")
+    leader_projects, member_projects = get_repository().get_user_projects(user.get_username())
 
-# To create Duty
-def create_duty_in_project(project_id, duty_id, title, detail, assignees_usernames):
-    projects = LoadProjects()
-    users = LoadUsers()
-
-    project = next((proj for proj in projects if proj['ID'] == project_id), None)
-    if not project:
-        print(f"[red]Error! Project with ID '{project_id}' not found.[/red]")
-        return
-
-    assignees = [User(user['username'], user['password'], user['emailaddress']) for user in users if user['username'] in assignees_usernames]
-
-    if len(assignees) != len(assignees_usernames):
-        print("[red]Error! One or more assignees not found.[/red]")
-        return
-
-    if any(duty['ID'] == duty_id for duty in project['Duties']):
-        print(f"[red]Error! Duty with ID '{duty_id}' already exists in project '{project_id}'.[/red]")
-        return
-
-    new_duty = Duty(duty_id, title, detail, assignees)
-    project['Duties'].append({
-        'ID': new_duty.get_ID(),
-        'Title': new_duty.get_title(),
-        'Detail': new_duty.get_detail(),
-        'StartTime': new_duty.get_st().strftime("%Y-%m-%d %H:%M:%S"),
-        'FinishTime': new_duty.get_ft().strftime("%Y-%m-%d %H:%M:%S"),
-        'Priority': new_duty.get_priority().value,
-        'Status': new_duty.get_status().value,
-        'Assignees': [assignee.to_dict() for assignee in new_duty.get_assignees()],
-        'AssignedTo': new_duty.get_assigned_to().to_dict() if new_duty.get_assigned_to() else None
-    })
-    SaveProjects(projects)
-    print("[green]Duty created successfully![/green]")
+    print(f"Projects led by {user.get_username()}: {[project['Title'] for project in leader_projects]}")
+    print(f"Projects {user.get_username()} is a member of: {[project['Title'] for project in member_projects]}")
 
 def user_menu():
-    console = Console()
-    console.print("[bold white]Welcome to the Project Management System![/bold white]")
-    console.print("[bold magenta]--- Menu ---[/bold magenta]")
-    console.print("1. Create an account")
-    console.print("2. Log in")
-    console.print("3. Exit")
-
-    name = Prompt.ask("[bold yellow]Enter your choice[/bold yellow]")
+    print("[bold white]Welcome to the Project Management System![/bold white]")
+    print("[bold magenta]--- Menu ---[/bold magenta]")
+    print("1. Create an account")
+    print("2. Log in")
+    print("3. Exit")
+
+    name = _ask("[bold yellow]Enter your choice[/bold yellow]")
     return name
 
 def project_menu():
-    console = Console()
-    console.print("[bold magenta]--- Project Menu ---[/bold magenta]")
-    console.print("1. Create project")
-    console.print("2. List my projects")
-    console.print("3. Exit")
-
-    name = Prompt.ask("[bold yellow]Enter your choice[/bold yellow]")
+    print("[bold magenta]--- Project Menu ---[/bold magenta]")
+    print("1. Create project")
+    print("2. List my projects")
+    print("3. Query duties")
+    print("4. Search duties")
+    print("5. Board summary")
+    print("6. Overdue and due soon duties")
+    print("7. Exit")
+
+    name = _ask("[bold yellow]Enter your choice[/bold yellow]")
     return name
 
 def project_information():
-    console = Console()
-    console.print("[bold magenta]--- Project Information ---[/bold magenta]")
-    console.print("1. Add member")
-    console.print("2. Delete member")
-    console.print("3. Create duty")
-    console.print("4. Assignment of duties")
-    console.print("5. Unassignment of duties")
-    console.print("6. Update duty details")
-    console.print("7. Delete Project")
-    console.print("8. Exit")
-
-    name = Prompt.ask("[bold yellow]Enter your choice[/bold yellow]")
+    print("[bold magenta]--- Project Information ---[/bold magenta]")
+    print("1. Add member")
+    print("2. Delete member")
+    print("3. Create duty")
+    print("4. Assignment of duties")
+    print("5. Unassignment of duties")
+    print("6. Update duty details")
+    print("7. Delete Project")
+    print("8. List duties")
+    print("9. Show board")
+    print("10. Duty history")
+    print("11. Exit")
+
+    name = _ask("[bold yellow]Enter your choice[/bold yellow]")
     return name
 
 def main():
     while True:
         name = user_menu()
         if name == '1':
-            username = Prompt.ask("Enter username: ")
+            username = _ask("Enter username: ")
             while True:
                 email = input("Enter email: ")
                 if validate_email(email):
@@ -881,6 +436,7 @@ def main():
                         Title = input("Enter the title of the project: ")
                         create_project(ID, Title, username.get_username())
                     elif choice2 == '2':
+                        list_user_projects(logged_in_user)
                         while True:
                             choice3 = project_information()
                             if choice3 == '1':
@@ -941,11 +497,51 @@ def main():
                                 project_id = input("Enter the project ID: ")
                                 delete_project(project_id, logged_in_user.get_username())
                             elif choice3 == '8':
+                                project_id = input("Enter the project ID: ")
+                                list_project_duties(project_id, interactive=True)
+                                if input("Show the archived duties too? (y/n): ").strip().lower() == 'y':
+                                    list_project_duties(project_id, interactive=True, archived=True)
+                            elif choice3 == '9':
+                                project_id = input("Enter the project ID: ")
+                                print_board(project_id, interactive=True)
+                            elif choice3 == '10':
+                                project_id = input("Enter the project ID: ")
+                                duty_id = input("Enter the duty ID (or leave blank for the whole project): ")
+                                since = _input_parsed("Changes since (YYYY-MM-DD HH:MM:SS, or leave blank for all): ",
+                                                      convert_to_isoformat)
+                                print_history(project_id, duty_id or None, since, interactive=True)
+                                as_of = _input_parsed("Show the duty as of (YYYY-MM-DD HH:MM:SS, or leave blank to skip): ",
+                                                      convert_to_isoformat) if duty_id else None
+                                if as_of is not None:
+                                    print_duty_as_of(project_id, duty_id, as_of)
+                            elif choice3 == '11':
                                 print("[bold red]Exiting the program...[/bold red]")
                                 break
                             else:
-                                print("Please try between 1 to 8.")
+                                print("Please try between 1 to 11.")
                     elif choice2 == '3':
+                        assignee = input("Assigned to (username, 'me', or leave blank for anyone): ")
+                        if assignee == 'me':
+                            assignee = logged_in_user.get_username()
+                        statuses = _input_parsed("Statuses, comma separated (BACKLOG/TODO/DOING/DONE/ARCHIVED, 'open', or leave blank for any): ",
+                                                 lambda answer: OPEN_STATUSES if answer.lower() == 'open' else _enum_names(Status, answer))
+                        priorities = _input_parsed("Priorities, comma separated (CRITICAL/HIGH/MEDIUM/LOW, or leave blank for any): ",
+                                                   lambda answer: _enum_names(Priority, answer))
+                        due_within = _input_parsed("Due within how many hours (or leave blank for any time): ", _hours)
+                        results = query_duties(assignee or None, statuses, priorities, due_within)
+                        print_query_results(results, interactive=True)
+                    elif choice2 == '4':
+                        query = input("Search for (words of duty titles, details or project titles): ")
+                        print_search_results(search_duties(query))
+                    elif choice2 == '5':
+                        print_board_summary(interactive=True)
+                    elif choice2 == '6':
+                        due_within = _input_parsed("Due within how many hours (or leave blank for 24): ", _hours)
+                        if due_within is None:
+                            due_within = timedelta(hours=24)
+                        print_query_results(overdue_duties(), interactive=True, title="Overdue duties")
+                        print_query_results(duties_due_soon(due_within), interactive=True, title="Due soon")
+                    elif choice2 == '7':
                         print("Exiting the project menu :)")
                         break
                     else:
@@ -1,29 +1,45 @@
 import argparse
+import contextlib
+import csv
+import io
 import os
 import json
+import shutil
+import time
+from contextlib import closing
+from itertools import islice
+import config
+import instrumentation
+from indexes import duty_usernames
+from journal import Journal, journal_path, read_journal
+from locking import ConflictError, atomic_write, file_lock, lock_path
+from archive import ColdStore
+from storage import (Repository, ShardedRepository, find_user, get_repository, load_json_users, load_json_projects,
+                     load_sharded_projects, save_sharded_projects, manifest_path, iter_snapshot,
+                     write_json_array, convert_snapshot)
+import snapshot_codec
 
-def create_admin(username, password):
-    admin_file = 'admin.json'
-    
-    if os.path.exists(admin_file):
-        with open(admin_file, 'r') as file:
-            admin_data = json.load(file)
-            if admin_data.get('username') == username:
-                print("Error: Admin user already exists.")
-                return
-    
-    admin_data = {
-        'username': username,
-        'password': password
-    }
-    
-    with open(admin_file, 'w') as file:
-        json.dump(admin_data, file)
-    
+# The admin is an account like any other, with the 'admin' role, so it logs
+# in the same way; the username is checked through the same index login uses
+def create_admin(username, password, emailaddress=None):
+    from core import hashed_password
+    if find_user(username):
+        print("Error: Admin user already exists.")
+        return
+    admin = {'username': username, 'emailaddress': emailaddress or f"{username}@localhost",
+             'password': hashed_password(password), 'role': 'admin'}
+    try:
+        get_repository().add_user(admin)
+    except ConflictError:
+        print("Error: Admin user already exists.")
+        return
     print("Admin user created successfully.")
 
 def purge_data():
-    data_files = ['users.json', 'projects.json']
+    data_files = ['users.json', 'projects.json', 'users.journal', 'users.index', 'projects.journal', 'projects.search', 'projects.history', config.STATS_PATH,
+                  config.OUTBOX_PATH, config.SCHEDULER_STATE_PATH,
+                  config.DATABASE_PATH, config.DATABASE_PATH + '-wal', config.DATABASE_PATH + '-shm']
+    data_dirs = [config.PROJECTS_DIR, config.ARCHIVE_DIR, 'projects.history-index']
     
     print("Are you sure you want to delete all data? This action cannot be undone. (yes/no)")
     choice = input().strip().lower()
@@ -35,10 +51,492 @@ def purge_data():
                 print(f"Deleted {data_file}")
             else:
                 print(f"{data_file} does not exist.")
+        for data_dir in data_dirs:
+            if os.path.isdir(data_dir):
+                shutil.rmtree(data_dir)
+                print(f"Deleted {data_dir}/")
+            else:
+                print(f"{data_dir}/ does not exist.")
         print("All data has been purged.")
     else:
         print("Purge data operation canceled.")
 
+def compact_data():
+    if config.STORAGE_BACKEND == 'sharded':
+        repository = ShardedRepository()
+        repository.refresh()
+        repository.compact()
+        print(f"Journals compacted into users.json and the project files in {config.PROJECTS_DIR}/.")
+        return
+    repository = Repository()
+    repository.refresh()
+    repository.compact()
+    print("Journals compacted into users.json and projects.json.")
+
+# Snapshot files of the configured storage, for export-binary/import-binary
+# without a file argument
+def _snapshot_files():
+    if config.STORAGE_BACKEND == 'sharded':
+        directory = config.PROJECTS_DIR
+        return ['users.json'] + [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                                 if name.endswith('.json')]
+    return ['users.json', 'projects.json']
+
+# Rewrites snapshots in snapshot_format: source into output, or every
+# snapshot of the configured storage in place
+def convert_snapshots(snapshot_format, source, output):
+    if config.STORAGE_BACKEND == 'sqlite':
+        print("Error: the SQLite storage has no snapshot files.")
+        return
+    pairs = [(source, output or source)] if source else [(path, path) for path in _snapshot_files()]
+    for source_file, output_file in pairs:
+        if not os.path.exists(source_file):
+            print(f"{source_file} does not exist.")
+            continue
+        before = os.path.getsize(source_file)
+        convert_snapshot(source_file, output_file, snapshot_format)
+        print(f"Wrote {output_file} ({snapshot_format}): {before} -> {os.path.getsize(output_file)} bytes.")
+    if not source:
+        print(f"Set TRELLOMIZE_SNAPSHOT_FORMAT={snapshot_format} so compaction keeps writing this format.")
+
+# Moves the ARCHIVED and old DONE duties (see archive.py) of one project, or
+# of every project, to the cold segments, then compacts so the project files
+# shrink at once
+def archive_duties(project_id, done_after):
+    from core import retry_on_conflict
+    done_before = time.time() - (config.ARCHIVE_DONE_AFTER if done_after is None else done_after)
+
+    @retry_on_conflict
+    def archive_project(project_id):
+        return get_repository().archive_duties(project_id, done_before)
+
+    repo = get_repository()
+    if project_id is not None and repo.get_project(project_id) is None:
+        print(f"Error: Project '{project_id}' not found.")
+        return
+    project_ids = [project_id] if project_id is not None else [summary['ID'] for summary in repo.get_project_summaries()]
+    moved = projects = 0
+    for project_id in project_ids:
+        count = archive_project(project_id) or 0
+        moved += count
+        projects += count > 0
+    if moved:
+        get_repository().compact()
+    print(f"Archived {moved} duties of {projects} projects.")
+
+def shard_projects(projects_file, directory):
+    skipped = save_sharded_projects(load_json_projects(projects_file), directory)
+    for project in skipped:
+        print(f"Skipped project '{project['ID']}': duplicate project ID.")
+    count = len(load_sharded_projects(directory))
+    print(f"Wrote {count} projects to {directory}/.")
+    print("Set TRELLOMIZE_STORAGE_BACKEND=sharded to use it.")
+
+def migrate_sqlite(users_file, projects_file, database_path):
+    import sqlite_storage
+    users = load_json_users(users_file)
+    projects = load_json_projects(projects_file)
+
+    with closing(sqlite_storage.connect(database_path)) as conn:
+        skipped_users = sqlite_storage.save_users(conn, users)
+        skipped_projects = sqlite_storage.save_projects(conn, projects)
+        # the duties already moved out of the projects go along
+        cold = ColdStore(config.ARCHIVE_DIR)
+        skipped_ids = {project['ID'] for project in skipped_projects}
+        with conn:
+            for project in projects:
+                duties = cold.duties(project['ID']) if project['ID'] not in skipped_ids else []
+                if duties:
+                    sqlite_storage.save_archived(conn, project['ID'], duties)
+
+    for user in skipped_users:
+        print(f"Skipped user '{user['username']}': duplicate username or email.")
+    for project in skipped_projects:
+        print(f"Skipped project '{project['ID']}': duplicate project or duty ID.")
+    print(f"Imported {len(users) - len(skipped_users)} users and {len(projects) - len(skipped_projects)} projects into {database_path}.")
+    print("Set TRELLOMIZE_STORAGE_BACKEND=sqlite to use it.")
+
+# Rows of a CSV file (with a header) or of a JSONL file, one account each
+def _read_accounts(input_file):
+    with open(input_file, newline='') as file:
+        if input_file.endswith('.csv'):
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+def _hash_passwords(passwords, workers, chunk_size=1000):
+    from concurrent.futures import ThreadPoolExecutor
+    from core import hashed_password
+    chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashed = executor.map(lambda chunk: [hashed_password(p) for p in chunk], chunks)
+        return [h for chunk in hashed for h in chunk]
+
+def import_users(input_file, errors_file, workers):
+    from core import validate_email
+
+    repo = get_repository()
+    usernames = set()
+    emails = set()
+    accepted = []
+    passwords = []
+    rows = {}
+    rejects = []
+
+    for row_number, row in enumerate(_read_accounts(input_file), start=1):
+        username = (row.get('username') or '').strip()
+        email = (row.get('emailaddress') or row.get('email') or '').strip()
+        password = row.get('password') or ''
+        if not username or not email or not password:
+            reason = "missing username, email or password"
+        elif not validate_email(email):
+            reason = "invalid email"
+        elif username in usernames or repo.get_user(username):
+            reason = "username already exists"
+        elif email in emails or repo.get_user_by_email(email):
+            reason = "email already exists"
+        else:
+            usernames.add(username)
+            emails.add(email)
+            accepted.append({'username': username, 'emailaddress': email})
+            passwords.append(password)
+            rows[username] = row_number
+            continue
+        rejects.append({'row': row_number, 'username': username, 'emailaddress': email, 'reason': reason})
+
+    for user, hashed in zip(accepted, _hash_passwords(passwords, workers)):
+        user['password'] = hashed
+
+    # accounts someone else created while the file was being read
+    skipped = repo.add_users(accepted)
+    for user in skipped:
+        rejects.append({'row': rows[user['username']], 'username': user['username'],
+                        'emailaddress': user['emailaddress'], 'reason': "username or email already exists"})
+
+    if rejects:
+        rejects.sort(key=lambda reject: reject['row'])
+        with open(errors_file, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=['row', 'username', 'emailaddress', 'reason'])
+            writer.writeheader()
+            writer.writerows(rejects)
+        print(f"{len(rejects)} rows rejected, see {errors_file}.")
+    print(f"Imported {len(accepted) - len(skipped)} users.")
+
+def _reference(user):
+    return user.get('username') if isinstance(user, dict) else user
+
+# Duties used to embed whole user dicts in Assignees and AssignedTo
+def _normalize_duty(duty):
+    if 'Assignees' in duty:
+        duty['Assignees'] = [_reference(assignee) for assignee in duty['Assignees']]
+    for key in ('AssignedTo', 'Assigned To'):
+        if key in duty:
+            duty[key] = _reference(duty[key])
+    return duty
+
+def _normalize_project(project):
+    for duty in project.get('Duties', []):
+        _normalize_duty(duty)
+    return project
+
+def _normalize_record(record):
+    if 'project' in record:
+        _normalize_project(record['project'])
+    if 'duty' in record:
+        _normalize_duty(record['duty'])
+    if 'fields' in record:
+        _normalize_duty(record['fields'])
+    return record
+
+def _normalize_sqlite_assignees(database_path):
+    import sqlite_storage
+    with closing(sqlite_storage.connect(database_path)) as conn, conn:
+        assignees = conn.execute("UPDATE duty_assignees SET embedded = 0 WHERE embedded = 1").rowcount
+        duties = 0
+        for rowid, extra in conn.execute("SELECT rowid, extra FROM duties WHERE extra LIKE '%username%'").fetchall():
+            normalized = json.dumps(_normalize_duty(json.loads(extra)))
+            if normalized != extra:
+                conn.execute("UPDATE duties SET extra = ? WHERE rowid = ?", (normalized, rowid))
+                duties += 1
+    print(f"Converted {assignees} assignees and {duties} assigned users to username references in {database_path}.")
+
+# Rewrites a projects file and its journal one project / record at a time,
+# so memory use does not grow with the size of the files. Returns the files
+# and their total size before and after.
+def _normalize_project_file(projects_file):
+    journal_file = journal_path(projects_file)
+    files = [path for path in (projects_file, journal_file) if os.path.exists(path)]
+    # the exclusive store lock keeps every other process out until both
+    # files are rewritten
+    with file_lock(lock_path(projects_file)):
+        before = sum(os.path.getsize(path) for path in files)
+        if os.path.exists(projects_file):
+            with open(projects_file, 'rb') as file:
+                binary = snapshot_codec.is_binary(file.read(len(snapshot_codec.MAGIC)))
+            projects = (_normalize_project(project) for project in iter_snapshot(projects_file))
+            if binary:
+                atomic_write(projects_file, lambda file: snapshot_codec.encode_to(file, projects), 'wb')
+            else:
+                atomic_write(projects_file, lambda file: write_json_array(file, projects))
+        if os.path.exists(journal_file):
+            tmp_path = f"{journal_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as tmp:
+                for record, _ in read_journal(journal_file):
+                    tmp.write(json.dumps(_normalize_record(record)) + '\n')
+            # copied back rather than renamed: running processes keep the
+            # journal open for appending
+            with open(tmp_path, 'r') as tmp, open(journal_file, 'r+') as journal:
+                journal.truncate(0)
+                shutil.copyfileobj(tmp, journal)
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.remove(tmp_path)
+        after = sum(os.path.getsize(path) for path in files)
+    return files, before, after
+
+def normalize_assignees(projects_file):
+    if config.STORAGE_BACKEND == 'sqlite':
+        _normalize_sqlite_assignees(config.DATABASE_PATH)
+        return
+
+    if config.STORAGE_BACKEND == 'sharded':
+        directory = config.PROJECTS_DIR
+        project_files = [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                         if name.endswith('.json') and name != os.path.basename(manifest_path(directory))]
+    else:
+        project_files = [projects_file]
+
+    files, before, after = [], 0, 0
+    for project_file in project_files:
+        rewritten, size_before, size_after = _normalize_project_file(project_file)
+        files += rewritten
+        before += size_before
+        after += size_after
+
+    saved = before - after
+    print(f"Rewrote {len(files)} files: {before} -> {after} bytes "
+          f"({saved} bytes, {saved / before if before else 0:.0%} smaller).")
+
+# Operations run-batch accepts: name -> function of the fields of the op.
+# Each one goes through the same function, and so the same checks, as the
+# matching menu choice.
+def _batch_operations():
+    import core
+    from datetime import datetime
+
+    def create_account(username, emailaddress, password):
+        if not core.validate_email(emailaddress):
+            core.print("[red]Error! Email is not valid.[/red]")
+            return
+        core.create_an_account(username, emailaddress, password)
+
+    def update_duty(username, project_id, duty_id, title=None, detail=None, st=None, ft=None,
+                    priority=None, status=None):
+        fields = {'title': title, 'detail': detail,
+                  'st': datetime.fromisoformat(st) if st else None,
+                  'ft': datetime.fromisoformat(ft) if ft else None,
+                  'priority': core.Priority[priority.upper()] if priority else None,
+                  'status': core.Status[status.upper()] if status else None}
+        core.update_duty_details(core.User(username, '', ''), project_id, duty_id,
+                                 **{key: value for key, value in fields.items() if value is not None})
+
+    def create_project(project_id, title, leader):
+        core.create_project(project_id, title, leader)
+
+    def create_duty(project_id, duty_id, title, detail='', assignees=()):
+        core.create_duty_in_project(project_id, duty_id, title, detail, list(assignees))
+
+    return {
+        'create_account': create_account,
+        'create_project': create_project,
+        'add_member': core.add_member_to_project,
+        'remove_member': core.remove_member_from_project,
+        'create_duty': create_duty,
+        'assign_duty': core.assign_duty_to_member,
+        'unassign_duty': core.unassign_duty_from_member,
+        'update_duty': update_duty,
+        'delete_project': core.delete_project,
+    }
+
+def _read_ops(ops_file):
+    with open(ops_file) as file:
+        for line_number, line in enumerate(file, start=1):
+            if line.strip():
+                yield line_number, line
+
+# Runs one op and returns its result record. The functions report through
+# what they print, so an op failed when its output has an error in it.
+def _run_op(operations, line_number, line):
+    result = {'line': line_number}
+    try:
+        op = json.loads(line)
+        result['op'] = op.get('op')
+        operation = operations[op.pop('op')]
+    except (ValueError, KeyError, AttributeError):
+        result.update(ok=False, message="not a JSON object with a known 'op'")
+        return result
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            operation(**op)
+    except (TypeError, ValueError, KeyError) as error:
+        result.update(ok=False, message=f"invalid arguments: {error}")
+        return result
+    message = ' '.join(output.getvalue().split())
+    result.update(ok='Error' not in message, message=message)
+    return result
+
+def run_batch(ops_file, results_file, commit_every):
+    operations = _batch_operations()
+    repo = get_repository()
+    ops = _read_ops(ops_file)
+    succeeded = failed = commits = 0
+    repo.begin_batch()
+    try:
+        with open(results_file, 'w') as results:
+            while True:
+                chunk = list(islice(ops, commit_every) if commit_every else ops)
+                if not chunk:
+                    break
+                outcomes = [_run_op(operations, line_number, line) for line_number, line in chunk]
+                try:
+                    repo.commit_batch()
+                    commits += 1
+                except ConflictError as error:
+                    # The chunk was rolled back. Running it again as a batch
+                    # could lose to the other writer again, so its ops are
+                    # run and committed one at a time, like from the menu.
+                    print(f"{error} Running lines {chunk[0][0]}-{chunk[-1][0]} again one at a time.")
+                    repo.end_batch()
+                    outcomes = [_run_op(operations, line_number, line) for line_number, line in chunk]
+                    commits += len(chunk)
+                    repo.begin_batch()
+                for outcome in outcomes:
+                    results.write(json.dumps(outcome) + '\n')
+                    if outcome['ok']:
+                        succeeded += 1
+                    else:
+                        failed += 1
+    finally:
+        repo.end_batch()
+    print(f"Ran {succeeded + failed} operations in {commits} commits: {succeeded} succeeded, {failed} failed. "
+          f"Results are in {results_file}.")
+
+def search(query, limit):
+    from core import search_duties
+    results = search_duties(query, limit)
+    if not results:
+        print(f"Nothing matches '{query}'.")
+        return
+    print(f"{'score':>8}  {'project':20} {'duty':20} title")
+    for project_id, duty, score in results:
+        if duty is None:
+            print(f"{score:8.2f}  {project_id:20} {'':20} (project) {get_repository().get_project(project_id)['Title']}")
+        else:
+            print(f"{score:8.2f}  {project_id:20} {duty['ID']:20} {duty['Title']}")
+
+# The changes as JSON lines, or with as_of the duty (or project) as it was then
+def show_history(project_id, duty_id, since, as_of):
+    from core import duty_history, duty_as_of
+    from datetime import datetime
+    if as_of:
+        state = duty_as_of(project_id, duty_id, datetime.fromisoformat(as_of))
+        if state is None:
+            print(f"'{duty_id or project_id}' did not exist at {as_of}.")
+        else:
+            print(json.dumps(state, indent=4))
+        return
+    for entry in duty_history(project_id, duty_id, datetime.fromisoformat(since) if since else None):
+        print(json.dumps(entry))
+
+def _reminder(kind, finish, project_id, duty, sent):
+    return {'type': kind, 'project_id': project_id, 'duty_id': duty['ID'], 'title': duty['Title'],
+            'assignees': sorted(duty_usernames(duty)), 'finish': finish, 'sent': sent}
+
+# Reminders for the deadline events in [start, end): open duties that come
+# within REMINDER_LEAD of their finish time ('due_soon') or pass it ('overdue')
+def _reminders(repo, start, end):
+    lead = config.REMINDER_LEAD
+    reminders = [_reminder('due_soon', finish, project_id, duty, end)
+                 for finish, project_id, duty in repo.get_deadlines(start + lead, end + lead)]
+    reminders += [_reminder('overdue', finish, project_id, duty, end)
+                  for finish, project_id, duty in repo.get_deadlines(start, end)]
+    return reminders
+
+# When the first deadline event at or after start happens, or None
+def _next_event(repo, start):
+    events = [finish - config.REMINDER_LEAD
+              for finish, project_id, duty in repo.get_deadlines(start + config.REMINDER_LEAD, None, 1)]
+    events += [finish for finish, project_id, duty in repo.get_deadlines(start, None, 1)]
+    return min(events, default=None)
+
+# Sends the reminders of every deadline event since the last run to the
+# outbox, then sleeps until the next one. Only the deadline index is read, a
+# binary search per wake-up, so open duties cost nothing until they are due.
+# The outbox is synced before the state file moves on: a crash in between
+# sends those reminders again rather than never. A second scheduler waits
+# for the first one to stop.
+def run_scheduler(once):
+    repo = get_repository()
+    outbox = Journal(config.OUTBOX_PATH)
+    with file_lock(lock_path(config.SCHEDULER_STATE_PATH)):
+        state = {}
+        if os.path.exists(config.SCHEDULER_STATE_PATH):
+            with open(config.SCHEDULER_STATE_PATH) as file:
+                state = json.load(file)
+        sent_until = state.get('sent_until', int(time.time()))
+        try:
+            while True:
+                repo.refresh()
+                # every event up to and including the current second
+                end = int(time.time()) + 1
+                if end > sent_until:
+                    reminders = _reminders(repo, sent_until, end)
+                    if reminders:
+                        outbox.append_all(reminders)
+                        outbox.sync()
+                        print(f"Sent {len(reminders)} reminders to {config.OUTBOX_PATH}.")
+                    sent_until = end
+                    atomic_write(config.SCHEDULER_STATE_PATH,
+                                 lambda file: json.dump({'sent_until': sent_until}, file))
+                if once:
+                    break
+                next_event = _next_event(repo, sent_until)
+                wait = config.SCHEDULER_POLL_INTERVAL
+                if next_event is not None:
+                    wait = min(wait, max(next_event - time.time(), 0))
+                time.sleep(wait)
+        except KeyboardInterrupt:
+            print("Scheduler stopped.")
+        finally:
+            outbox.close()
+
+def show_stats(reset):
+    stats = instrumentation.load_stats()
+    if not stats:
+        print(f"No operation stats in {config.STATS_PATH} yet.")
+        return
+    print(f"{'operation':28} {'calls':>7} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} "
+          f"{'parse ms':>9} {'ser. ms':>9} {'disk ms':>9} {'read KiB':>9} {'written KiB':>11} {'records':>9}")
+    for operation, values in sorted(stats.items(), key=lambda item: -item[1]['wall'].total):
+        wall = values['wall']
+        # storage work outside any operation has no calls of its own
+        calls = wall.count or 1
+        means = [values[phase].total / calls * 1000 for phase in instrumentation.PHASES]
+        print(f"{operation:28} {wall.count:7} {wall.total / calls * 1000:9.3f} {wall.percentile(0.50) * 1000:9.3f} "
+              f"{wall.percentile(0.95) * 1000:9.3f} {wall.max * 1000:9.3f} "
+              + ' '.join(f"{mean:9.3f}" for mean in means)
+              + f" {values['bytes_read'] / calls / 1024:9.1f} {values['bytes_written'] / calls / 1024:11.1f}"
+              f" {values['records_scanned'] / calls:9.1f}")
+    print("Times, bytes and records are per call; percentiles are bucket upper bounds.")
+    if reset:
+        with file_lock(lock_path(config.STATS_PATH)):
+            if os.path.exists(config.STATS_PATH):
+                os.remove(config.STATS_PATH)
+        print(f"Deleted {config.STATS_PATH}")
+
 def main():
     parser = argparse.ArgumentParser(description='Manage system admin user and data.')
     
@@ -47,15 +545,95 @@ def main():
     create_admin_parser = subparsers.add_parser('create-admin', help='Create an admin user')
     create_admin_parser.add_argument('--username', required=True, help='Admin username')
     create_admin_parser.add_argument('--password', required=True, help='Admin password')
+    create_admin_parser.add_argument('--email', help='Admin email address (default: USERNAME@localhost)')
     
     purge_data_parser = subparsers.add_parser('purge-data', help='Purge all data')
+
+    compact_parser = subparsers.add_parser('compact', help='Fold the change journals into users.json and projects.json')
+
+    migrate_parser = subparsers.add_parser('migrate-sqlite', help='Import users.json and projects.json into the SQLite database')
+    migrate_parser.add_argument('--users', default='users.json', help='Users file to import')
+    migrate_parser.add_argument('--projects', default='projects.json', help='Projects file to import')
+    migrate_parser.add_argument('--database', default=config.DATABASE_PATH, help='SQLite database to write')
+
+    import_parser = subparsers.add_parser('import-users', help='Create accounts from a CSV or JSONL file')
+    import_parser.add_argument('file', help='CSV with a username,email,password header, or JSONL with the same keys')
+    import_parser.add_argument('--errors', default='import_errors.csv', help='Where to write the rejected rows')
+    import_parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Password hashing threads')
+
+    shard_parser = subparsers.add_parser('shard-projects', help='Split projects.json into one file per project')
+    shard_parser.add_argument('--projects', default='projects.json', help='Projects file to split')
+    shard_parser.add_argument('--directory', default=config.PROJECTS_DIR, help='Directory to write the project files to')
+
+    normalize_parser = subparsers.add_parser('normalize-assignees', help='Store duty assignees as usernames instead of user copies')
+    normalize_parser.add_argument('--projects', default='projects.json', help='Projects file to rewrite')
+
+    batch_parser = subparsers.add_parser('run-batch', help='Run the operations of a JSONL file against one loaded state')
+    batch_parser.add_argument('file', help='One operation per line, e.g. {"op": "add_member", "project_id": "p1", "username": "bob"}')
+    batch_parser.add_argument('--results', default='batch_results.jsonl', help='Where to write the result of each operation')
+    batch_parser.add_argument('--commit-every', type=int, default=1000, help='Operations per commit, 0 to commit once at the end')
+
+    search_parser = subparsers.add_parser('search', help='Find duties and projects by words of their titles and details')
+    search_parser.add_argument('query', help='Words to look for; each also matches words it is the start of')
+    search_parser.add_argument('--limit', type=int, default=config.SEARCH_LIMIT, help='How many of the best matches to show')
+
+    export_binary_parser = subparsers.add_parser('export-binary', help='Rewrite JSON snapshots in the binary snapshot format')
+    export_binary_parser.add_argument('--file', help='Snapshot to convert (default: every snapshot of the storage, in place)')
+    export_binary_parser.add_argument('--output', help='Where to write it (default: in place)')
+
+    import_binary_parser = subparsers.add_parser('import-binary', help='Rewrite binary snapshots as JSON')
+    import_binary_parser.add_argument('--file', help='Snapshot to convert (default: every snapshot of the storage, in place)')
+    import_binary_parser.add_argument('--output', help='Where to write it (default: in place)')
+
+    history_parser = subparsers.add_parser('history', help='Show the changes made to a project or duty')
+    history_parser.add_argument('project', help='Project ID')
+    history_parser.add_argument('--duty', help='Only the changes to this duty')
+    history_parser.add_argument('--since', help='Only the changes after this time (ISO format)')
+    history_parser.add_argument('--as-of', help='Show the duty (or project) as it was at this time (ISO format) instead')
+
+    scheduler_parser = subparsers.add_parser('scheduler', help='Write due soon and overdue reminders to the outbox as deadlines pass')
+    scheduler_parser.add_argument('--once', action='store_true', help='Send the reminders due by now and exit')
+
+    archive_parser = subparsers.add_parser('archive', help='Move ARCHIVED and old DONE duties out of the project files')
+    archive_parser.add_argument('--project', help='Only this project (default: every project)')
+    archive_parser.add_argument('--done-after', type=int,
+                                help=f"Seconds after its finish time a DONE duty is archived (default: {config.ARCHIVE_DONE_AFTER})")
+
+    stats_parser = subparsers.add_parser('stats', help='Show latency, I/O and parse time per operation')
+    stats_parser.add_argument('--reset', action='store_true', help='Delete the collected stats after showing them')
     
     args = parser.parse_args()
     
     if args.command == 'create-admin':
-        create_admin(args.username, args.password)
+        create_admin(args.username, args.password, args.email)
     elif args.command == 'purge-data':
         purge_data()
+    elif args.command == 'compact':
+        compact_data()
+    elif args.command == 'migrate-sqlite':
+        migrate_sqlite(args.users, args.projects, args.database)
+    elif args.command == 'import-users':
+        import_users(args.file, args.errors, args.workers)
+    elif args.command == 'shard-projects':
+        shard_projects(args.projects, args.directory)
+    elif args.command == 'normalize-assignees':
+        normalize_assignees(args.projects)
+    elif args.command == 'run-batch':
+        run_batch(args.file, args.results, args.commit_every)
+    elif args.command == 'search':
+        search(args.query, args.limit)
+    elif args.command == 'export-binary':
+        convert_snapshots('binary', args.file, args.output)
+    elif args.command == 'import-binary':
+        convert_snapshots('json', args.file, args.output)
+    elif args.command == 'history':
+        show_history(args.project, args.duty, args.since, args.as_of)
+    elif args.command == 'scheduler':
+        run_scheduler(args.once)
+    elif args.command == 'archive':
+        archive_duties(args.project, args.done_after)
+    elif args.command == 'stats':
+        show_stats(args.reset)
     else:
         parser.print_help()
 
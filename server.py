@@ -0,0 +1,394 @@
+import argparse
+import asyncio
+import json
+import re
+import time
+from itertools import islice
+from urllib.parse import parse_qs, unquote, urlsplit
+import config
+from applog import get_logger
+from core import (Duty, Priority, Status, OPEN_STATUSES, UnitOfWork, hashed_password, validate_email, intern_user,
+                  _username_of)
+from locking import ConflictError
+from storage import get_repository
+
+# HTTP/JSON API over the same repository the menus use, for dashboards and
+# integrations:
+#
+#   python server.py --port 8080
+#
+#   GET    /users                                     ?page=&page_size=
+#   POST   /users                                     {username, emailaddress, password}
+#   GET    /projects                                  ?page=&page_size=
+#   POST   /projects                                  {id, title, leader}
+#   GET    /projects/<id>
+#   GET    /projects/<id>/duties                      ?page=&page_size=&archived=1 (the archived ones instead)
+#   POST   /projects/<id>/members                     {username}
+#   DELETE /projects/<id>/members/<username>
+#   POST   /projects/<id>/duties                      {id, title, detail, assignees}
+#   POST   /projects/<id>/duties/<duty id>/assign     {username}
+#   POST   /projects/<id>/duties/<duty id>/unassign
+#   PATCH  /projects/<id>/duties/<duty id>            {username, status, priority}
+#   GET    /duties                                    ?assignee=&status=&priority=&due_within_hours=
+#
+# Requests are handled one at a time on the event loop against the
+# repository's in-memory state, which stays in batch mode (see
+# Repository.begin_batch). A change is applied at once and the response to it
+# is sent when the writer task has committed it: the writer waits
+# SERVER_COMMIT_DELAY seconds for more changes to join, then writes them all
+# in one commit. If another process wrote to the data in the meantime the
+# commit fails, the waiting requests get 409 and can be retried.
+
+MAX_BODY = 1024 * 1024
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+# Commits the changes made since the last commit, after giving the changes
+# that arrive meanwhile SERVER_COMMIT_DELAY seconds to join them. When idle it
+# re-reads the data every SERVER_REFRESH_INTERVAL seconds, so changes from
+# other processes show up.
+#
+# With the SQLite storage a batch holds the database's write lock from its
+# first change until it is committed, and other processes writing meanwhile
+# wait for it, so there the changes are committed without the delay: only
+# those that arrived while the event loop was busy join.
+class Writer:
+    def __init__(self, repo):
+        self._repo = repo
+        self._delay = 0 if config.STORAGE_BACKEND == 'sqlite' else config.SERVER_COMMIT_DELAY
+        self._waiting = []
+        self._wake = asyncio.Event()
+
+    async def committed(self):
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.append(future)
+        self._wake.set()
+        await future
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), config.SERVER_REFRESH_INTERVAL)
+            except asyncio.TimeoutError:
+                self._repo.end_batch()
+                self._repo.refresh()
+                self._repo.begin_batch()
+                continue
+            await asyncio.sleep(self._delay)
+            self._wake.clear()
+            waiting, self._waiting = self._waiting, []
+            try:
+                self._repo.commit_batch()
+            except Exception as error:
+                get_logger().error(f"Error! {error} {len(waiting)} changes were not written.")
+                for future in waiting:
+                    future.set_exception(error)
+            else:
+                for future in waiting:
+                    future.set_result(None)
+
+def _page(items, query):
+    page = int(query.get('page', 1))
+    page_size = int(query.get('page_size', config.PAGE_SIZE))
+    if page < 1 or page_size < 1:
+        raise HttpError(400, "page and page_size must be positive")
+    return list(islice(items, (page - 1) * page_size, page * page_size))
+
+def _required(body, *keys):
+    missing = [key for key in keys if not body.get(key)]
+    if missing:
+        raise HttpError(400, f"missing {', '.join(missing)}")
+    return [body[key] for key in keys]
+
+def _project(repo, project_id):
+    project = repo.get_project(project_id)
+    if project is None:
+        raise HttpError(404, f"Project ID '{project_id}' not found.")
+    return project
+
+# A duty loaded through a unit of work, which writes only what is changed
+# on it, under the keys it is stored with (see core.UnitOfWork)
+def _duty(repo, project_id, duty_id):
+    work = UnitOfWork(repo)
+    duty = work.duty(project_id, duty_id)
+    if duty is None:
+        raise HttpError(404, f"Duty ID '{duty_id}' not found in project '{project_id}'.")
+    return work, duty
+
+def _public_user(user):
+    return {'username': user['username'], 'emailaddress': user['emailaddress'], 'role': user.get('role', '')}
+
+def _enum(kind, value):
+    try:
+        return kind[value.upper()]
+    except KeyError:
+        raise HttpError(400, f"unknown {kind.__name__.lower()} '{value}'")
+
+# Handlers take (repo, match, query, body) and return (status, result). The
+# checks are the ones the functions of core.py make.
+
+def list_users(repo, match, query, body):
+    return 200, [_public_user(user) for user in _page(repo.iter_users(), query)]
+
+def create_user(repo, match, query, body):
+    username, emailaddress, password = _required(body, 'username', 'emailaddress', 'password')
+    if not validate_email(emailaddress):
+        raise HttpError(400, "Email is not valid.")
+    if repo.get_user(username) or repo.get_user_by_email(emailaddress):
+        raise HttpError(409, "Username or email already exists.")
+    user = {'username': username, 'emailaddress': emailaddress, 'password': hashed_password(password)}
+    repo.add_user(user)
+    get_logger().info(f"Account created for user '{username}'.", extra={'username': username})
+    return 201, _public_user(user)
+
+def list_projects(repo, match, query, body):
+    return 200, [{'ID': project['ID'], 'Title': project['Title'], 'Leader': _username_of(project['Leader']),
+                  'Members': [_username_of(member) for member in project['Members']]}
+                 for project in _page(repo.iter_project_summaries(), query)]
+
+def create_project(repo, match, query, body):
+    project_id, title, leader = _required(body, 'id', 'title', 'leader')
+    if repo.get_project(project_id):
+        raise HttpError(409, "Project ID already exists.")
+    if not repo.get_user(leader):
+        raise HttpError(404, "Leader not found.")
+    project = {'ID': project_id, 'Title': title, 'Leader': leader, 'Members': [leader], 'Duties': []}
+    repo.add_project(project)
+    get_logger().info(f"Project '{title}' created with leader '{leader}'.",
+                      extra={'project_id': project_id, 'username': leader})
+    return 201, repo.get_project(project_id)
+
+def get_project(repo, match, query, body):
+    return 200, _project(repo, match['project'])
+
+def list_duties(repo, match, query, body):
+    _project(repo, match['project'])
+    if query.get('archived') in ('1', 'true'):
+        return 200, _page(repo.iter_archived_duties(match['project']), query)
+    return 200, _page(repo.iter_duties(match['project']), query)
+
+def add_member(repo, match, query, body):
+    project_id = match['project']
+    project = _project(repo, project_id)
+    username, = _required(body, 'username')
+    if not repo.get_user(username):
+        raise HttpError(404, f"Username '{username}' not found.")
+    if username in project['Members']:
+        raise HttpError(409, "User is already a member of this project.")
+    repo.add_member(project_id, username)
+    get_logger().info(f"User '{username}' added to project '{project['Title']}'.",
+                      extra={'project_id': project_id, 'username': username})
+    return 200, repo.get_project(project_id)
+
+def remove_member(repo, match, query, body):
+    project_id, username = match['project'], match['username']
+    project = _project(repo, project_id)
+    if username not in project['Members']:
+        raise HttpError(404, "User is not a member of this project.")
+    repo.remove_member(project_id, username)
+    get_logger().info(f"User '{username}' removed from project '{project['Title']}'.",
+                      extra={'project_id': project_id, 'username': username})
+    return 200, repo.get_project(project_id)
+
+def create_duty(repo, match, query, body):
+    project_id = match['project']
+    _project(repo, project_id)
+    duty_id, title = _required(body, 'id', 'title')
+    usernames = body.get('assignees', [])
+    users = [user for user in map(repo.get_user, dict.fromkeys(usernames)) if user]
+    if len(users) != len(usernames):
+        raise HttpError(404, "One or more assignees not found.")
+    if repo.get_duty(project_id, duty_id):
+        raise HttpError(409, f"Duty with ID '{duty_id}' already exists in project '{project_id}'.")
+    assignees = [intern_user(user['username'], user['password'], user['emailaddress']) for user in users]
+    repo.add_duty(project_id, Duty(duty_id, title, body.get('detail', ''), assignees).to_dict())
+    return 201, repo.get_duty(project_id, duty_id)
+
+def assign_duty(repo, match, query, body):
+    project_id, duty_id = match['project'], match['duty']
+    project = _project(repo, project_id)
+    work, duty = _duty(repo, project_id, duty_id)
+    username, = _required(body, 'username')
+    if username not in project['Members']:
+        raise HttpError(400, f"User '{username}' is not a member of this project.")
+    duty.set_assigned_to(intern_user(username))
+    work.commit()
+    get_logger().info(f"Duty '{duty.get_title()}' assigned to '{username}' in project '{project['Title']}'.",
+                      extra={'project_id': project_id, 'duty_id': duty_id, 'username': username})
+    return 200, repo.get_duty(project_id, duty_id)
+
+def unassign_duty(repo, match, query, body):
+    project_id, duty_id = match['project'], match['duty']
+    _project(repo, project_id)
+    work, duty = _duty(repo, project_id, duty_id)
+    duty.set_assigned_to(None)
+    work.commit()
+    return 200, repo.get_duty(project_id, duty_id)
+
+# Only whoever the duty is assigned to may change it, as in update_duty_details
+def update_duty(repo, match, query, body):
+    project_id, duty_id = match['project'], match['duty']
+    _project(repo, project_id)
+    work, duty = _duty(repo, project_id, duty_id)
+    username, = _required(body, 'username')
+    assigned_to = duty.get_assigned_to()
+    if not assigned_to or assigned_to.get_username() != username:
+        raise HttpError(400, f"User '{username}' is not assigned to this duty.")
+    if not body.get('status') and not body.get('priority'):
+        raise HttpError(400, "nothing to update, give a status or priority")
+    if body.get('status'):
+        duty.set_status(_enum(Status, body['status']))
+    if body.get('priority'):
+        duty.set_priority(_enum(Priority, body['priority']))
+    work.commit()
+    return 200, repo.get_duty(project_id, duty_id)
+
+def query_duties(repo, match, query, body):
+    statuses = query.get('status')
+    if statuses == 'open':
+        statuses = [status.value for status in OPEN_STATUSES]
+    elif statuses:
+        statuses = [_enum(Status, status).value for status in statuses.split(',')]
+    priorities = query.get('priority')
+    if priorities:
+        priorities = [_enum(Priority, priority).value for priority in priorities.split(',')]
+    due_after = due_before = None
+    if query.get('due_within_hours'):
+        due_after = int(time.time())
+        due_before = due_after + int(float(query['due_within_hours']) * 3600)
+    results = repo.query_duties(query.get('assignee'), statuses or None, priorities or None, due_after, due_before)
+    return 200, [{'project_id': project_id, 'duty': duty} for project_id, duty in _page(iter(results), query)]
+
+# (method, path pattern, handler, changes data)
+ROUTES = [
+    ('GET', r'/users', list_users, False),
+    ('POST', r'/users', create_user, True),
+    ('GET', r'/projects', list_projects, False),
+    ('POST', r'/projects', create_project, True),
+    ('GET', r'/projects/(?P<project>[^/]+)', get_project, False),
+    ('GET', r'/projects/(?P<project>[^/]+)/duties', list_duties, False),
+    ('POST', r'/projects/(?P<project>[^/]+)/members', add_member, True),
+    ('DELETE', r'/projects/(?P<project>[^/]+)/members/(?P<username>[^/]+)', remove_member, True),
+    ('POST', r'/projects/(?P<project>[^/]+)/duties', create_duty, True),
+    ('POST', r'/projects/(?P<project>[^/]+)/duties/(?P<duty>[^/]+)/assign', assign_duty, True),
+    ('POST', r'/projects/(?P<project>[^/]+)/duties/(?P<duty>[^/]+)/unassign', unassign_duty, True),
+    ('PATCH', r'/projects/(?P<project>[^/]+)/duties/(?P<duty>[^/]+)', update_duty, True),
+    ('GET', r'/duties', query_duties, False),
+]
+ROUTES = [(method, re.compile(pattern + '$'), handler, changes) for method, pattern, handler, changes in ROUTES]
+
+async def handle(repo, writer, method, target, body):
+    url = urlsplit(target)
+    path = unquote(url.path).rstrip('/') or '/'
+    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+    matched = [(route_method, match, handler, changes) for route_method, pattern, handler, changes in ROUTES
+               if (match := pattern.match(path))]
+    if not matched:
+        raise HttpError(404, f"no such resource: {path}")
+    route = next((route for route in matched if route[0] == method), None)
+    if route is None:
+        raise HttpError(405, f"{method} is not supported on {path}")
+    _, match, handler, changes = route
+    if body:
+        try:
+            body = json.loads(body)
+        except ValueError:
+            raise HttpError(400, "the body is not valid JSON")
+        if not isinstance(body, dict):
+            raise HttpError(400, "the body must be a JSON object")
+    try:
+        status, result = handler(repo, match.groupdict(), query, body or {})
+    except ValueError as error:
+        raise HttpError(400, str(error))
+    if changes:
+        try:
+            await writer.committed()
+        except ConflictError as error:
+            raise HttpError(409, f"{error} Please retry.")
+    return status, result
+
+async def _read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, target, version = request_line.decode('latin-1').split()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY:
+        raise HttpError(413, "the body is too large")
+    body = await reader.readexactly(length) if length else b''
+    keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+    return method, target, body, keep_alive
+
+def _response(status, result, keep_alive):
+    data = json.dumps(result).encode()
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + data
+
+async def serve_client(repo, writer_task, reader, stream):
+    try:
+        while True:
+            keep_alive = False
+            try:
+                request = await _read_request(reader)
+                if request is None:
+                    return
+                method, target, body, keep_alive = request
+                status, result = await handle(repo, writer_task, method, target, body)
+            except HttpError as error:
+                status, result = error.status, {'error': str(error)}
+            except (ValueError, asyncio.IncompleteReadError):
+                status, result = 400, {'error': "malformed request"}
+            except Exception as error:
+                get_logger().error(f"Error! Request failed: {error!r}")
+                status, result = 500, {'error': "internal error"}
+            stream.write(_response(status, result, keep_alive))
+            await stream.drain()
+            if not keep_alive:
+                return
+    except ConnectionError:
+        pass
+    finally:
+        stream.close()
+
+async def serve(host, port):
+    repo = get_repository()
+    repo.begin_batch()
+    writer = Writer(repo)
+    writer_task = asyncio.create_task(writer.run())
+    server = await asyncio.start_server(lambda reader, stream: serve_client(repo, writer, reader, stream), host, port)
+    print(f"Serving on http://{host}:{port}", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        writer_task.cancel()
+        repo.commit_batch()
+        repo.end_batch()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the projects over HTTP/JSON.')
+    parser.add_argument('--host', default=config.SERVER_HOST)
+    parser.add_argument('--port', type=int, default=config.SERVER_PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
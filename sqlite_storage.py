@@ -0,0 +1,799 @@
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+import config
+import history
+from archive import archived_duties, decode_segments, encode_segment
+from indexes import duty_terms, finish_timestamp, project_terms, rank, tokenize
+from instrumentation import measure
+from locking import ConflictError
+from journal import (USER_CREATED, PROJECT_CREATED, PROJECT_DELETED, MEMBER_ADDED, MEMBER_REMOVED,
+                     DUTY_CREATED, DUTY_ASSIGNED, DUTY_UNASSIGNED, DUTY_UPDATED, STATUS_CHANGED, DUTIES_ARCHIVED)
+
+# SQLite storage engine. Users, projects, members, duties and duty assignees
+# live in normalized tables; rows are turned back into the same dicts that
+# LoadUsers/LoadProjects return for the JSON files.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT NOT NULL,
+    emailaddress TEXT,
+    password TEXT,
+    role TEXT NOT NULL DEFAULT '',
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE UNIQUE INDEX IF NOT EXISTS users_username ON users (username);
+CREATE UNIQUE INDEX IF NOT EXISTS users_emailaddress ON users (emailaddress);
+
+CREATE TABLE IF NOT EXISTS projects (
+    id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    title TEXT,
+    leader TEXT,
+    version INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS projects_id ON projects (id);
+CREATE INDEX IF NOT EXISTS projects_leader ON projects (leader);
+
+CREATE TABLE IF NOT EXISTS project_members (
+    project_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    username TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS project_members_project ON project_members (project_id, username);
+CREATE INDEX IF NOT EXISTS project_members_username ON project_members (username);
+
+CREATE TABLE IF NOT EXISTS duties (
+    project_id TEXT NOT NULL,
+    duty_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    title TEXT,
+    detail TEXT,
+    priority TEXT,
+    status TEXT,
+    assigned_to TEXT,
+    extra TEXT NOT NULL DEFAULT '{}',
+    finish_time INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS duties_project_duty ON duties (project_id, duty_id);
+
+CREATE TABLE IF NOT EXISTS duty_assignees (
+    project_id TEXT NOT NULL,
+    duty_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    embedded INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS duty_assignees_duty ON duty_assignees (project_id, duty_id);
+CREATE INDEX IF NOT EXISTS duty_assignees_username ON duty_assignees (username);
+"""
+
+# Created after connect() added finish_time to older databases
+DUTY_QUERY_INDEXES = """
+CREATE INDEX IF NOT EXISTS duties_status ON duties (status);
+CREATE INDEX IF NOT EXISTS duties_priority ON duties (priority);
+CREATE INDEX IF NOT EXISTS duties_assigned_to ON duties (assigned_to);
+CREATE INDEX IF NOT EXISTS duties_finish_time ON duties (finish_time);
+CREATE INDEX IF NOT EXISTS duties_deadlines ON duties (finish_time, project_id, duty_id)
+    WHERE status IN ('BACKLOG', 'TODO', 'DOING');
+"""
+
+# Full-text search: one row per word of a duty's title and detail (and of a
+# project's title, with a NULL duty_id), weighted as in indexes.SearchIndex.
+# Prefixes are looked up as ranges of the term index.
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_terms (
+    term TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    duty_id TEXT,
+    weight REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS search_terms_term ON search_terms (term);
+CREATE INDEX IF NOT EXISTS search_terms_document ON search_terms (project_id, duty_id);
+"""
+
+# How many duties of each project have each status and priority, updated
+# along with the duties so the board never counts rows. A missing status or
+# priority is stored as ''.
+COUNT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS duty_counts (
+    project_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS duty_counts_cell ON duty_counts (project_id, status, priority);
+"""
+
+# The change history (see history.py), one row per entry. A project's own
+# entries have '' as duty_id.
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    seq INTEGER PRIMARY KEY,
+    project_id TEXT NOT NULL,
+    duty_id TEXT NOT NULL,
+    time REAL NOT NULL,
+    kind TEXT NOT NULL,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_key ON history (project_id, duty_id, seq);
+CREATE INDEX IF NOT EXISTS history_key_kind ON history (project_id, duty_id, kind, time);
+CREATE INDEX IF NOT EXISTS history_project ON history (project_id, time);
+"""
+
+# Cold duties (see archive.py): each row is one segment, the duties of one
+# move out of a project, compressed
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archived_segments (
+    seq INTEGER PRIMARY KEY,
+    project_id TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS archived_segments_project ON archived_segments (project_id, seq);
+"""
+
+USER_COLUMNS = ('username', 'emailaddress', 'password', 'role')
+DUTY_COLUMNS = {'Title': 'title', 'Detail': 'detail', 'Priority': 'priority', 'Status': 'status'}
+
+def connect(database_path):
+    conn = sqlite3.connect(database_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    # databases created before projects carried a version number
+    columns = [row['name'] for row in conn.execute("PRAGMA table_info(projects)")]
+    if 'version' not in columns:
+        conn.execute("ALTER TABLE projects ADD COLUMN version INTEGER")
+    # databases created before duties could be queried by finish time
+    columns = [row['name'] for row in conn.execute("PRAGMA table_info(duties)")]
+    if 'finish_time' not in columns:
+        with conn:
+            conn.execute("ALTER TABLE duties ADD COLUMN finish_time INTEGER")
+            conn.executemany("UPDATE duties SET finish_time = ? WHERE rowid = ?",
+                             [(finish_timestamp(json.loads(row['extra'])), row['rowid'])
+                              for row in conn.execute("SELECT rowid, extra FROM duties")])
+    conn.executescript(DUTY_QUERY_INDEXES)
+    # databases created before duties were counted
+    counted = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'duty_counts'").fetchone()
+    conn.executescript(COUNT_SCHEMA)
+    if not counted:
+        with conn:
+            conn.execute("INSERT INTO duty_counts (project_id, status, priority, count) "
+                         "SELECT project_id, IFNULL(status, ''), IFNULL(priority, ''), COUNT(*) FROM duties "
+                         "GROUP BY project_id, IFNULL(status, ''), IFNULL(priority, '')")
+    # databases created before duties could be searched
+    indexed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'search_terms'").fetchone()
+    conn.executescript(SEARCH_SCHEMA)
+    conn.executescript(HISTORY_SCHEMA)
+    conn.executescript(ARCHIVE_SCHEMA)
+    if not indexed:
+        with conn:
+            for row in conn.execute("SELECT id, title FROM projects").fetchall():
+                _index_document(conn, row['id'], None, project_terms({'Title': row['title']}))
+            for row in conn.execute("SELECT project_id, duty_id, title, detail FROM duties").fetchall():
+                _index_document(conn, row['project_id'], row['duty_id'],
+                                duty_terms({'Title': row['title'], 'Detail': row['detail']}))
+    return conn
+
+def _username_of(value):
+    # members and assignees are stored either as usernames or as user dicts
+    if isinstance(value, dict):
+        return value.get('username')
+    return value
+
+# ---- rows -> dicts ----
+
+def _user_from_row(row):
+    user = {column: row[column] for column in USER_COLUMNS}
+    user.update(json.loads(row['extra']))
+    return user
+
+def _assignee_from_row(row, users):
+    if not row['embedded']:
+        return row['username']
+    user = users.get(row['username'])
+    if user is None:
+        return {'username': row['username']}
+    # same shape as User.to_dict()
+    return {'username': user['username'], 'password': user['password'],
+            'emailaddress': user['emailaddress'], 'active': user.get('active', True)}
+
+def _duty_from_row(row, assignees):
+    duty = {'ID': row['duty_id']}
+    for key, column in DUTY_COLUMNS.items():
+        if row[column] is not None:
+            duty[key] = row[column]
+    duty['Assignees'] = assignees
+    duty.update(json.loads(row['extra']))
+    return duty
+
+def _load_users_by_name(conn, usernames=None):
+    if usernames is None:
+        rows = conn.execute("SELECT * FROM users")
+    else:
+        names = list(usernames)
+        rows = conn.execute(f"SELECT * FROM users WHERE username IN ({','.join('?' * len(names))})", names)
+    return {row['username']: _user_from_row(row) for row in rows}
+
+def _load_project_rows(conn, project_rows):
+    projects = []
+    for row in project_rows:
+        members = [r['username'] for r in conn.execute(
+            "SELECT username FROM project_members WHERE project_id = ? ORDER BY position", (row['id'],))]
+        assignee_rows = conn.execute(
+            "SELECT * FROM duty_assignees WHERE project_id = ? ORDER BY duty_id, position", (row['id'],)).fetchall()
+        users = _load_users_by_name(conn, {r['username'] for r in assignee_rows if r['embedded']})
+        assignees = {}
+        for assignee_row in assignee_rows:
+            assignees.setdefault(assignee_row['duty_id'], []).append(_assignee_from_row(assignee_row, users))
+        duties = [_duty_from_row(duty_row, assignees.get(duty_row['duty_id'], [])) for duty_row in conn.execute(
+            "SELECT * FROM duties WHERE project_id = ? ORDER BY position", (row['id'],))]
+        project = {'ID': row['id'], 'Title': row['title'], 'Leader': row['leader'],
+                   'Members': members, 'Duties': duties}
+        if row['version'] is not None:
+            project['Version'] = row['version']
+        projects.append(project)
+    return projects
+
+def load_users(conn):
+    return [_user_from_row(row) for row in conn.execute("SELECT * FROM users ORDER BY rowid")]
+
+def load_projects(conn):
+    return _load_project_rows(conn, conn.execute("SELECT * FROM projects ORDER BY position").fetchall())
+
+# ---- dicts -> rows ----
+
+def _next_position(conn, table, where='', params=()):
+    row = conn.execute(f"SELECT COALESCE(MAX(position), -1) + 1 FROM {table} {where}", params).fetchone()
+    return row[0]
+
+def _insert_user(conn, user):
+    extra = {key: value for key, value in user.items() if key not in USER_COLUMNS}
+    conn.execute("INSERT INTO users (username, emailaddress, password, role, extra) VALUES (?, ?, ?, ?, ?)",
+                 (user['username'], user.get('emailaddress'), user.get('password'), user.get('role', ''),
+                  json.dumps(extra)))
+
+def _insert_duty(conn, project_id, duty, position):
+    extra = {key: value for key, value in duty.items()
+             if key not in DUTY_COLUMNS and key not in ('ID', 'Assignees')}
+    conn.execute("INSERT INTO duties (project_id, duty_id, position, title, detail, priority, status, assigned_to, extra, "
+                 "finish_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                 (project_id, duty['ID'], position, duty.get('Title'), duty.get('Detail'), duty.get('Priority'),
+                  duty.get('Status'), _assigned_username(duty), json.dumps(extra), finish_timestamp(extra)))
+    conn.executemany("INSERT INTO duty_assignees (project_id, duty_id, position, username, embedded) VALUES (?, ?, ?, ?, ?)",
+                     [(project_id, duty['ID'], i, _username_of(a), int(isinstance(a, dict)))
+                      for i, a in enumerate(duty.get('Assignees', []))])
+    _index_document(conn, project_id, duty['ID'], duty_terms(duty))
+    _count_duty(conn, project_id, duty.get('Status'), duty.get('Priority'), 1)
+
+def _index_document(conn, project_id, duty_id, terms):
+    conn.executemany("INSERT INTO search_terms (term, project_id, duty_id, weight) VALUES (?, ?, ?, ?)",
+                     [(term, project_id, duty_id, weight) for term, weight in terms.items()])
+
+def _count_duty(conn, project_id, status, priority, delta):
+    cell = (project_id, status or '', priority or '')
+    conn.execute("INSERT INTO duty_counts (project_id, status, priority, count) VALUES (?, ?, ?, ?) "
+                 "ON CONFLICT (project_id, status, priority) DO UPDATE SET count = count + excluded.count",
+                 cell + (delta,))
+    if delta < 0:
+        conn.execute("DELETE FROM duty_counts WHERE project_id = ? AND status = ? AND priority = ? AND count = 0", cell)
+
+def _unindex_duty(conn, project_id, duty_id):
+    conn.execute("DELETE FROM search_terms WHERE project_id = ? AND duty_id = ?", (project_id, duty_id))
+
+def _assigned_username(duty):
+    # older code paths wrote 'Assigned To' instead of 'AssignedTo'
+    return _username_of(duty.get('AssignedTo') or duty.get('Assigned To'))
+
+def _insert_project(conn, project, position):
+    conn.execute("INSERT INTO projects (id, position, title, leader, version) VALUES (?, ?, ?, ?, ?)",
+                 (project['ID'], position, project.get('Title'), _username_of(project.get('Leader')),
+                  project.get('Version')))
+    conn.executemany("INSERT OR IGNORE INTO project_members (project_id, position, username) VALUES (?, ?, ?)",
+                     [(project['ID'], i, _username_of(m)) for i, m in enumerate(project.get('Members', []))])
+    _index_document(conn, project['ID'], None, project_terms(project))
+    for i, duty in enumerate(project.get('Duties', [])):
+        _insert_duty(conn, project['ID'], duty, i)
+
+def _delete_project(conn, project_id):
+    for table, column in (('projects', 'id'), ('project_members', 'project_id'),
+                          ('duties', 'project_id'), ('duty_assignees', 'project_id'),
+                          ('search_terms', 'project_id'), ('duty_counts', 'project_id'),
+                          ('archived_segments', 'project_id')):
+        conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (project_id,))
+
+# Moves duties of a project to a new segment, within the change's
+# transaction
+def _archive_duties(conn, project_id, duty_ids):
+    where = f"project_id = ? AND duty_id IN ({','.join('?' * len(duty_ids))})"
+    params = [project_id] + list(duty_ids)
+    rows = conn.execute(f"SELECT * FROM duties WHERE {where} ORDER BY position", params).fetchall()
+    if not rows:
+        return
+    assignee_rows = conn.execute(f"SELECT * FROM duty_assignees WHERE {where} ORDER BY duty_id, position",
+                                 params).fetchall()
+    users = _load_users_by_name(conn, {r['username'] for r in assignee_rows if r['embedded']})
+    assignees = {}
+    for assignee_row in assignee_rows:
+        assignees.setdefault(assignee_row['duty_id'], []).append(_assignee_from_row(assignee_row, users))
+    save_archived(conn, project_id, [_duty_from_row(row, assignees.get(row['duty_id'], [])) for row in rows])
+    for row in rows:
+        _count_duty(conn, project_id, row['status'], row['priority'], -1)
+    for table in ('duties', 'duty_assignees', 'search_terms'):
+        conn.execute(f"DELETE FROM {table} WHERE {where}", params)
+
+# Adds duties to a project's cold segments, e.g. the ones migrated from the
+# JSON storage's
+def save_archived(conn, project_id, duties):
+    conn.execute("INSERT INTO archived_segments (project_id, data) VALUES (?, ?)",
+                 (project_id, encode_segment(duties)))
+
+# Replace the whole table contents, like SaveUsers/SaveProjects rewriting
+# their file. Rows that break a unique index are skipped and returned.
+def save_users(conn, users):
+    skipped = []
+    with conn:
+        conn.execute("DELETE FROM users")
+        for user in users:
+            try:
+                _insert_user(conn, user)
+            except sqlite3.IntegrityError:
+                skipped.append(user)
+    return skipped
+
+def save_projects(conn, projects):
+    skipped = []
+    with conn:
+        for table in ('projects', 'project_members', 'duties', 'duty_assignees', 'search_terms', 'duty_counts'):
+            conn.execute(f"DELETE FROM {table}")
+        for position, project in enumerate(projects):
+            try:
+                _insert_project(conn, project, position)
+            except sqlite3.IntegrityError:
+                _delete_project(conn, project['ID'])
+                skipped.append(project)
+    return skipped
+
+def _apply(conn, record):
+    kind = record['type']
+    if kind == USER_CREATED:
+        _insert_user(conn, record['user'])
+    elif kind == PROJECT_CREATED:
+        _insert_project(conn, record['project'], _next_position(conn, 'projects'))
+    elif kind == PROJECT_DELETED:
+        _delete_project(conn, record['project_id'])
+    elif kind == MEMBER_ADDED:
+        conn.execute("INSERT OR IGNORE INTO project_members (project_id, position, username) VALUES (?, ?, ?)",
+                     (record['project_id'],
+                      _next_position(conn, 'project_members', "WHERE project_id = ?", (record['project_id'],)),
+                      record['username']))
+    elif kind == MEMBER_REMOVED:
+        conn.execute("DELETE FROM project_members WHERE project_id = ? AND username = ?",
+                     (record['project_id'], record['username']))
+    elif kind == DUTY_CREATED:
+        _insert_duty(conn, record['project_id'], record['duty'],
+                     _next_position(conn, 'duties', "WHERE project_id = ?", (record['project_id'],)))
+    elif kind in (DUTY_ASSIGNED, DUTY_UNASSIGNED, DUTY_UPDATED, STATUS_CHANGED):
+        _update_duty_fields(conn, record['project_id'], record['duty_id'], record['fields'])
+    elif kind == DUTIES_ARCHIVED:
+        _archive_duties(conn, record['project_id'], record['duty_ids'])
+    if 'version' in record:
+        conn.execute("UPDATE projects SET version = ? WHERE id = ?", (record['version'], record['project_id']))
+
+def _update_duty_fields(conn, project_id, duty_id, fields):
+    row = conn.execute("SELECT extra, status, priority FROM duties WHERE project_id = ? AND duty_id = ?",
+                       (project_id, duty_id)).fetchone()
+    if row is None:
+        return
+    if 'Status' in fields or 'Priority' in fields:
+        _count_duty(conn, project_id, row['status'], row['priority'], -1)
+        _count_duty(conn, project_id, fields.get('Status', row['status']), fields.get('Priority', row['priority']), 1)
+    extra = json.loads(row['extra'])
+    assignments = []
+    params = []
+    for key, value in fields.items():
+        if key in DUTY_COLUMNS:
+            assignments.append(f"{DUTY_COLUMNS[key]} = ?")
+            params.append(value)
+        elif key == 'Assignees':
+            conn.execute("DELETE FROM duty_assignees WHERE project_id = ? AND duty_id = ?", (project_id, duty_id))
+            conn.executemany("INSERT INTO duty_assignees (project_id, duty_id, position, username, embedded) "
+                             "VALUES (?, ?, ?, ?, ?)",
+                             [(project_id, duty_id, i, _username_of(a), int(isinstance(a, dict)))
+                              for i, a in enumerate(value)])
+        else:
+            extra[key] = value
+    assignments.append("extra = ?")
+    params.append(json.dumps(extra))
+    assignments.append("assigned_to = ?")
+    params.append(_assigned_username(extra))
+    assignments.append("finish_time = ?")
+    params.append(finish_timestamp(extra))
+    conn.execute(f"UPDATE duties SET {', '.join(assignments)} WHERE project_id = ? AND duty_id = ?",
+                 params + [project_id, duty_id])
+    if 'Title' in fields or 'Detail' in fields:
+        row = conn.execute("SELECT title, detail FROM duties WHERE project_id = ? AND duty_id = ?",
+                           (project_id, duty_id)).fetchone()
+        _unindex_duty(conn, project_id, duty_id)
+        _index_document(conn, project_id, duty_id, duty_terms({'Title': row['title'], 'Detail': row['detail']}))
+
+def _counts_from_rows(rows):
+    counts = {}
+    for row in rows:
+        counts.setdefault(row['status'] or None, {})[row['priority'] or None] = row['count']
+    return counts
+
+# Same interface as storage.Repository, but every lookup is an indexed query
+# against the database instead of an in-memory copy of the JSON files.
+class SqliteRepository:
+    def __init__(self, database_path):
+        self._conn = connect(database_path)
+        # project ID -> version the caller last read through get_project()
+        self._seen_versions = {}
+        # in batch mode every change joins one transaction, committed by
+        # commit_batch()
+        self._batching = False
+
+    # Nothing is cached; a new operation starts without any versions seen
+    def refresh(self):
+        self._seen_versions = {}
+
+    def get_users(self):
+        return load_users(self._conn)
+
+    def get_projects(self):
+        return load_projects(self._conn)
+
+    # Generators over open cursors, so a page costs the rows it shows
+    def iter_users(self):
+        for row in self._conn.execute("SELECT * FROM users ORDER BY rowid"):
+            yield _user_from_row(row)
+
+    def iter_project_summaries(self):
+        for row in self._conn.execute("SELECT id, title, leader FROM projects ORDER BY position"):
+            members = [r['username'] for r in self._conn.execute(
+                "SELECT username FROM project_members WHERE project_id = ? ORDER BY position", (row['id'],))]
+            yield {'ID': row['id'], 'Title': row['title'], 'Leader': row['leader'], 'Members': members}
+
+    def iter_duties(self, project_id, status=None):
+        if status is None:
+            rows = self._conn.execute("SELECT * FROM duties WHERE project_id = ? ORDER BY position", (project_id,))
+        else:
+            rows = self._conn.execute("SELECT * FROM duties WHERE project_id = ? AND status = ? ORDER BY position",
+                                      (project_id, status))
+        for row in rows:
+            yield self._duty_with_assignees(row)
+
+    # Same as storage.Repository.get_board, from the duty_counts table
+    def get_board(self, project_id):
+        row = self._conn.execute("SELECT id, title FROM projects WHERE id = ?", (project_id,)).fetchone()
+        if row is None:
+            return None
+        rows = self._conn.execute("SELECT status, priority, count FROM duty_counts WHERE project_id = ?", (project_id,))
+        return {'ID': row['id'], 'Title': row['title'], 'Counts': _counts_from_rows(rows)}
+
+    def get_board_summary(self):
+        cells = {}
+        for row in self._conn.execute("SELECT * FROM duty_counts"):
+            cells.setdefault(row['project_id'], []).append(row)
+        return [{'ID': row['id'], 'Title': row['title'], 'Counts': _counts_from_rows(cells.get(row['id'], []))}
+                for row in self._conn.execute("SELECT id, title FROM projects ORDER BY position")]
+
+    def get_project_summaries(self):
+        members = {}
+        for row in self._conn.execute("SELECT project_id, username FROM project_members ORDER BY project_id, position"):
+            members.setdefault(row['project_id'], []).append(row['username'])
+        return [{'ID': row['id'], 'Title': row['title'], 'Leader': row['leader'], 'Members': members.get(row['id'], [])}
+                for row in self._conn.execute("SELECT id, title, leader FROM projects ORDER BY position")]
+
+    def get_user(self, username):
+        row = self._conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+        return _user_from_row(row) if row else None
+
+    def get_user_by_email(self, emailaddress):
+        row = self._conn.execute("SELECT * FROM users WHERE emailaddress = ?", (emailaddress,)).fetchone()
+        return _user_from_row(row) if row else None
+
+    def get_project(self, project_id):
+        rows = self._conn.execute("SELECT * FROM projects WHERE id = ?", (project_id,)).fetchall()
+        projects = _load_project_rows(self._conn, rows)
+        if not projects:
+            self._seen_versions.pop(project_id, None)
+            return None
+        self._seen_versions[project_id] = projects[0].get('Version', 0)
+        return projects[0]
+
+    def get_duty(self, project_id, duty_id):
+        row = self._conn.execute("SELECT * FROM duties WHERE project_id = ? AND duty_id = ?",
+                                 (project_id, duty_id)).fetchone()
+        if row is None:
+            return None
+        return self._duty_with_assignees(row)
+
+    def _duty_with_assignees(self, row):
+        assignee_rows = self._conn.execute(
+            "SELECT * FROM duty_assignees WHERE project_id = ? AND duty_id = ? ORDER BY position",
+            (row['project_id'], row['duty_id'])).fetchall()
+        users = _load_users_by_name(self._conn, {r['username'] for r in assignee_rows if r['embedded']})
+        return _duty_from_row(row, [_assignee_from_row(r, users) for r in assignee_rows])
+
+    def get_project_count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM projects").fetchone()[0]
+
+    # Answered from the leader, member and assignee username indexes
+    def get_user_projects(self, username):
+        led = self._conn.execute("SELECT id, title, leader FROM projects WHERE leader = ? ORDER BY position",
+                                 (username,)).fetchall()
+        joined = self._conn.execute(
+            "SELECT id, title, leader FROM projects WHERE leader IS NOT ? AND id IN ("
+            "SELECT project_id FROM project_members WHERE username = ? UNION "
+            "SELECT project_id FROM duty_assignees WHERE username = ? UNION "
+            "SELECT project_id FROM duties WHERE assigned_to = ?) ORDER BY position",
+            (username, username, username, username)).fetchall()
+        return tuple([{'ID': row['id'], 'Title': row['title'], 'Leader': row['leader']} for row in rows]
+                     for rows in (led, joined))
+
+    # Same results as storage.Repository.query_duties, answered from the
+    # status, priority, assignee and finish_time indexes
+    def query_duties(self, assignee=None, statuses=None, priorities=None, due_after=None, due_before=None):
+        conditions = []
+        params = []
+        if assignee is not None:
+            conditions.append("(assigned_to = ? OR EXISTS (SELECT 1 FROM duty_assignees a WHERE a.project_id = "
+                              "duties.project_id AND a.duty_id = duties.duty_id AND a.username = ?))")
+            params += [assignee, assignee]
+        for column, values in (('status', statuses), ('priority', priorities)):
+            if values is not None:
+                values = list(values)
+                conditions.append(f"{column} IN ({','.join('?' * len(values))})")
+                params += values
+        if due_after is not None:
+            conditions.append("finish_time >= ?")
+            params.append(due_after)
+        if due_before is not None:
+            conditions.append("finish_time < ?")
+            params.append(due_before)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = self._conn.execute(f"SELECT * FROM duties {where} "
+                                  "ORDER BY finish_time IS NULL, finish_time, project_id, duty_id", params).fetchall()
+        return [(row['project_id'], self._duty_with_assignees(row)) for row in rows]
+
+    # Same results as storage.Repository.get_deadlines, read in order from the
+    # partial index over open duties
+    def get_deadlines(self, due_after=None, due_before=None, limit=None):
+        conditions = ["status IN ('BACKLOG', 'TODO', 'DOING')", "finish_time IS NOT NULL"]
+        params = []
+        if due_after is not None:
+            conditions.append("finish_time >= ?")
+            params.append(due_after)
+        if due_before is not None:
+            conditions.append("finish_time < ?")
+            params.append(due_before)
+        rows = self._conn.execute(f"SELECT * FROM duties INDEXED BY duties_deadlines WHERE {' AND '.join(conditions)} "
+                                  "ORDER BY finish_time, project_id, duty_id LIMIT ?",
+                                  params + [limit if limit is not None else -1]).fetchall()
+        return [(row['finish_time'], row['project_id'], self._duty_with_assignees(row)) for row in rows]
+
+    # Same results as storage.Repository.search, ranked from the rows of the
+    # words each query term is a prefix of
+    def search(self, query, limit):
+        matches = []
+        for term in dict.fromkeys(tokenize(query)):
+            postings = {}
+            for row in self._conn.execute("SELECT term, project_id, duty_id, weight FROM search_terms "
+                                          "WHERE term >= ? AND term < ?", (term, term + '\U0010ffff')):
+                postings.setdefault(row['term'], {})[(row['project_id'], row['duty_id'])] = row['weight']
+            matches.append([(token == term, documents) for token, documents in postings.items()])
+        if not matches:
+            return []
+        document_count = self._conn.execute(
+            "SELECT (SELECT COUNT(*) FROM projects) + (SELECT COUNT(*) FROM duties)").fetchone()[0]
+        return rank(matches, document_count, limit)
+
+    # Like storage.Repository, the methods below raise ConflictError when
+    # another process changed the same data after the caller looked at it.
+
+    def add_user(self, user):
+        user.setdefault('role', '')
+        self._commit({'type': USER_CREATED, 'user': user})
+
+    # Bulk version of add_user: one transaction. Accounts whose username or
+    # email is already taken are skipped and returned.
+    def add_users(self, users):
+        skipped = []
+        with measure('disk'), self._transaction():
+            for user in users:
+                user.setdefault('role', '')
+                try:
+                    _insert_user(self._conn, user)
+                except sqlite3.IntegrityError:
+                    skipped.append(user)
+        return skipped
+
+    def add_project(self, project):
+        project['Version'] = 1
+        self._commit({'type': PROJECT_CREATED, 'project': project})
+
+    def remove_project(self, project_id):
+        self._commit_project_change({'type': PROJECT_DELETED, 'project_id': project_id})
+
+    def add_member(self, project_id, username):
+        self._commit_project_change({'type': MEMBER_ADDED, 'project_id': project_id, 'username': username})
+
+    def remove_member(self, project_id, username):
+        self._commit_project_change({'type': MEMBER_REMOVED, 'project_id': project_id, 'username': username})
+
+    def add_duty(self, project_id, duty):
+        self._commit_project_change({'type': DUTY_CREATED, 'project_id': project_id, 'duty': duty})
+
+    def assign_duty(self, project_id, duty_id, fields):
+        self._commit_duty_fields(DUTY_ASSIGNED, project_id, duty_id, fields)
+
+    def unassign_duty(self, project_id, duty_id, fields):
+        self._commit_duty_fields(DUTY_UNASSIGNED, project_id, duty_id, fields)
+
+    def update_duty(self, project_id, duty_id, fields):
+        kind = STATUS_CHANGED if list(fields) == ['Status'] else DUTY_UPDATED
+        self._commit_duty_fields(kind, project_id, duty_id, fields)
+
+    def _commit_duty_fields(self, kind, project_id, duty_id, fields):
+        self._commit_project_change({'type': kind, 'project_id': project_id, 'duty_id': duty_id, 'fields': fields})
+        self._archive_on_save(project_id)
+
+    # Same as storage.Repository.archive_duties; the duties move to an
+    # archived_segments row in the same transaction that deletes them
+    def archive_duties(self, project_id, done_before):
+        duty_ids = [row['duty_id'] for row in self._conn.execute(
+            "SELECT duty_id FROM duties WHERE project_id = ? AND "
+            "(status = 'ARCHIVED' OR (status = 'DONE' AND finish_time < ?)) ORDER BY position",
+            (project_id, done_before))]
+        if not duty_ids:
+            return 0
+        self._commit_project_change({'type': DUTIES_ARCHIVED, 'project_id': project_id, 'duty_ids': duty_ids})
+        return len(duty_ids)
+
+    # Same as storage.Repository._archive_on_save, checking duty_counts
+    def _archive_on_save(self, project_id):
+        if not config.ARCHIVE_ON_SAVE:
+            return
+        if self._conn.execute("SELECT 1 FROM duty_counts WHERE project_id = ? AND status IN ('DONE', 'ARCHIVED')",
+                              (project_id,)).fetchone():
+            try:
+                self.archive_duties(project_id, time.time() - config.ARCHIVE_DONE_AFTER)
+            except ConflictError:
+                pass
+
+    # Same as storage.Repository.iter_archived_duties
+    def iter_archived_duties(self, project_id):
+        hot = {row['duty_id'] for row in self._conn.execute("SELECT duty_id FROM duties WHERE project_id = ?",
+                                                            (project_id,))}
+        segments = self._conn.execute("SELECT data FROM archived_segments WHERE project_id = ? ORDER BY seq",
+                                      (project_id,)).fetchall()
+        return iter(archived_duties([duty for row in segments for duty in decode_segments(row['data'])], hot))
+
+    # One write transaction per change; in batch mode, a savepoint in the
+    # batch's transaction instead, so a failed change is rolled back alone
+    @contextmanager
+    def _transaction(self):
+        if not self._batching:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                yield
+            return
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute("SAVEPOINT change")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK TO change")
+            raise
+        finally:
+            self._conn.execute("RELEASE change")
+
+    def _commit(self, record):
+        try:
+            # the whole transaction, commit included, counts as disk time
+            with measure('disk'), self._transaction():
+                changes = self._history_entries(record)
+                _apply(self._conn, record)
+                self._add_history(changes)
+        except sqlite3.IntegrityError:
+            # a unique index caught a duplicate created by another process
+            raise ConflictError(f"'{record['type']}' conflicts with a change made by another process.")
+
+    # The version check runs inside the write transaction, so no other
+    # writer can change the project between the check and the update. Same
+    # rules as storage.check_version: creating a duty only needs its ID free.
+    def _commit_project_change(self, record):
+        project_id = record['project_id']
+        seen = self._seen_versions.get(project_id)
+        with measure('disk'), self._transaction():
+            row = self._conn.execute("SELECT version FROM projects WHERE id = ?", (project_id,)).fetchone()
+            if row is None:
+                raise ConflictError(f"Project '{project_id}' was deleted by another process.")
+            if record['type'] == DUTY_CREATED:
+                if self._conn.execute("SELECT 1 FROM duties WHERE project_id = ? AND duty_id = ?",
+                                      (project_id, record['duty']['ID'])).fetchone():
+                    raise ConflictError(f"Duty '{record['duty']['ID']}' was created by another process.")
+            elif project_id in self._seen_versions and (row['version'] or 0) != seen:
+                raise ConflictError(f"Project '{project_id}' was changed by another process.")
+            record['version'] = (row['version'] or 0) + 1
+            changes = self._history_entries(record)
+            _apply(self._conn, record)
+            self._add_history(changes)
+        # a duty created over changes this process has not seen leaves them
+        # for the next change to find
+        if record['type'] != DUTY_CREATED or seen == record['version'] - 1:
+            self._seen_versions[project_id] = record['version']
+
+    def _history_entries(self, record):
+        return history.entries(record, self.get_project, self.get_duty, round(time.time(), 3),
+                               history.current_actor())
+
+    def _add_history(self, pairs):
+        entries = history.with_checkpoints(pairs, self._changes_since_checkpoint, {})
+        self._conn.executemany(
+            "INSERT INTO history (project_id, duty_id, time, kind, entry) VALUES (?, ?, ?, ?, ?)",
+            [(entry['project_id'], entry['duty_id'] or '', entry['time'], entry['kind'], json.dumps(entry))
+             for entry in entries])
+
+    def _changes_since_checkpoint(self, key):
+        rows = self._conn.execute("SELECT kind FROM history WHERE project_id = ? AND duty_id = ? "
+                                  "ORDER BY seq DESC LIMIT ?",
+                                  (key[0], key[1] or '', config.HISTORY_CHECKPOINT_EVERY + 1)).fetchall()
+        return history.count_since_base([row['kind'] for row in reversed(rows)])
+
+    # Same results as storage.Repository.get_changes
+    def get_changes(self, project_id, duty_id=None, since=None):
+        conditions = ["project_id = ?", "kind != 'checkpoint'"]
+        params = [project_id]
+        if duty_id is not None:
+            conditions.append("duty_id = ?")
+            params.append(duty_id)
+        if since is not None:
+            conditions.append("time > ?")
+            params.append(since)
+        rows = self._conn.execute(f"SELECT entry FROM history WHERE {' AND '.join(conditions)} ORDER BY seq",
+                                  params).fetchall()
+        return [json.loads(row['entry']) for row in rows]
+
+    # Same results as storage.Repository.get_as_of: the entries from the
+    # last checkpoint (or creation) before when on, replayed
+    def get_as_of(self, project_id, duty_id, when):
+        key = (project_id, duty_id or '')
+        base = self._conn.execute(
+            "SELECT seq FROM history WHERE project_id = ? AND duty_id = ? AND kind IN ('created', 'checkpoint') "
+            "AND time <= ? ORDER BY time DESC, seq DESC LIMIT 1", key + (when,)).fetchone()
+        if base is None:
+            first = self._conn.execute("SELECT kind, entry FROM history WHERE project_id = ? AND duty_id = ? "
+                                       "ORDER BY seq LIMIT 1", key).fetchone()
+            if first is not None and first['kind'] == 'checkpoint':
+                return json.loads(first['entry'])['state']
+            return None
+        rows = self._conn.execute("SELECT entry FROM history WHERE project_id = ? AND duty_id = ? AND seq >= ? "
+                                  "AND time <= ? ORDER BY seq", key + (base['seq'], when)).fetchall()
+        return history.replay(json.loads(row['entry']) for row in rows)
+
+    def compact(self):
+        self._conn.execute("VACUUM")
+
+    # Batches, as in storage.Repository. The database stays locked for
+    # writing from the first change of a batch to commit_batch(), so there
+    # is never a conflict to report; other processes' writes wait for the
+    # commit meanwhile (up to the connection timeout), so batches are
+    # committed promptly.
+    def begin_batch(self):
+        self._batching = True
+
+    def commit_batch(self):
+        if self._conn.in_transaction:
+            with measure('disk'):
+                self._conn.commit()
+
+    # Rolls back whatever was not committed
+    def end_batch(self):
+        if self._conn.in_transaction:
+            self._conn.rollback()
+        self._batching = False
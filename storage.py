@@ -0,0 +1,1124 @@
+import functools
+import hashlib
+import json
+import os
+import textwrap
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, closing, contextmanager
+import config
+import history
+import snapshot_codec
+import user_index
+from archive import ColdStore, archivable_duties, archived_duties
+from history import HistoryLog, history_path
+from indexes import DutyIndex, MembershipIndex, SearchIndex, duty_counts, duty_usernames, saved_search_index
+from instrumentation import add_count, measure
+from locking import ConflictError, atomic_write, file_lock, lock_path
+from journal import (Journal, encode_records, journal_path, read_journal, apply_user_mutation,
+                     apply_project_mutation, USER_CREATED, PROJECT_CREATED, PROJECT_DELETED, MEMBER_ADDED, MEMBER_REMOVED,
+                     DUTY_CREATED, DUTY_ASSIGNED, DUTY_UNASSIGNED, DUTY_UPDATED, STATUS_CHANGED,
+                     DUTIES_ARCHIVED, ASSIGNEES_CHANGED, COUNTS_CHANGED)
+
+# Two storage engines are available, chosen with config.STORAGE_BACKEND:
+#   json   - users.json / projects.json are snapshots; the changes made since
+#            the last snapshot live in users.journal / projects.journal and
+#            are replayed on load.
+#   sharded - users as above; projects split into one snapshot + journal per
+#            project in config.PROJECTS_DIR, plus a manifest holding each
+#            project's ID, title, leader and members. Listing projects reads
+#            only the manifest, a project operation only its own file.
+#   sqlite - normalized tables in config.DATABASE_PATH (see sqlite_storage).
+# LoadUsers/SaveUsers/LoadProjects/SaveProjects read and write whichever one
+# is configured; the *_json_* and *_sharded_* functions always use the JSON
+# files and the project directory.
+
+def _read_snapshot(file_path):
+    if not os.path.exists(file_path):
+        return []
+    with measure('disk'):
+        with open(file_path, 'rb') as file:
+            data = file.read()
+    with measure('parse'):
+        items = snapshot_codec.decode(data) if snapshot_codec.is_binary(data) else json.loads(data)
+    add_count('bytes_read', len(data))
+    add_count('records_scanned', len(items))
+    return items
+
+# The contents of a snapshot of items in snapshot_format ('json' or 'binary')
+def encode_snapshot(items, snapshot_format=None):
+    if (snapshot_format or config.SNAPSHOT_FORMAT) == 'binary':
+        return snapshot_codec.encode(items)
+    return json.dumps(items, indent=4).encode()
+
+# Callers hold the exclusive lock on file_path, so no journal append can slip
+# in between writing the snapshot and truncating the journal.
+def _write_snapshot(items, file_path):
+    with measure('serialize'):
+        data = encode_snapshot(items)
+    with measure('disk'):
+        atomic_write(file_path, lambda file: file.write(data), 'wb')
+    add_count('bytes_written', len(data))
+    # the snapshot now holds everything the journal did
+    if os.path.exists(journal_path(file_path)):
+        os.truncate(journal_path(file_path), 0)
+
+# Yields the items of a JSON array file one at a time, holding only about
+# one item in memory, for files too big to json.load() at once.
+def iter_json_array(file_path, chunk_size=64 * 1024):
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r') as file:
+        buffer = ''
+        opened = False
+        while True:
+            buffer = buffer.lstrip()
+            if not opened and buffer.startswith('['):
+                buffer = buffer[1:]
+                opened = True
+                continue
+            if opened and buffer.startswith(']'):
+                return
+            if opened and buffer.startswith(','):
+                buffer = buffer[1:]
+                continue
+            if opened and buffer:
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    pass  # the item continues in the next chunk
+                else:
+                    yield item
+                    buffer = buffer[end:]
+                    continue
+            # read at least as much as is buffered, so a big item is
+            # re-parsed a logarithmic number of times rather than per chunk
+            chunk = file.read(max(chunk_size, len(buffer)))
+            if not chunk:
+                raise ValueError(f"{file_path} does not hold a complete JSON array.")
+            buffer += chunk
+
+# Yields the items of a snapshot file in either format, like iter_json_array
+def iter_snapshot(file_path):
+    with open(file_path, 'rb') as file:
+        binary = snapshot_codec.is_binary(file.read(len(snapshot_codec.MAGIC)))
+    if not binary:
+        yield from iter_json_array(file_path)
+        return
+    with open(file_path, 'rb') as file:
+        yield from snapshot_codec.iter_decode(file)
+
+# Writes items in the same layout as json.dump(items, file, indent=4)
+def write_json_array(file, items):
+    file.write('[')
+    empty = True
+    for item in items:
+        file.write('\n' if empty else ',\n')
+        file.write(textwrap.indent(json.dumps(item, indent=4), '    '))
+        empty = False
+    file.write(']' if empty else '\n]')
+
+# Maps key -> first item with that key, like the old linear scans found
+def _build_index(items, key):
+    index = {}
+    for item in items:
+        index.setdefault(item[key], item)
+    return index
+
+def _replay(file_path, items, index, apply, offset=0):
+    for record, offset in read_journal(journal_path(file_path), offset):
+        apply(items, index, record)
+    return offset
+
+def _fill_user_defaults(user):
+    if 'role' not in user:
+        user['role'] = ''
+
+def load_json_users(file_path='users.json'):
+    with file_lock(lock_path(file_path), shared=True):
+        users = _read_snapshot(file_path)
+        _replay(file_path, users, _build_index(users, 'username'), apply_user_mutation)
+    for user in users:
+        _fill_user_defaults(user)
+    return users
+
+def save_json_users(users, file_path='users.json'):
+    with file_lock(lock_path(file_path)):
+        _write_snapshot(users, file_path)
+        _write_user_index(file_path, users)
+
+# The username index of users, just written to file_path with the journal
+# emptied (after compaction, for example); see user_index.py
+def _write_user_index(file_path, users):
+    journal_sig = file_signature(journal_path(file_path))
+    user_index.build(file_path, users, file_signature(file_path), journal_sig[0] if journal_sig else 0, 0)
+
+def load_json_projects(file_path='projects.json'):
+    with file_lock(lock_path(file_path), shared=True):
+        projects = _read_snapshot(file_path)
+        _replay(file_path, projects, _build_index(projects, 'ID'), apply_project_mutation)
+    return projects
+
+def save_json_projects(projects, file_path='projects.json'):
+    with file_lock(lock_path(file_path)):
+        _write_snapshot(projects, file_path)
+
+def shard_path(directory, project_id):
+    # project IDs are user input, so they are hashed into a safe file name
+    return os.path.join(directory, hashlib.sha1(str(project_id).encode()).hexdigest() + '.json')
+
+def manifest_path(directory):
+    return os.path.join(directory, 'manifest.json')
+
+def _record_project_id(record):
+    return record['project']['ID'] if record['type'] == PROJECT_CREATED else record['project_id']
+
+def _project_assignees(project):
+    assignees = set()
+    for duty in project.get('Duties', []):
+        assignees |= duty_usernames(duty)
+    return sorted(assignees)
+
+# The part of a project the manifest keeps
+def _summary(project):
+    return {'ID': project['ID'], 'Title': project.get('Title'), 'Leader': project.get('Leader'),
+            'Members': list(project.get('Members', [])), 'Assignees': _project_assignees(project),
+            'Counts': duty_counts(project.get('Duties', []))}
+
+def load_sharded_projects(directory=None):
+    directory = directory or config.PROJECTS_DIR
+    with file_lock(lock_path(manifest_path(directory)), shared=True):
+        summaries = _read_snapshot(manifest_path(directory))
+        _replay(manifest_path(directory), summaries, _build_index(summaries, 'ID'), apply_project_mutation)
+    projects = []
+    for summary in summaries:
+        path = shard_path(directory, summary['ID'])
+        with file_lock(lock_path(path), shared=True):
+            shard = _read_snapshot(path)
+            _replay(path, shard, _build_index(shard, 'ID'), apply_project_mutation)
+        projects.extend(shard)
+    return projects
+
+# Writes every project to its own file and a new manifest. projects may be
+# any iterable (such as iter_json_array()), it is only walked once. Projects
+# whose ID was already written are skipped and returned.
+def save_sharded_projects(projects, directory=None):
+    directory = directory or config.PROJECTS_DIR
+    os.makedirs(directory, exist_ok=True)
+    summaries = []
+    written = set()
+    skipped = []
+    with file_lock(lock_path(manifest_path(directory))):
+        for project in projects:
+            path = shard_path(directory, project['ID'])
+            if path in written:
+                skipped.append(project)
+                continue
+            with file_lock(lock_path(path)):
+                _write_snapshot([project], path)
+            written.add(path)
+            summaries.append(_summary(project))
+        # projects that are no longer there keep an empty file
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith('.json') and path != manifest_path(directory) and path not in written:
+                with file_lock(lock_path(path)):
+                    _write_snapshot([], path)
+        _write_snapshot(summaries, manifest_path(directory))
+    return skipped
+
+# The search index of a projects snapshot (or project file) is saved next
+# to it when the snapshot is compacted, together with the snapshot's
+# signature. It is only loaded while that snapshot is current; the journal is
+# then replayed onto it as onto the snapshot.
+def search_path(file_path):
+    return os.path.splitext(file_path)[0] + '.search'
+
+# The search index saved for the current snapshot of file_path (see
+# indexes.saved_search_index), or None when there is none
+def _read_search_index(file_path):
+    snapshot_sig = file_signature(file_path)
+    path = search_path(file_path)
+    if snapshot_sig is None or not os.path.exists(path):
+        return None
+    with measure('disk'):
+        with open(path, 'rb') as file:
+            data = file.read()
+    with measure('parse'):
+        saved = json.loads(data)
+    add_count('bytes_read', len(data))
+    if saved.get('snapshot') != list(snapshot_sig):
+        return None
+    return saved
+
+# Called as a store's on_compact, with the projects just written to file_path
+def _write_search_index(file_path, projects):
+    with measure('serialize'):
+        data = json.dumps({'snapshot': file_signature(file_path), **saved_search_index(projects)})
+    with measure('disk'):
+        atomic_write(search_path(file_path), lambda file: file.write(data))
+    add_count('bytes_written', len(data))
+
+# Writes the items of the snapshot source to output in snapshot_format, one
+# block or item at a time. Converting a snapshot in place keeps its journal
+# and its saved search index, which both still apply.
+def convert_snapshot(source, output, snapshot_format):
+    with file_lock(lock_path(source)):
+        saved_search = _read_search_index(source) if output == source else None
+        if snapshot_format == 'binary':
+            atomic_write(output, lambda file: snapshot_codec.encode_to(file, iter_snapshot(source)), 'wb')
+        else:
+            atomic_write(output, lambda file: write_json_array(file, iter_snapshot(source)))
+        if saved_search is not None:
+            saved_search['snapshot'] = file_signature(output)
+            atomic_write(search_path(output), lambda file: json.dump(saved_search, file))
+
+def _use_sqlite():
+    return config.STORAGE_BACKEND == 'sqlite'
+
+def _use_shards():
+    return config.STORAGE_BACKEND == 'sharded'
+
+# sqlite3 is only imported when the SQLite backend is in use
+def _sqlite_connection():
+    import sqlite_storage
+    return closing(sqlite_storage.connect(config.DATABASE_PATH))
+
+def LoadUsers(file_path='users.json'):
+    if _use_sqlite():
+        import sqlite_storage
+        with _sqlite_connection() as conn:
+            return sqlite_storage.load_users(conn)
+    return load_json_users(file_path)
+
+def SaveUsers(users, file_path='users.json'):
+    if _use_sqlite():
+        import sqlite_storage
+        with _sqlite_connection() as conn:
+            sqlite_storage.save_users(conn, users)
+    else:
+        save_json_users(users, file_path)
+
+def LoadProjects(file_path='projects.json'):
+    if _use_sqlite():
+        import sqlite_storage
+        with _sqlite_connection() as conn:
+            return sqlite_storage.load_projects(conn)
+    if _use_shards():
+        return load_sharded_projects()
+    return load_json_projects(file_path)
+
+def SaveProjects(projects, file_path='projects.json'):
+    if _use_sqlite():
+        import sqlite_storage
+        with _sqlite_connection() as conn:
+            sqlite_storage.save_projects(conn, projects)
+    elif _use_shards():
+        save_sharded_projects(projects)
+    else:
+        save_json_projects(projects, file_path)
+
+# (inode, size, mtime) of a data file, or None when it does not exist
+def file_signature(file_path):
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+# One snapshot + journal pair held in memory. Changes are appended to the
+# journal and applied to the in-memory list; the snapshot is rewritten only
+# when the journal outgrows it.
+#
+# Locking: readers and writers hold the store lock shared, so only compaction
+# (which holds it exclusively) ever waits for everyone. Writers additionally
+# hold an exclusive lock on the item they change, so writers to different
+# projects never wait for each other.
+class _Store:
+    # apply(items, index, record) applies one journal record; on_load(items),
+    # if given, is called whenever the snapshot is (re)read, before the
+    # journal is replayed onto it, and on_compact(items) after compaction
+    # wrote a new snapshot.
+    def __init__(self, file_path, key, apply, on_load=None, on_compact=None):
+        self._path = file_path
+        self._key = key
+        self._apply = apply
+        self._on_load = on_load
+        self._on_compact = on_compact
+        self._journal = Journal(journal_path(file_path))
+        self._lock_path = lock_path(file_path)
+        self._items = []
+        self._index = {}
+        self._snapshot_sig = False
+        self._journal_ino = None
+        self._offset = 0
+        # journal lines appended in batch mode and not written yet, None
+        # outside it
+        self._batch = None
+        self._batch_count = 0
+
+    def get_items(self):
+        return self._items
+
+    def get_index(self):
+        return self._index
+
+    def get_path(self):
+        return self._path
+
+    # (snapshot signature, journal inode, journal offset) of what the
+    # in-memory state holds; None in batch mode, when it also holds records
+    # not written yet
+    def get_position(self):
+        if self._batch is not None:
+            return None
+        return self._snapshot_sig or None, self._journal_ino, self._offset
+
+    # Returns True when the in-memory state changed
+    def refresh(self):
+        if self._batch is not None:
+            return False
+        with file_lock(self._lock_path, shared=True):
+            return self._refresh()
+
+    def _refresh(self):
+        snapshot_sig = file_signature(self._path)
+        journal_sig = file_signature(self._journal.get_path())
+        journal_ino = journal_sig[0] if journal_sig else None
+        journal_size = journal_sig[1] if journal_sig else 0
+
+        if snapshot_sig == self._snapshot_sig and journal_ino == self._journal_ino:
+            if journal_size == self._offset:
+                return False
+            if journal_size > self._offset:
+                # only new records were appended: replay just the tail
+                self._offset = _replay(self._path, self._items, self._index, self._apply, self._offset)
+                return True
+
+        self._items = _read_snapshot(self._path)
+        self._index = _build_index(self._items, self._key)
+        if self._on_load is not None:
+            self._on_load(self._items)
+        self._offset = _replay(self._path, self._items, self._index, self._apply)
+        self._snapshot_sig = snapshot_sig
+        self._journal_ino = journal_ino
+        return True
+
+    # Locks one item (None locks every item of the store) and brings the
+    # in-memory state up to date, so the caller can re-check it before
+    # calling append(). Yields True when the state changed.
+    @contextmanager
+    def locked(self, name=None):
+        if self._batch is not None:
+            # checked when the batch is written instead
+            yield False
+            return
+        with file_lock(self._lock_path, shared=True):
+            with file_lock(lock_path(self._path, name if name is not None else '*')):
+                yield self._refresh()
+        # compaction takes the store lock exclusively, so it runs only after
+        # both locks above are released
+        self.compact_if_large()
+
+    def compact_if_large(self):
+        snapshot_sig = self._snapshot_sig or (0, 0, 0)
+        if self._offset > max(config.JOURNAL_COMPACT_MIN_BYTES, snapshot_sig[1]):
+            self.compact()
+
+    def append(self, record):
+        self.append_all([record])
+
+    def append_all(self, records):
+        if self._batch is not None:
+            # encoded now: later records change the objects these ones hold
+            self._batch.append(encode_records(records))
+            self._batch_count += len(records)
+            for record in records:
+                self._apply(self._items, self._index, record)
+            return
+        written = self._journal.append_all(records)
+        for record in records:
+            self._apply(self._items, self._index, record)
+        journal_sig = file_signature(self._journal.get_path())
+        if journal_sig[1] == self._offset + written and self._journal_ino in (None, journal_sig[0]):
+            self._journal_ino = journal_sig[0]
+            self._offset = journal_sig[1]
+        # otherwise a writer to another item appended too; the next refresh
+        # replays the tail, ours included, which is harmless because records
+        # are idempotent
+
+    def compact(self):
+        with file_lock(self._lock_path):
+            self._refresh()
+            self._journal.close()
+            _write_snapshot(self._items, self._path)
+            self._snapshot_sig = file_signature(self._path)
+            journal_sig = file_signature(self._journal.get_path())
+            self._journal_ino = journal_sig[0] if journal_sig else None
+            self._offset = 0
+            if self._on_compact is not None:
+                self._on_compact(self._items)
+
+    # Releases the journal descriptor; the next append reopens it
+    def close(self):
+        self._journal.close()
+
+    # Batch mode: the store is read once, and appended records are applied in
+    # memory and kept until write_batch() writes them in a single append.
+    # Nothing is locked or re-read in between; write_batch() runs under
+    # exclusive() after changed_on_disk() confirmed no one else wrote.
+    def begin_batch(self):
+        self.refresh()
+        self._batch = []
+        self._batch_count = 0
+
+    def exclusive(self):
+        return file_lock(self._lock_path)
+
+    def changed_on_disk(self):
+        journal_sig = file_signature(self._journal.get_path())
+        return (file_signature(self._path) != self._snapshot_sig
+                or (journal_sig[0] if journal_sig else None) != self._journal_ino
+                or (journal_sig[1] if journal_sig else 0) != self._offset)
+
+    def write_batch(self):
+        if self._batch:
+            self._offset += self._journal.append_encoded(b''.join(self._batch), self._batch_count)
+            self._journal_ino = file_signature(self._journal.get_path())[0]
+        self._batch = []
+        self._batch_count = 0
+
+    # Drops the unwritten records by re-reading the store from disk
+    def discard_batch(self):
+        self._batch = None
+        self._snapshot_sig = False
+        self.refresh()
+        self._batch = []
+        self._batch_count = 0
+
+    # Returns True when it dropped unwritten records
+    def end_batch(self):
+        discarded = bool(self._batch)
+        if discarded:
+            self.discard_batch()
+        self._batch = None
+        return discarded
+
+# In-memory copy of users and projects with dict indexes. The data is loaded
+# once per process and only re-read when a snapshot or journal file changes
+# (for example another process wrote to it). Every mutation goes through one
+# of the methods below and is recorded as a single journal record.
+class Repository:
+    def __init__(self, users_path='users.json', projects_path='projects.json'):
+        self._users = _Store(users_path, 'username', apply_user_mutation,
+                             on_compact=functools.partial(_write_user_index, users_path))
+        self._duty_index = DutyIndex()
+        self._memberships = MembershipIndex()
+        self._search = SearchIndex()
+        self._projects = _Store(projects_path, 'ID', self._apply_project,
+                                functools.partial(self._load_projects, projects_path),
+                                functools.partial(_write_search_index, projects_path))
+        self._history = HistoryLog(history_path(projects_path))
+        self._cold = ColdStore(config.ARCHIVE_DIR)
+        self._users_by_email = {}
+
+    def _load_projects(self, file_path, projects):
+        self._duty_index.reset(projects)
+        self._memberships.reset(projects)
+        saved = _read_search_index(file_path)
+        self._search.clear()
+        if saved is None:
+            self._search.add_projects(projects)
+        else:
+            self._search.load_saved(saved)
+
+    # Applies a project record and brings the indexes up to date with it
+    def _apply_project(self, projects, projects_by_id, record):
+        apply_project_mutation(projects, projects_by_id, record)
+        project = projects_by_id.get(_record_project_id(record))
+        self._duty_index.apply(record, project)
+        self._memberships.apply(record, project)
+        self._search.apply(record, project)
+
+    def refresh(self):
+        if self._users.refresh():
+            self._index_emails()
+        self._projects.refresh()
+
+    def _index_emails(self):
+        self._users_by_email = {}
+        for user in self._users.get_items():
+            _fill_user_defaults(user)
+            # setdefault keeps the first match, like the old linear scans did
+            self._users_by_email.setdefault(user.get('emailaddress'), user)
+
+    def get_users(self):
+        return self._users.get_items()
+
+    def get_projects(self):
+        return self._projects.get_items()
+
+    # ID, Title, Leader and Members of every project, for listings
+    def get_project_summaries(self):
+        return self._projects.get_items()
+
+    # Generators for the paged listings; they only read what is consumed
+    def iter_users(self):
+        return iter(self.get_users())
+
+    def iter_project_summaries(self):
+        return iter(self.get_project_summaries())
+
+    def iter_duties(self, project_id, status=None):
+        project = self.get_project(project_id)
+        duties = project['Duties'] if project else []
+        if status is None:
+            return iter(duties)
+        return (duty for duty in duties if duty.get('Status') == status)
+
+    # {'ID', 'Title', 'Counts'} of a project, or None when there is none.
+    # Counts is {status: {priority: number of duties}}, read from counters
+    # kept up to date as duties change, so no duty is looked at.
+    def get_board(self, project_id):
+        project = self.get_project(project_id)
+        if project is None:
+            return None
+        return {'ID': project_id, 'Title': project['Title'], 'Counts': self._duty_index.counts(project_id)}
+
+    # get_board() of every project, in listing order
+    def get_board_summary(self):
+        return [{'ID': project['ID'], 'Title': project['Title'], 'Counts': self._duty_index.counts(project['ID'])}
+                for project in self.get_project_summaries()]
+
+    # (project ID, duty) pairs matching every given condition, soonest
+    # finish time first; see indexes.DutyIndex.query
+    def query_duties(self, assignee=None, statuses=None, priorities=None, due_after=None, due_before=None):
+        return self._duty_index.query(assignee, statuses, priorities, due_after, due_before)
+
+    # (finish time, project ID, duty) of open duties by deadline; see
+    # indexes.DutyIndex.deadlines
+    def get_deadlines(self, due_after=None, due_before=None, limit=None):
+        return self._duty_index.deadlines(due_after, due_before, limit)
+
+    # Up to limit (project ID, duty ID, score) triples for the documents
+    # matching every word of query, best first; see indexes.SearchIndex
+    def search(self, query, limit):
+        return self._search.search(query, limit)
+
+    # (projects username leads, projects they are a member or assignee of)
+    def get_user_projects(self, username):
+        led, joined = self._memberships.projects_of(username)
+        return [self.get_project(project_id) for project_id in led], [self.get_project(project_id) for project_id in joined]
+
+    def get_user(self, username):
+        return self._users.get_index().get(username)
+
+    def get_user_by_email(self, emailaddress):
+        return self._users_by_email.get(emailaddress)
+
+    def get_project(self, project_id):
+        return self._projects.get_index().get(project_id)
+
+    def get_duty(self, project_id, duty_id):
+        project = self.get_project(project_id)
+        if project is None:
+            return None
+        return next((duty for duty in project['Duties'] if duty['ID'] == duty_id), None)
+
+    def get_project_count(self):
+        return len(self._projects.get_items())
+
+    # The methods below raise ConflictError when another process changed the
+    # same data after the caller looked at it; the caller re-validates and
+    # tries again (see main.retry_on_conflict).
+
+    def add_user(self, user):
+        _fill_user_defaults(user)
+        # a single lock for all accounts: both username and email must be unique
+        with self._users.locked() as changed:
+            if changed:
+                self._index_emails()
+            if self.get_user(user['username']) or self.get_user_by_email(user.get('emailaddress')):
+                raise ConflictError(f"Account '{user['username']}' was created by another process.")
+            self._users.append({'type': USER_CREATED, 'user': user})
+            self._users_by_email.setdefault(user.get('emailaddress'), user)
+            self._update_user_index()
+
+    # Bulk version of add_user: one lock, one journal write. Accounts whose
+    # username or email is already taken are skipped and returned.
+    def add_users(self, users):
+        skipped = []
+        with self._users.locked() as changed:
+            if changed:
+                self._index_emails()
+            records = []
+            usernames = set()
+            emails = set()
+            for user in users:
+                email = user.get('emailaddress')
+                if (user['username'] in usernames or email in emails
+                        or self.get_user(user['username']) or self.get_user_by_email(email)):
+                    skipped.append(user)
+                    continue
+                usernames.add(user['username'])
+                emails.add(email)
+                _fill_user_defaults(user)
+                records.append({'type': USER_CREATED, 'user': user})
+            if records:
+                self._users.append_all(records)
+                self._update_user_index()
+            for record in records:
+                self._users_by_email.setdefault(record['user'].get('emailaddress'), record['user'])
+        return skipped
+
+    # Adds the accounts just appended to the username index, holding the
+    # users lock. In batch mode they are only added by the next update;
+    # lookups find them in the journal until then.
+    def _update_user_index(self):
+        if self._users.get_position() is None:
+            return
+        try:
+            user_index.update(self._users.get_path())
+        except user_index.StaleIndex:
+            self.write_user_index()
+
+    # Writes the username index (see user_index.py) of the accounts held in
+    # memory
+    def write_user_index(self):
+        position = self._users.get_position()
+        if position is not None:
+            snapshot_sig, journal_ino, offset = position
+            user_index.build(self._users.get_path(), self._users.get_items(), snapshot_sig or (0, 0, 0),
+                             journal_ino or 0, offset)
+
+    def add_project(self, project):
+        with self._projects.locked(project['ID']):
+            if self.get_project(project['ID']) is not None:
+                raise ConflictError(f"Project '{project['ID']}' was created by another process.")
+            project['Version'] = 1
+            record = {'type': PROJECT_CREATED, 'project': project}
+            changes = self._history_entries(record, self.get_project)
+            self._projects.append(record)
+            self._history.add(changes)
+
+    def remove_project(self, project_id):
+        self._commit_project_change({'type': PROJECT_DELETED, 'project_id': project_id})
+        self._cold.remove(project_id)
+
+    def add_member(self, project_id, username):
+        self._commit_project_change({'type': MEMBER_ADDED, 'project_id': project_id, 'username': username})
+
+    def remove_member(self, project_id, username):
+        self._commit_project_change({'type': MEMBER_REMOVED, 'project_id': project_id, 'username': username})
+
+    def add_duty(self, project_id, duty):
+        self._commit_project_change({'type': DUTY_CREATED, 'project_id': project_id, 'duty': duty})
+
+    def assign_duty(self, project_id, duty_id, fields):
+        self._commit_duty_fields(DUTY_ASSIGNED, project_id, duty_id, fields)
+
+    def unassign_duty(self, project_id, duty_id, fields):
+        self._commit_duty_fields(DUTY_UNASSIGNED, project_id, duty_id, fields)
+
+    def update_duty(self, project_id, duty_id, fields):
+        kind = STATUS_CHANGED if list(fields) == ['Status'] else DUTY_UPDATED
+        self._commit_duty_fields(kind, project_id, duty_id, fields)
+
+    def _commit_duty_fields(self, kind, project_id, duty_id, fields):
+        self._commit_project_change({'type': kind, 'project_id': project_id, 'duty_id': duty_id, 'fields': fields})
+        self._archive_on_save(project_id)
+
+    # Moves the project's ARCHIVED duties, and its DONE duties that finished
+    # before done_before (epoch seconds), to its cold segments (see
+    # archive.py). Returns how many were moved.
+    def archive_duties(self, project_id, done_before):
+        project = self.get_project(project_id)
+        duties = archivable_duties(project['Duties'], done_before) if project else []
+        if not duties:
+            return 0
+        self._cold.add(project_id, duties)
+        self._commit_project_change({'type': DUTIES_ARCHIVED, 'project_id': project_id,
+                                     'duty_ids': list(dict.fromkeys(duty['ID'] for duty in duties))})
+        return len(duties)
+
+    # With config.ARCHIVE_ON_SAVE, a change to a duty also moves whatever of
+    # its project became cold. Only projects whose counters show DONE or
+    # ARCHIVED duties are looked at. A conflict leaves it to the next change.
+    def _archive_on_save(self, project_id):
+        if not config.ARCHIVE_ON_SAVE:
+            return
+        counts = self._duty_index.counts(project_id)
+        if 'DONE' in counts or 'ARCHIVED' in counts:
+            try:
+                self.archive_duties(project_id, time.time() - config.ARCHIVE_DONE_AFTER)
+            except ConflictError:
+                pass
+
+    # The duties moved to the project's cold segments, in the order they
+    # were moved; see archive.py
+    def iter_archived_duties(self, project_id):
+        project = self.get_project(project_id)
+        if project is None:
+            return iter([])
+        return iter(archived_duties(self._cold.duties(project_id), {duty['ID'] for duty in project['Duties']}))
+
+    def _project_version(self, project_id):
+        project = self.get_project(project_id)
+        return project.get('Version', 0) if project else None
+
+    # Optimistic check: the version the caller validated against must still
+    # be the current one once the project lock is held (see check_version).
+    def _commit_project_change(self, record):
+        project_id = record['project_id']
+        seen = self._project_version(project_id)
+        with self._projects.locked(project_id):
+            check_version(record, self.get_project(project_id), seen)
+            record['version'] = self._project_version(project_id) + 1
+            changes = self._history_entries(record, self.get_project)
+            self._projects.append(record)
+            self._history.add(changes)
+
+    # The change history entries of a record about to be applied, with the
+    # project as get_project finds it now (see history.entries)
+    def _history_entries(self, record, get_project):
+        return history.entries(record, get_project, self._duty_index.get, round(time.time(), 3),
+                               history.current_actor())
+
+    # Changes to a project and its duties, or to one of its duties, made
+    # after since (epoch seconds), oldest first; see history.py
+    def get_changes(self, project_id, duty_id=None, since=None):
+        return self._history.changes(project_id, duty_id, since)
+
+    # A duty, or a project's own fields when duty_id is None, as it was at
+    # when (epoch seconds), or None
+    def get_as_of(self, project_id, duty_id, when):
+        return self._history.as_of(project_id, duty_id, when)
+
+    # Folds both journals into fresh snapshots
+    def compact(self):
+        self._users.compact()
+        self._projects.compact()
+
+    # Batches (see manager.py run-batch): between begin_batch() and
+    # end_batch() changes are validated against the state read when the
+    # batch began and only written by commit_batch(), all of them at once.
+    # commit_batch() raises ConflictError, and drops the uncommitted changes,
+    # when another process wrote to the same files in the meantime.
+    def begin_batch(self):
+        for store in self._batch_stores():
+            store.begin_batch()
+        self._history.begin_batch()
+
+    # Stores in the order their locks are taken
+    def _batch_stores(self):
+        return [self._projects, self._users]
+
+    def commit_batch(self):
+        stores = self._batch_stores()
+        with ExitStack() as locks:
+            for store in stores:
+                locks.enter_context(store.exclusive())
+            conflict = any(store.changed_on_disk() for store in stores)
+            if not conflict:
+                for store in stores:
+                    store.write_batch()
+        if conflict:
+            for store in stores:
+                store.discard_batch()
+            self._index_emails()
+            self._history.begin_batch()
+            raise ConflictError("The data was changed by another process while the batch ran.")
+        self._history.commit_batch()
+        for store in stores:
+            store.compact_if_large()
+
+    def end_batch(self):
+        self._projects.end_batch()
+        if self._users.end_batch():
+            self._index_emails()
+        self._history.end_batch()
+
+MANIFEST_RECORDS = (PROJECT_CREATED, PROJECT_DELETED, MEMBER_ADDED, MEMBER_REMOVED)
+
+def _changes_assignees(record):
+    if record['type'] in (DUTY_CREATED, DUTIES_ARCHIVED):
+        return True
+    fields = record.get('fields', {})
+    return any(key in fields for key in ('Assignees', 'AssignedTo', 'Assigned To'))
+
+def _changes_counts(record):
+    return record['type'] in (DUTY_CREATED, DUTIES_ARCHIVED) or 'Status' in record.get('fields', {}) \
+        or 'Priority' in record.get('fields', {})
+
+# Raises ConflictError unless a change to project (as it is now, holding its
+# lock) can be committed when the caller validated against version seen.
+# Creating a duty only needs the project to exist and the duty ID to be
+# free, so concurrent creations in one project do not retry each other;
+# any other change needs the project unchanged since it was looked at
+# (when it was; seen is None when the caller did not look).
+def check_version(record, project, seen):
+    if project is None:
+        raise ConflictError(f"Project '{record['project_id']}' was deleted by another process.")
+    if record['type'] == DUTY_CREATED:
+        if any(duty['ID'] == record['duty']['ID'] for duty in project['Duties']):
+            raise ConflictError(f"Duty '{record['duty']['ID']}' was created by another process.")
+    elif seen is not None and project.get('Version', 0) != seen:
+        raise ConflictError(f"Project '{record['project_id']}' was changed by another process.")
+
+# Repository over the sharded layout. Users are handled as in Repository.
+# The manifest is kept in memory like users are; a project file is loaded the
+# first time the project is asked for and re-checked (a stat() of its two
+# files) once per refresh(), i.e. once per operation.
+#
+# A project change writes the project file and, for creation, deletion and
+# membership changes, also the manifest. Creation writes the manifest first
+# and deletion writes it last, so after a crash in between a project can be
+# listed but not found, which creating or deleting it again repairs.
+class ShardedRepository(Repository):
+    def __init__(self, users_path='users.json', projects_dir=None):
+        self._users = _Store(users_path, 'username', apply_user_mutation,
+                             on_compact=functools.partial(_write_user_index, users_path))
+        self._users_by_email = {}
+        self._duty_index = DutyIndex()
+        self._memberships = MembershipIndex()
+        self._search = SearchIndex()
+        self._directory = projects_dir or config.PROJECTS_DIR
+        # memberships come from the manifest, duty indexes from project files
+        self._manifest = _Store(manifest_path(self._directory), 'ID', self._apply_summary, self._memberships.reset)
+        self._history = HistoryLog(history_path(manifest_path(self._directory)))
+        self._cold = ColdStore(config.ARCHIVE_DIR)
+        self._shards = {}
+        self._fresh = set()
+        # shards whose journal is open, least recently written first
+        self._open_journals = OrderedDict()
+        # in batch mode, the IDs of the projects read since the last commit
+        self._batch_shards = None
+
+    def refresh(self):
+        if self._users.refresh():
+            self._index_emails()
+        self._manifest.refresh()
+        self._fresh.clear()
+
+    def _shard(self, project_id):
+        shard = self._shards.get(project_id)
+        if shard is None:
+            path = shard_path(self._directory, project_id)
+            shard = _Store(path, 'ID', self._apply_project, functools.partial(self._load_shard, project_id),
+                           functools.partial(_write_search_index, path))
+            self._shards[project_id] = shard
+        if self._batch_shards is not None:
+            if project_id not in self._batch_shards:
+                shard.begin_batch()
+                self._batch_shards.add(project_id)
+        elif project_id not in self._fresh:
+            shard.refresh()
+            self._fresh.add(project_id)
+        return shard
+
+    def _append(self, project_id, shard, record):
+        shard.append(record)
+        self._open_journals[project_id] = shard
+        self._open_journals.move_to_end(project_id)
+        while len(self._open_journals) > config.SHARD_JOURNALS_OPEN:
+            self._open_journals.popitem(last=False)[1].close()
+
+    def _apply_summary(self, summaries, summaries_by_id, record):
+        apply_project_mutation(summaries, summaries_by_id, record)
+        self._memberships.apply(record, summaries_by_id.get(_record_project_id(record)))
+
+    def _apply_project(self, projects, projects_by_id, record):
+        apply_project_mutation(projects, projects_by_id, record)
+        project = projects_by_id.get(_record_project_id(record))
+        self._duty_index.apply(record, project)
+        self._search.apply(record, project)
+
+    def _load_shard(self, project_id, items):
+        self._duty_index.remove_project(project_id)
+        self._search.remove_project(project_id)
+        for project in items:
+            self._duty_index.index_project(project)
+        saved = _read_search_index(shard_path(self._directory, project_id))
+        if saved is None:
+            self._search.add_projects(items)
+        else:
+            self._search.load_saved(saved)
+
+    def get_projects(self):
+        return [project for project in map(self.get_project, list(self._manifest.get_index())) if project]
+
+    # The duty index covers the project files loaded so far, so every listed
+    # project is loaded (or, once loaded, checked) first
+    def query_duties(self, assignee=None, statuses=None, priorities=None, due_after=None, due_before=None):
+        listed = self._manifest.get_index()
+        for project_id in listed:
+            self._shard(project_id)
+        return [(project_id, duty) for project_id, duty in super().query_duties(
+            assignee, statuses, priorities, due_after, due_before) if project_id in listed]
+
+    def get_deadlines(self, due_after=None, due_before=None, limit=None):
+        listed = self._manifest.get_index()
+        for project_id in listed:
+            self._shard(project_id)
+        return [deadline for deadline in super().get_deadlines(due_after, due_before, limit) if deadline[1] in listed]
+
+    # Like query_duties, over every listed project
+    def search(self, query, limit):
+        listed = self._manifest.get_index()
+        for project_id in listed:
+            self._shard(project_id)
+        return [result for result in super().search(query, limit) if result[0] in listed]
+
+    def get_project_summaries(self):
+        return self._manifest.get_items()
+
+    # From the counts kept in the manifest; a manifest written before it kept
+    # them has the project file read instead
+    def get_board_summary(self):
+        boards = []
+        for summary in self._manifest.get_items():
+            if 'Counts' in summary:
+                boards.append({'ID': summary['ID'], 'Title': summary['Title'], 'Counts': summary['Counts']})
+            else:
+                boards.append(self.get_board(summary['ID']) or {'ID': summary['ID'], 'Title': summary['Title'],
+                                                                'Counts': {}})
+        return boards
+
+    def get_project(self, project_id):
+        if project_id not in self._manifest.get_index():
+            return None
+        return self._shard(project_id).get_index().get(project_id)
+
+    def get_project_count(self):
+        return len(self._manifest.get_items())
+
+    def get_user_projects(self, username):
+        summaries = self._manifest.get_index()
+        led, joined = self._memberships.projects_of(username)
+        return [summaries[project_id] for project_id in led], [summaries[project_id] for project_id in joined]
+
+    def add_project(self, project):
+        os.makedirs(self._directory, exist_ok=True)
+        shard = self._shard(project['ID'])
+        with shard.locked(project['ID']):
+            if shard.get_index().get(project['ID']) is not None:
+                raise ConflictError(f"Project '{project['ID']}' was created by another process.")
+            project['Version'] = 1
+            record = {'type': PROJECT_CREATED, 'project': project}
+            changes = self._history_entries(record, shard.get_index().get)
+            with self._manifest.locked(project['ID']):
+                self._manifest.append({'type': PROJECT_CREATED, 'project': _summary(project)})
+            self._append(project['ID'], shard, record)
+            self._history.add(changes)
+
+    def _commit_project_change(self, record):
+        project_id = record['project_id']
+        seen = self._project_version(project_id)
+        shard = self._shard(project_id)
+        with shard.locked(project_id):
+            project = shard.get_index().get(project_id)
+            check_version(record, project, seen)
+            record['version'] = project.get('Version', 0) + 1
+            changes = self._history_entries(record, shard.get_index().get)
+            self._append(project_id, shard, record)
+            self._history.add(changes)
+            if record['type'] in MANIFEST_RECORDS:
+                with self._manifest.locked(project_id):
+                    self._manifest.append({key: value for key, value in record.items() if key != 'version'})
+            else:
+                self._sync_summary(project_id, record, shard.get_index().get(project_id))
+
+    # Keeps the parts of the manifest's summary that come from the duties in
+    # step with the project file: the usernames assigned to them, which
+    # list_user_projects reads, and the duty counts the board summary reads
+    def _sync_summary(self, project_id, record, project):
+        summary = self._manifest.get_index().get(project_id)
+        if summary is None:
+            return
+        records = []
+        if _changes_assignees(record):
+            assignees = _project_assignees(project)
+            if summary.get('Assignees') != assignees:
+                records.append({'type': ASSIGNEES_CHANGED, 'project_id': project_id, 'assignees': assignees})
+        if _changes_counts(record):
+            counts = self._duty_index.counts(project_id)
+            if summary.get('Counts') != counts:
+                records.append({'type': COUNTS_CHANGED, 'project_id': project_id, 'counts': counts})
+        if records:
+            with self._manifest.locked(project_id):
+                self._manifest.append_all(records)
+
+    def compact(self):
+        self._users.compact()
+        self._manifest.compact()
+        for name in os.listdir(self._directory):
+            path = os.path.join(self._directory, name)
+            if name.endswith('.journal') and path != journal_path(manifest_path(self._directory)) \
+                    and os.path.getsize(path):
+                shard = path[:-len('.journal')] + '.json'
+                _Store(shard, 'ID', apply_project_mutation,
+                       on_compact=functools.partial(_write_search_index, shard)).compact()
+        self._fresh.clear()
+
+    # Project files are locked in ID order, before the manifest, like a
+    # single change locks its project file before the manifest
+    def _batch_stores(self):
+        return [self._shards[project_id] for project_id in sorted(self._batch_shards)] + [self._manifest, self._users]
+
+    def begin_batch(self):
+        self._users.begin_batch()
+        self._manifest.begin_batch()
+        self._history.begin_batch()
+        self._batch_shards = set()
+
+    def commit_batch(self):
+        try:
+            super().commit_batch()
+        finally:
+            # a project is re-read (and re-checked) when next asked for
+            for project_id in self._batch_shards:
+                self._shards[project_id].end_batch()
+                if project_id not in self._open_journals:
+                    self._shards[project_id].close()
+            self._batch_shards = set()
+
+    def end_batch(self):
+        for project_id in self._batch_shards:
+            self._shards[project_id].end_batch()
+        self._batch_shards = None
+        self._manifest.end_batch()
+        if self._users.end_batch():
+            self._index_emails()
+        self._history.end_batch()
+        self._fresh.clear()
+
+_repository = None
+
+# The account with username, or None, without loading every account: with
+# the JSON and sharded storage it is looked up in the username index (see
+# user_index.py). Only when that is missing or out of date are the users
+# loaded, and the index written again from them.
+def find_user(username):
+    if _use_sqlite():
+        return get_repository().get_user(username)
+    try:
+        user = user_index.lookup('users.json', username)
+    except user_index.StaleIndex:
+        repo = get_repository()
+        repo.write_user_index()
+        user = repo.get_user(username)
+    if user is not None:
+        _fill_user_defaults(user)
+    return user
+
+def get_repository():
+    global _repository
+    if _repository is None:
+        if _use_sqlite():
+            import sqlite_storage
+            _repository = sqlite_storage.SqliteRepository(config.DATABASE_PATH)
+        elif _use_shards():
+            _repository = ShardedRepository()
+        else:
+            _repository = Repository()
+    _repository.refresh()
+    return _repository
@@ -0,0 +1,78 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+import storage
+
+BACKENDS = ['json', 'sharded', 'sqlite']
+# the ones writing snapshots and journals
+JOURNALED_BACKENDS = ['json', 'sharded']
+
+# Every test runs in an empty directory of its own, so the data files, the
+# log and the stats land there, and starts without a repository
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(storage, '_repository', None)
+    # changed duties stay in their project unless a test archives them
+    monkeypatch.setattr(config, 'ARCHIVE_ON_SAVE', 0)
+    return tmp_path
+
+# The repository of each storage backend in turn
+@pytest.fixture(params=BACKENDS)
+def repo(request, monkeypatch):
+    monkeypatch.setattr(config, 'STORAGE_BACKEND', request.param)
+    return storage.get_repository()
+
+@pytest.fixture(params=JOURNALED_BACKENDS)
+def journaled_repo(request, monkeypatch):
+    monkeypatch.setattr(config, 'STORAGE_BACKEND', request.param)
+    return storage.get_repository()
+
+# A new repository over the same files, as another process would open them
+def reopen():
+    storage._repository = None
+    return storage.get_repository()
+
+# The repository that made some changes, then a new one that loads them, for
+# checking both see the same
+def reloaded(repo):
+    return [repo, reopen()]
+
+# Runs change(repo) as another process would, leaving the current
+# repository in place
+def write_elsewhere(change):
+    repo = storage._repository
+    try:
+        change(reopen())
+    finally:
+        storage._repository = repo
+
+def make_project(project_id, leader='alice', members=('alice', 'bob'), duties=()):
+    return {'ID': project_id, 'Title': f"Project {project_id}", 'Leader': leader, 'Members': list(members),
+            'Duties': [dict(duty) for duty in duties]}
+
+def make_duty(duty_id, title=None, status='TODO', priority='LOW', assignees=('alice',),
+              finish='2030-01-02 00:00:00'):
+    return {'ID': duty_id, 'Title': title or f"Duty {duty_id}", 'Detail': f"Detail of {duty_id}",
+            'StartTime': '2030-01-01 00:00:00', 'FinishTime': finish, 'Priority': priority, 'Status': status,
+            'Assignees': list(assignees), 'AssignedTo': assignees[0] if assignees else None}
+
+# The data most tests start from:
+#   p1, led by alice with bob:  d1 TODO LOW (alice) due 2030-01-02,
+#                               d2 DOING HIGH (bob) due 2030-01-05
+#   p2, led by bob alone:       d1 DONE LOW (alice, bob) due 2030-01-03
+def seed(repo):
+    repo.add_project(make_project('p1', duties=[
+        make_duty('d1'),
+        make_duty('d2', status='DOING', priority='HIGH', assignees=('bob',), finish='2030-01-05 00:00:00'),
+    ]))
+    repo.add_project(make_project('p2', leader='bob', members=('bob',), duties=[
+        make_duty('d1', status='DONE', assignees=('alice', 'bob'), finish='2030-01-03 00:00:00'),
+    ]))
+    return repo
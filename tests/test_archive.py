@@ -0,0 +1,84 @@
+import time
+
+import config
+from archive import ColdStore
+from conftest import make_duty, make_project, reloaded, reopen
+
+def _ids(duties):
+    return [duty['ID'] for duty in duties]
+
+def _seed(repo):
+    repo.add_project(make_project('p1', duties=[
+        make_duty('old', status='DONE', finish='2020-01-01 00:00:00'),
+        make_duty('recent', status='DONE', finish='2030-01-01 00:00:00'),
+        make_duty('open', status='TODO', finish='2020-01-01 00:00:00'),
+        make_duty('shelved', status='ARCHIVED', assignees=('carol',)),
+    ]))
+
+def _archive(repo):
+    return repo.archive_duties('p1', time.time() - config.ARCHIVE_DONE_AFTER)
+
+def test_archived_duties_leave_the_project(repo):
+    _seed(repo)
+    shelved = repo.get_duty('p1', 'shelved')
+    assert _archive(repo) == 2
+    assert _archive(repo) == 0
+    for repo in reloaded(repo):
+        assert _ids(repo.get_project('p1')['Duties']) == ['recent', 'open']
+        assert repo.get_duty('p1', 'old') is None
+        assert _ids(repo.iter_archived_duties('p1')) == ['old', 'shelved']
+        assert next(duty for duty in repo.iter_archived_duties('p1') if duty['ID'] == 'shelved') == shelved
+        assert list(repo.iter_archived_duties('p2')) == []
+        assert repo.search('shelved', 10) == []
+        assert repo.get_board('p1')['Counts'] == {'DONE': {'LOW': 1}, 'TODO': {'LOW': 1}}
+
+def test_archive_on_save(repo, monkeypatch):
+    monkeypatch.setattr(config, 'ARCHIVE_ON_SAVE', 1)
+    repo.add_project(make_project('p1', duties=[make_duty('d1'), make_duty('d2')]))
+    repo.update_duty('p1', 'd1', {'Status': 'ARCHIVED'})
+    for repo in reloaded(repo):
+        assert _ids(repo.get_project('p1')['Duties']) == ['d2']
+        assert _ids(repo.iter_archived_duties('p1')) == ['d1']
+
+# A duty created again under an archived duty's ID is the one that counts:
+# the cold copy is hidden while the hot one exists, and archiving it again
+# shows the newest copy
+def test_restored_duty_hides_its_cold_copy(repo):
+    _seed(repo)
+    _archive(repo)
+    repo.add_duty('p1', make_duty('shelved', title='Back again', status='DOING'))
+    for repo in reloaded(repo):
+        assert _ids(repo.iter_archived_duties('p1')) == ['old']
+        assert repo.get_duty('p1', 'shelved')['Title'] == 'Back again'
+        assert [pair[1]['ID'] for pair in repo.query_duties(statuses={'DOING'})] == ['shelved']
+    repo.update_duty('p1', 'shelved', {'Status': 'ARCHIVED'})
+    _archive(repo)
+    for repo in reloaded(repo):
+        assert _ids(repo.iter_archived_duties('p1')) == ['old', 'shelved']
+        assert [duty['Title'] for duty in repo.iter_archived_duties('p1')] == ['Duty old', 'Back again']
+
+def test_deleting_a_project_drops_its_cold_duties(repo):
+    _seed(repo)
+    _archive(repo)
+    repo.remove_project('p1')
+    repo = reopen()
+    assert list(repo.iter_archived_duties('p1')) == []
+    repo.add_project(make_project('p1'))
+    assert list(repo.iter_archived_duties('p1')) == []
+
+# A segment cut short by a crash while it was written ends the data
+def test_cut_segment_is_ignored():
+    cold = ColdStore(config.ARCHIVE_DIR)
+    cold.add('p1', [make_duty('d1')])
+    cold.add('p1', [make_duty('d2'), make_duty('d3')])
+    with open(cold.path('p1'), 'rb') as file:
+        data = file.read()
+    with open(cold.path('p1'), 'wb') as file:
+        file.write(data[:-5])
+    assert _ids(cold.duties('p1')) == ['d1']
+    assert cold.duties('p2') == []
+
+def test_project_ids_that_are_not_strings():
+    cold = ColdStore(config.ARCHIVE_DIR)
+    cold.add(7, [make_duty('d1')])
+    assert _ids(cold.duties(7)) == ['d1']
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+import manager
+from conftest import make_duty, make_project, reloaded, reopen, write_elsewhere
+from locking import ConflictError
+
+def test_batch_is_written_at_commit(repo):
+    repo.add_project(make_project('p1'))
+    repo.begin_batch()
+    try:
+        repo.add_duty('p1', make_duty('d1'))
+        repo.add_member('p1', 'carol')
+        repo.update_duty('p1', 'd1', {'Status': 'DOING'})
+        repo.commit_batch()
+    finally:
+        repo.end_batch()
+    for repo in reloaded(repo):
+        assert repo.get_duty('p1', 'd1')['Status'] == 'DOING'
+        assert repo.get_project('p1')['Members'] == ['alice', 'bob', 'carol']
+        assert [entry['kind'] for entry in repo.get_changes('p1')] == ['created', 'created', 'changed', 'changed']
+
+def test_uncommitted_batch_is_dropped(repo):
+    repo.add_project(make_project('p1'))
+    repo.begin_batch()
+    repo.add_duty('p1', make_duty('d1'))
+    repo.add_project(make_project('p2'))
+    repo.add_user({'username': 'carol', 'emailaddress': 'carol@example.com', 'password': ''})
+    repo.end_batch()
+    for repo in reloaded(repo):
+        assert repo.get_project('p1')['Duties'] == []
+        assert repo.get_project('p2') is None
+        assert repo.query_duties() == []
+        assert repo.get_user('carol') is None
+        assert repo.get_user_by_email('carol@example.com') is None
+
+# The batch's changes are rolled back everywhere: in memory, in the indexes
+# and in the history, and none of them reach the disk
+def test_conflict_rolls_back_the_batch(journaled_repo):
+    repo = journaled_repo
+    repo.add_project(make_project('p1'))
+    repo.begin_batch()
+    try:
+        repo.add_duty('p1', make_duty('d1', title='Batched duty'))
+        repo.add_member('p1', 'carol')
+        repo.add_project(make_project('p3'))
+        assert repo.get_duty('p1', 'd1') is not None
+        write_elsewhere(lambda other: other.add_project(make_project('p2')))
+        with pytest.raises(ConflictError):
+            repo.commit_batch()
+        for reader in reloaded(repo):
+            assert reader.get_duty('p1', 'd1') is None
+            assert reader.get_project('p1')['Members'] == ['alice', 'bob']
+            assert reader.get_project('p2') is not None
+            assert reader.get_project('p3') is None
+            assert reader.query_duties() == []
+            assert reader.search('batched', 10) == []
+            assert reader.get_user_projects('carol') == ([], [])
+            assert [entry['kind'] for entry in reader.get_changes('p1')] == ['created']
+    finally:
+        repo.end_batch()
+
+# The batch can go on after a conflict, from the state the other writer left
+def test_batch_after_conflict(journaled_repo):
+    repo = journaled_repo
+    repo.add_project(make_project('p1'))
+    repo.begin_batch()
+    try:
+        repo.add_duty('p1', make_duty('d1'))
+        write_elsewhere(lambda other: other.add_duty('p1', make_duty('d2')))
+        with pytest.raises(ConflictError):
+            repo.commit_batch()
+        repo.add_duty('p1', make_duty('d3'))
+        repo.commit_batch()
+    finally:
+        repo.end_batch()
+    assert [duty['ID'] for duty in reopen().get_project('p1')['Duties']] == ['d2', 'd3']
+
+def test_run_batch_reruns_a_conflicting_chunk(journaled_repo, monkeypatch, capsys):
+    ops = [{'op': 'create_account', 'username': 'alice', 'emailaddress': 'alice@example.com', 'password': 'secret'},
+           {'op': 'create_project', 'project_id': 'p1', 'title': 'Project', 'leader': 'alice'},
+           {'op': 'create_duty', 'project_id': 'p1', 'duty_id': 'd1', 'title': 'Duty', 'assignees': ['alice']},
+           {'op': 'create_duty', 'project_id': 'p9', 'duty_id': 'd1', 'title': 'Duty'}]
+    with open('ops.jsonl', 'w') as file:
+        file.writelines(json.dumps(op) + '\n' for op in ops)
+    commit_batch = type(journaled_repo).commit_batch
+    conflicts = []
+
+    def commit_after_another_writer(repo):
+        if not conflicts:
+            conflicts.append(True)
+            write_elsewhere(lambda other: other.add_project(make_project('p2')))
+        commit_batch(repo)
+    monkeypatch.setattr(type(journaled_repo), 'commit_batch', commit_after_another_writer)
+
+    manager.run_batch('ops.jsonl', 'results.jsonl', 0)
+    assert 'again one at a time' in capsys.readouterr().out
+    with open('results.jsonl') as file:
+        assert [result['ok'] for result in map(json.loads, file)] == [True, True, True, False]
+    repo = reopen()
+    assert repo.get_user('alice') is not None
+    assert [duty['ID'] for duty in repo.get_project('p1')['Duties']] == ['d1']
+    assert repo.get_project('p2') is not None
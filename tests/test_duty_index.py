@@ -0,0 +1,95 @@
+from conftest import make_duty, make_project, reloaded, seed
+from indexes import finish_timestamp
+
+def _keys(pairs):
+    return [(project_id, duty['ID']) for project_id, duty in pairs]
+
+def _at(text):
+    return finish_timestamp({'FinishTime': text})
+
+# Soonest finish first, ties in project and duty ID order, duties without a
+# finish time last
+def test_query_order(repo):
+    repo.add_project(make_project('p2', duties=[make_duty('b', finish=None), make_duty('a')]))
+    repo.add_project(make_project('p1', duties=[make_duty('z'), make_duty('y', finish='2029-12-31 00:00:00')]))
+    for repo in reloaded(repo):
+        assert _keys(repo.query_duties()) == [('p1', 'y'), ('p1', 'z'), ('p2', 'a'), ('p2', 'b')]
+        assert _keys(repo.query_duties(assignee='alice', statuses={'TODO'})) == \
+            [('p1', 'y'), ('p1', 'z'), ('p2', 'a'), ('p2', 'b')]
+
+def test_query_conditions(repo):
+    seed(repo)
+    assert _keys(repo.query_duties(assignee='bob')) == [('p2', 'd1'), ('p1', 'd2')]
+    assert _keys(repo.query_duties(statuses={'TODO', 'DONE'})) == [('p1', 'd1'), ('p2', 'd1')]
+    assert _keys(repo.query_duties(assignee='alice', priorities={'HIGH'})) == []
+    assert _keys(repo.query_duties(statuses=set())) == []
+    # due_after is inclusive, due_before exclusive
+    assert _keys(repo.query_duties(due_after=_at('2030-01-03 00:00:00'))) == [('p2', 'd1'), ('p1', 'd2')]
+    assert _keys(repo.query_duties(due_before=_at('2030-01-03 00:00:00'))) == [('p1', 'd1')]
+    assert _keys(repo.query_duties(assignee='bob', due_before=_at('2030-01-05 00:00:00'))) == [('p2', 'd1')]
+
+# Whoever a duty is assigned to counts as an assignee, under either key
+def test_query_by_assigned_to(repo):
+    older = make_duty('d1', assignees=())
+    del older['AssignedTo']
+    older['Assigned To'] = 'carol'
+    repo.add_project(make_project('p1', duties=[older, make_duty('d2', assignees=('bob',))]))
+    repo.assign_duty('p1', 'd2', {'AssignedTo': 'dave'})
+    for repo in reloaded(repo):
+        assert _keys(repo.query_duties(assignee='carol')) == [('p1', 'd1')]
+        assert _keys(repo.query_duties(assignee='dave')) == [('p1', 'd2')]
+        assert _keys(repo.query_duties(assignee='bob')) == [('p1', 'd2')]
+
+# A changed duty leaves the entries of its old values
+def test_query_after_changes(repo):
+    seed(repo)
+    repo.update_duty('p1', 'd1', {'Status': 'DONE', 'FinishTime': '2030-02-01 00:00:00'})
+    repo.assign_duty('p1', 'd2', {'Assignees': ['carol'], 'AssignedTo': 'carol'})
+    repo.remove_project('p2')
+    for repo in reloaded(repo):
+        assert _keys(repo.query_duties()) == [('p1', 'd2'), ('p1', 'd1')]
+        assert _keys(repo.query_duties(statuses={'TODO'})) == []
+        assert _keys(repo.query_duties(assignee='bob')) == []
+        assert _keys(repo.query_duties(assignee='carol')) == [('p1', 'd2')]
+        assert _keys(repo.query_duties(due_before=_at('2030-01-10 00:00:00'))) == [('p1', 'd2')]
+
+# The counters behind the board move with every change and drop cells that
+# reach zero
+def test_board_counts(repo):
+    seed(repo)
+    repo.update_duty('p1', 'd2', {'Priority': 'LOW'})
+    repo.add_duty('p1', make_duty('d3', status='DONE', priority='HIGH'))
+    repo.update_duty('p1', 'd1', {'Status': 'DOING'})
+    for repo in reloaded(repo):
+        assert repo.get_board('p1')['Counts'] == {'DOING': {'LOW': 2}, 'DONE': {'HIGH': 1}}
+        assert repo.get_board('p2')['Counts'] == {'DONE': {'LOW': 1}}
+        assert repo.get_board('p9') is None
+    repo.remove_project('p1')
+    for repo in reloaded(repo):
+        assert [(board['ID'], board['Counts']) for board in repo.get_board_summary()] == \
+            [('p2', {'DONE': {'LOW': 1}})]
+
+def _deadlines(repo, *args, **kwargs):
+    return [(finish, project_id, duty['ID']) for finish, project_id, duty in repo.get_deadlines(*args, **kwargs)]
+
+# Only open duties have deadlines. Equal finish times keep project and duty
+# ID order, so the limit always cuts at the same place.
+def test_deadlines(repo):
+    due = '2030-01-02 00:00:00'
+    repo.add_project(make_project('p2', duties=[make_duty('b', finish=due), make_duty('a', finish=due)]))
+    repo.add_project(make_project('p1', duties=[make_duty('c', finish=due, status='DONE'),
+                                                make_duty('b', finish=due, status='DOING'),
+                                                make_duty('x', finish=None)]))
+    at = _at(due)
+    for repo in reloaded(repo):
+        assert _deadlines(repo) == [(at, 'p1', 'b'), (at, 'p2', 'a'), (at, 'p2', 'b')]
+        assert _deadlines(repo, limit=2) == [(at, 'p1', 'b'), (at, 'p2', 'a')]
+        assert _deadlines(repo, due_after=at, due_before=at + 1, limit=1) == [(at, 'p1', 'b')]
+        assert _deadlines(repo, due_before=at) == []
+
+def test_deadlines_follow_status(repo):
+    seed(repo)
+    repo.update_duty('p1', 'd1', {'Status': 'DONE'})
+    repo.update_duty('p2', 'd1', {'Status': 'BACKLOG'})
+    for repo in reloaded(repo):
+        assert [key[1:] for key in _deadlines(repo)] == [('p2', 'd1'), ('p1', 'd2')]
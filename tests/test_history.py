@@ -0,0 +1,102 @@
+import copy
+import os
+import time
+
+import pytest
+
+import config
+import history
+from conftest import make_duty, make_project, reloaded, seed
+
+START = 1_800_000_000.0
+
+# Changes are timed by a clock the test moves, 10 seconds per change
+@pytest.fixture
+def clock(monkeypatch):
+    now = [START]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    return now
+
+# The kinds of the history entries stored, checkpoints included
+@pytest.fixture
+def stored_kinds(monkeypatch):
+    kinds = []
+    with_checkpoints = history.with_checkpoints
+
+    def spy(pairs, changes_since_checkpoint, counts):
+        stored = with_checkpoints(pairs, changes_since_checkpoint, counts)
+        kinds.extend(entry['kind'] for entry in stored)
+        return stored
+    monkeypatch.setattr(history, 'with_checkpoints', spy)
+    return kinds
+
+def test_as_of_across_checkpoints(repo, clock, stored_kinds, monkeypatch):
+    monkeypatch.setattr(config, 'HISTORY_CHECKPOINT_EVERY', 3)
+    repo.add_project(make_project('p1', duties=[make_duty('d1', title='v0')]))
+    duties = {clock[0]: copy.deepcopy(repo.get_duty('p1', 'd1'))}
+    projects = {clock[0]: ['alice', 'bob']}
+    for number in range(1, 11):
+        clock[0] += 10
+        fields = {'Title': f"v{number}"}
+        if number % 4 == 0:
+            fields['Status'] = 'DOING' if number % 8 else 'TODO'
+        repo.update_duty('p1', 'd1', fields)
+        duties[clock[0]] = copy.deepcopy(repo.get_duty('p1', 'd1'))
+        if number % 3 == 0:
+            repo.add_member('p1', f"user{number}")
+            projects[clock[0]] = repo.get_project('p1')['Members'][:]
+    # one checkpoint every three changes of the duty, and one after the
+    # third membership change of the project
+    assert stored_kinds.count('checkpoint') == 3 + 1
+
+    for repo in reloaded(repo):
+        assert repo.get_as_of('p1', 'd1', START - 1) is None
+        for when, duty in duties.items():
+            assert repo.get_as_of('p1', 'd1', when) == duty
+            assert repo.get_as_of('p1', 'd1', when + 5) == duty
+        for when, members in projects.items():
+            assert repo.get_as_of('p1', None, when + 5)['Members'] == members
+        assert repo.get_as_of('p1', None, START + 15)['Members'] == ['alice', 'bob']
+        # checkpoints are not changes
+        changes = repo.get_changes('p1', 'd1')
+        assert [entry['kind'] for entry in changes] == ['created'] + ['changed'] * 10
+        assert [entry['changes']['Title'] for entry in repo.get_changes('p1', 'd1', since=START + 75)] == \
+            [['v7', 'v8'], ['v8', 'v9'], ['v9', 'v10']]
+
+def test_as_of_after_delete(repo, clock):
+    repo.add_project(make_project('p1', duties=[make_duty('d1')]))
+    clock[0] += 10
+    repo.update_duty('p1', 'd1', {'Status': 'DOING'})
+    clock[0] += 10
+    repo.remove_project('p1')
+    for repo in reloaded(repo):
+        assert repo.get_as_of('p1', 'd1', START + 15)['Status'] == 'DOING'
+        assert repo.get_as_of('p1', 'd1', START + 25) is None
+        assert repo.get_as_of('p1', None, START + 25) is None
+        assert [entry['kind'] for entry in repo.get_changes('p1')] == ['created', 'created', 'changed',
+                                                                        'deleted', 'deleted']
+
+def test_no_history(repo):
+    assert repo.get_changes('p1') == []
+    assert repo.get_as_of('p1', 'd1', START) is None
+
+# The index can be built again from the history, so keeping it up to date
+# syncs nothing; the journal syncs on its own schedule
+def test_index_is_not_synced(journaled_repo, monkeypatch):
+    monkeypatch.setattr(config, 'JOURNAL_FSYNC_EVERY', float('inf'))
+    monkeypatch.setattr(config, 'JOURNAL_FSYNC_INTERVAL', float('inf'))
+    seed(journaled_repo)
+    syncs = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: syncs.append(fd) or fsync(fd))
+    for number in range(20):
+        journaled_repo.update_duty('p1', 'd1', {'Title': f"v{number}"})
+    assert syncs == []
+    assert len(journaled_repo.get_changes('p1', 'd1')) == 21
+
+def test_project_ids_that_are_not_strings(tmp_path):
+    log = history.HistoryLog(str(tmp_path / 'items.history'))
+    log.add([(history._entry('created', 7, None, START, None, state={'ID': 7}), None)])
+    log.add([(history._entry('created', 7, 'd1', START, None, state={'ID': 'd1'}), None)])
+    assert [(entry['project_id'], entry['duty_id']) for entry in log.changes(7)] == [(7, None), (7, 'd1')]
+    assert log.as_of(7, 'd1', START) == {'ID': 'd1'}
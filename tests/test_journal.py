@@ -0,0 +1,116 @@
+import glob
+import json
+import os
+
+import config
+import journal
+import storage
+from conftest import make_duty, make_project, reopen
+from journal import DUTY_CREATED, PROJECT_CREATED, STATUS_CHANGED, Journal, read_journal
+
+def test_read_journal_skips_unfinished_line(tmp_path):
+    path = str(tmp_path / 'items.journal')
+    records = [{'type': 'a', 'n': n} for n in range(3)]
+    log = Journal(path)
+    ends = [log.append(record) for record in records]
+    log.close()
+    with open(path, 'ab') as file:
+        file.write(b'{"type": "cut sh')
+    read = list(read_journal(path))
+    assert [record for record, _ in read] == records
+    assert [offset for _, offset in read] == [sum(ends[:n + 1]) for n in range(3)]
+    # reading on from an offset only yields the records after it
+    assert [record for record, _ in read_journal(path, read[0][1])] == records[1:]
+    assert list(read_journal(str(tmp_path / 'missing.journal'))) == []
+
+def test_open_journals_are_only_held_while_open(tmp_path):
+    log = Journal(str(tmp_path / 'items.journal'))
+    assert log not in journal._open_journals
+    log.append({'type': 'a'})
+    assert log in journal._open_journals
+    log.close()
+    assert log not in journal._open_journals
+
+def _append(records):
+    log = Journal('projects.journal')
+    for record in records:
+        log.append(record)
+    log.close()
+
+# Records already folded into the snapshot (a crash between writing it and
+# emptying the journal) are replayed again without changing anything
+def test_replay_is_idempotent():
+    project = make_project('p1', duties=[make_duty('d1')])
+    records = [{'type': PROJECT_CREATED, 'project': make_project('p2')},
+               {'type': DUTY_CREATED, 'project_id': 'p1', 'duty': make_duty('d2'), 'version': 2},
+               {'type': STATUS_CHANGED, 'project_id': 'p1', 'duty_id': 'd1', 'fields': {'Status': 'DOING'},
+                'version': 3}]
+    storage.SaveProjects([project])
+    _append(records)
+    replayed = storage.LoadProjects()
+    storage.SaveProjects(replayed)
+    _append(records)
+    assert storage.LoadProjects() == replayed
+    assert [p['ID'] for p in replayed] == ['p1', 'p2']
+    assert [(d['ID'], d['Status']) for d in replayed[0]['Duties']] == [('d1', 'DOING'), ('d2', 'TODO')]
+    assert replayed[0]['Version'] == 3
+
+def _journal_sizes():
+    return sum(os.path.getsize(path) for path in glob.glob('*.journal') + glob.glob(f"{config.PROJECTS_DIR}/*.journal"))
+
+def _change_everything(repo):
+    repo.add_project(make_project('p1', duties=[make_duty('d1')]))
+    repo.add_project(make_project('p2'))
+    repo.add_project(make_project('p3'))
+    repo.add_member('p1', 'carol')
+    repo.add_duty('p1', make_duty('d2', assignees=('bob',)))
+    repo.update_duty('p1', 'd1', {'Status': 'DOING'})
+    repo.assign_duty('p1', 'd2', {'Assignees': ['bob', 'carol'], 'AssignedTo': 'bob'})
+    repo.remove_member('p2', 'bob')
+    repo.remove_project('p3')
+
+def _state(repo):
+    return {project['ID']: (project['Members'], project['Duties'], project.get('Version'))
+            for project in repo.get_projects()}
+
+def test_changes_are_replayed_from_the_journal(journaled_repo):
+    _change_everything(journaled_repo)
+    assert _journal_sizes() > 0
+    expected = _state(journaled_repo)
+    assert sorted(expected) == ['p1', 'p2']
+    assert expected['p1'][0] == ['alice', 'bob', 'carol']
+    assert expected['p2'][0] == ['alice']
+    assert _state(reopen()) == expected
+
+# A reader that already loaded the data only replays what was appended since
+def test_refresh_replays_the_tail(journaled_repo):
+    journaled_repo.add_project(make_project('p1'))
+    reader = reopen()
+    assert reader.get_project('p1')['Duties'] == []
+    storage._repository = journaled_repo
+    journaled_repo.add_duty('p1', make_duty('d1'))
+    reader.refresh()
+    assert [duty['ID'] for duty in reader.get_project('p1')['Duties']] == ['d1']
+
+def test_compaction_folds_the_journal_into_the_snapshot(journaled_repo):
+    _change_everything(journaled_repo)
+    expected = _state(journaled_repo)
+    journaled_repo.compact()
+    assert _journal_sizes() == 0
+    assert _state(journaled_repo) == expected
+    assert _state(reopen()) == expected
+    # and the journal keeps working after it
+    storage.get_repository().add_duty('p2', make_duty('d3'))
+    assert [duty['ID'] for duty in reopen().get_project('p2')['Duties']] == ['d3']
+
+def test_large_journal_is_compacted(monkeypatch):
+    monkeypatch.setattr(config, 'JOURNAL_COMPACT_MIN_BYTES', 1)
+    repo = storage.get_repository()
+    repo.add_project(make_project('p1'))
+    for number in range(5):
+        repo.add_duty('p1', make_duty(f"d{number}"))
+    # the journal never grows past the snapshot
+    assert os.path.getsize('projects.journal') <= os.path.getsize('projects.json')
+    with open('projects.json') as file:
+        assert len(json.load(file)[0]['Duties']) >= 4
+    assert len(reopen().get_project('p1')['Duties']) == 5
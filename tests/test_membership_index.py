@@ -0,0 +1,55 @@
+from conftest import make_duty, make_project, reloaded, seed
+
+def _user_projects(repo, username):
+    led, joined = repo.get_user_projects(username)
+    return [project['ID'] for project in led], [project['ID'] for project in joined]
+
+def test_projects_after_create(repo):
+    seed(repo)
+    repo.add_project(make_project('p3', leader='carol', members=('carol',),
+                                  duties=[make_duty('d1', assignees=('dave',))]))
+    for repo in reloaded(repo):
+        assert _user_projects(repo, 'alice') == (['p1'], ['p2'])
+        # a project led is not joined as well
+        assert _user_projects(repo, 'bob') == (['p2'], ['p1'])
+        # an assignee who is not a member still sees the project
+        assert _user_projects(repo, 'dave') == ([], ['p3'])
+        assert _user_projects(repo, 'erin') == ([], [])
+
+def test_projects_after_member_changes(repo):
+    seed(repo)
+    repo.add_member('p2', 'carol')
+    repo.add_member('p2', 'carol')
+    repo.remove_member('p1', 'bob')
+    for repo in reloaded(repo):
+        assert _user_projects(repo, 'carol') == ([], ['p2'])
+        # bob left p1 but is still assigned d2 there
+        assert _user_projects(repo, 'bob') == (['p2'], ['p1'])
+    repo.assign_duty('p1', 'd2', {'Assignees': ['alice'], 'AssignedTo': 'alice'})
+    for repo in reloaded(repo):
+        assert _user_projects(repo, 'bob') == (['p2'], [])
+    # a member who was never assigned leaves at once
+    repo.remove_member('p2', 'carol')
+    for repo in reloaded(repo):
+        assert _user_projects(repo, 'carol') == ([], [])
+
+def test_projects_after_assignee_changes(repo):
+    seed(repo)
+    repo.add_duty('p2', make_duty('d2', assignees=('dave',)))
+    repo.add_duty('p2', make_duty('d3', assignees=('dave', 'erin')))
+    repo.assign_duty('p2', 'd2', {'Assignees': ['erin'], 'AssignedTo': 'erin'})
+    for repo in reloaded(repo):
+        # dave still has d3
+        assert _user_projects(repo, 'dave') == ([], ['p2'])
+        assert _user_projects(repo, 'erin') == ([], ['p2'])
+    repo.unassign_duty('p2', 'd3', {'Assignees': ['erin'], 'AssignedTo': 'erin'})
+    for repo in reloaded(repo):
+        assert _user_projects(repo, 'dave') == ([], [])
+        assert _user_projects(repo, 'erin') == ([], ['p2'])
+
+def test_projects_after_delete(repo):
+    seed(repo)
+    repo.remove_project('p2')
+    for repo in reloaded(repo):
+        assert _user_projects(repo, 'alice') == (['p1'], [])
+        assert _user_projects(repo, 'bob') == ([], ['p1'])
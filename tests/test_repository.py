@@ -0,0 +1,55 @@
+import pytest
+
+from conftest import make_duty, make_project, reloaded, write_elsewhere
+from locking import ConflictError
+
+def _duties(project):
+    return [(duty['ID'], duty['Status'], duty['AssignedTo']) for duty in project['Duties']]
+
+def test_accounts(repo):
+    repo.add_user({'username': 'alice', 'emailaddress': 'alice@example.com', 'password': 'x'})
+    repo.add_user({'username': 'bob', 'emailaddress': 'bob@example.com', 'password': 'y'})
+    for repo in reloaded(repo):
+        assert [user['username'] for user in repo.get_users()] == ['alice', 'bob']
+        assert repo.get_user('bob')['emailaddress'] == 'bob@example.com'
+        assert repo.get_user_by_email('alice@example.com')['username'] == 'alice'
+        assert repo.get_user('carol') is None
+        assert repo.get_user_by_email('carol@example.com') is None
+
+# Every backend keeps projects, members and duties in the order they were added
+def test_projects(repo):
+    repo.add_project(make_project('p1', duties=[make_duty('d1')]))
+    repo.add_project(make_project('p2'))
+    repo.add_project(make_project('p3'))
+    repo.add_member('p1', 'carol')
+    repo.remove_member('p2', 'bob')
+    repo.add_duty('p1', make_duty('d2', assignees=('bob',)))
+    repo.update_duty('p1', 'd1', {'Status': 'DOING'})
+    repo.assign_duty('p1', 'd2', {'Assignees': ['bob', 'carol'], 'AssignedTo': 'carol'})
+    repo.unassign_duty('p1', 'd1', {'Assignees': [], 'AssignedTo': None})
+    repo.remove_project('p3')
+    for repo in reloaded(repo):
+        assert [project['ID'] for project in repo.get_projects()] == ['p1', 'p2']
+        assert repo.get_project('p1')['Members'] == ['alice', 'bob', 'carol']
+        assert repo.get_project('p2')['Members'] == ['alice']
+        assert _duties(repo.get_project('p1')) == [('d1', 'DOING', None), ('d2', 'TODO', 'carol')]
+        assert repo.get_project('p3') is None
+
+# A change validated against a project another process changed since is
+# refused; creating a duty only needs its ID to be free
+def test_version_conflicts(repo):
+    repo.add_project(make_project('p1', duties=[make_duty('d1')]))
+    assert repo.get_project('p1')['Version'] == 1
+    write_elsewhere(lambda other: other.add_member('p1', 'carol'))
+    with pytest.raises(ConflictError):
+        repo.update_duty('p1', 'd1', {'Status': 'DOING'})
+    write_elsewhere(lambda other: other.add_member('p1', 'dave'))
+    repo.add_duty('p1', make_duty('d2'))
+    write_elsewhere(lambda other: other.add_duty('p1', make_duty('d3')))
+    with pytest.raises(ConflictError):
+        repo.add_duty('p1', make_duty('d3'))
+    write_elsewhere(lambda other: other.remove_project('p1'))
+    with pytest.raises(ConflictError):
+        repo.add_duty('p1', make_duty('d4'))
+    for repo in reloaded(repo):
+        assert repo.get_project('p1') is None
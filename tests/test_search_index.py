@@ -0,0 +1,80 @@
+from conftest import make_duty, make_project, reopen
+
+def _hits(repo, query, limit=20):
+    return [(project_id, duty_id) for project_id, duty_id, _ in repo.search(query, limit)]
+
+def _seed(repo):
+    project = make_project('p1', duties=[make_duty('d1', title='Fix login page'),
+                                         make_duty('d2', title='Write release notes')])
+    project['Title'] = 'Website relaunch'
+    repo.add_project(project)
+    repo.add_project(make_project('p2', duties=[make_duty('d1', title='Login audit')]))
+
+# The repository that made the changes, one that loads them afresh and, with
+# the JSON and sharded storage, one that loads the search index saved by
+# compaction
+def _reloaded(repo):
+    repos = [repo, reopen()]
+    repos[-1].compact()
+    repos.append(reopen())
+    return repos
+
+def test_search_after_create(repo):
+    _seed(repo)
+    for repo in _reloaded(repo):
+        assert _hits(repo, 'login') == [('p1', 'd1'), ('p2', 'd1')]
+        # every term has to match
+        assert _hits(repo, 'login page') == [('p1', 'd1')]
+        assert _hits(repo, 'login notes') == []
+        assert _hits(repo, 'website') == [('p1', None)]
+        assert _hits(repo, 'nothing') == []
+        assert _hits(repo, '  ') == []
+
+# A term also matches the words it starts, which count less than the word
+# itself, and a document scores the best of its words per term
+def test_prefix_matches(repo):
+    repo.add_project(make_project('p1', duties=[make_duty('d1', title='Login page'),
+                                                make_duty('d2', title='Log rotation'),
+                                                make_duty('d3', title='Log the logins'),
+                                                make_duty('d4', title='Blog')]))
+    for repo in _reloaded(repo):
+        scores = {duty_id: score for _, duty_id, score in repo.search('log', 20)}
+        assert list(scores) == ['d2', 'd3', 'd1']
+        assert scores['d2'] == scores['d3']
+        assert scores['d1'] < scores['d2']
+        assert _hits(repo, 'rot') == [('p1', 'd2')]
+        assert _hits(repo, 'logins') == [('p1', 'd3')]
+        assert _hits(repo, 'LOG PA') == [('p1', 'd1')]
+
+# Equal scores keep project and duty ID order, the project title first, so the
+# limit always cuts at the same place
+def test_limit(repo):
+    for project_id in ['p2', 'p1']:
+        project = make_project(project_id, duties=[make_duty(duty_id, title='Audit')
+                                                   for duty_id in ['d3', 'd1', 'd2']])
+        project['Title'] = 'Audit'
+        repo.add_project(project)
+    for repo in _reloaded(repo):
+        assert _hits(repo, 'audit', 4) == [('p1', None), ('p1', 'd1'), ('p1', 'd2'), ('p1', 'd3')]
+        assert _hits(repo, 'aud', 5) == _hits(repo, 'audit', 5)
+        assert _hits(repo, 'audit', 1) == [('p1', None)]
+        assert _hits(repo, 'audit', 0) == []
+        assert len(_hits(repo, 'audit')) == 8
+
+def test_search_after_update(repo):
+    _seed(repo)
+    repo.update_duty('p1', 'd1', {'Title': 'Fix signup page'})
+    repo.update_duty('p2', 'd1', {'Detail': 'Check the release pipeline'})
+    for repo in _reloaded(repo):
+        assert _hits(repo, 'login') == [('p2', 'd1')]
+        assert _hits(repo, 'signup') == [('p1', 'd1')]
+        # a title word counts more than a detail word
+        assert _hits(repo, 'release') == [('p1', 'd2'), ('p2', 'd1')]
+
+def test_search_after_delete(repo):
+    _seed(repo)
+    repo.remove_project('p1')
+    for repo in _reloaded(repo):
+        assert _hits(repo, 'login') == [('p2', 'd1')]
+        assert _hits(repo, 'website') == []
+        assert _hits(repo, 'rel') == []
@@ -0,0 +1,39 @@
+import pytest
+
+import server
+from conftest import make_duty, make_project, reloaded
+
+# A duty stored before 'AssignedTo', assigned to alice without being one of
+# its assignees
+def _older_duty(duty_id):
+    duty = make_duty(duty_id, assignees=())
+    del duty['AssignedTo']
+    duty['Assigned To'] = 'alice'
+    return duty
+
+@pytest.fixture
+def older(repo):
+    repo.add_project(make_project('p1', duties=[_older_duty('d1')]))
+    return {'project': 'p1', 'duty': 'd1'}
+
+def test_update_by_older_assignee(repo, older):
+    status, duty = server.update_duty(repo, older, {}, {'username': 'alice', 'status': 'doing'})
+    assert (status, duty['Status']) == (200, 'DOING')
+    with pytest.raises(server.HttpError) as error:
+        server.update_duty(repo, older, {}, {'username': 'bob', 'status': 'done'})
+    assert error.value.status == 400
+
+def test_assign_and_unassign_older_duty(repo, older):
+    server.assign_duty(repo, older, {}, {'username': 'bob'})
+    for repo in reloaded(repo):
+        duty = repo.get_duty('p1', 'd1')
+        assert (duty['AssignedTo'], duty['Assigned To']) == ('bob', 'bob')
+        assert [pair[1]['ID'] for pair in repo.query_duties(assignee='bob')] == ['d1']
+        assert repo.query_duties(assignee='alice') == []
+    server.unassign_duty(repo, older, {}, {})
+    for repo in reloaded(repo):
+        duty = repo.get_duty('p1', 'd1')
+        assert (duty.get('AssignedTo'), duty['Assigned To']) == (None, None)
+        assert repo.query_duties(assignee='bob') == []
+    with pytest.raises(server.HttpError):
+        server.update_duty(repo, older, {}, {'username': 'alice', 'status': 'doing'})
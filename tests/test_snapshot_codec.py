@@ -0,0 +1,79 @@
+import io
+import json
+
+import pytest
+
+import config
+import snapshot_codec
+import storage
+from benchmarks.generate import make_projects, make_users
+from snapshot_codec import SnapshotFormatError
+
+# Values of every kind the codec stores, in columns that mix kinds
+ODD_ITEMS = [
+    {'a': None, 'b': True, 'c': False, 'd': 0, 'e': -1.5, 'f': 'text', 'g': [], 'h': {}},
+    {'a': 2 ** 63 - 1, 'b': -2 ** 63, 'c': 2 ** 70, 'd': -2 ** 64, 'e': float('inf'), 'f': '', 'g': [1, 'x', None],
+     'h': {'nested': [{'deep': [True]}]}},
+    {'a': 'é ✓ line\nbreak', 'b': [[], [[]]], 'c': 1e-300},
+    {},
+    {'f': 'text', 'a': None},
+]
+
+def _items():
+    return list(make_users(20)) + list(make_projects(20, 5, 4, 30))
+
+@pytest.mark.parametrize('items', [[], ODD_ITEMS, _items()], ids=['empty', 'odd', 'generated'])
+def test_round_trip(items):
+    data = snapshot_codec.encode(items)
+    assert snapshot_codec.is_binary(data)
+    assert snapshot_codec.decode(data) == items
+    assert list(snapshot_codec.iter_decode(io.BytesIO(data))) == items
+
+def test_round_trip_across_blocks():
+    items = [{'ID': f"item{number}", 'Number': number} for number in range(snapshot_codec.BLOCK_ITEMS * 2 + 7)]
+    data = snapshot_codec.encode(items)
+    assert snapshot_codec.decode(data) == items
+    file = io.BytesIO()
+    snapshot_codec.encode_to(file, iter(items))
+    assert file.getvalue() == data
+
+# Cut anywhere, a snapshot either gives back the whole blocks before the cut
+# or fails with SnapshotFormatError; never other items or another error
+def test_truncated_input():
+    items = [{'ID': f"item{number}", 'Tags': ['a', number]} for number in range(snapshot_codec.BLOCK_ITEMS + 10)]
+    data = snapshot_codec.encode(items)
+    whole_blocks = {len(data): items}
+    for length in range(len(data)):
+        cut = data[:length]
+        try:
+            decoded = snapshot_codec.decode(cut)
+        except SnapshotFormatError:
+            with pytest.raises(SnapshotFormatError):
+                list(snapshot_codec.iter_decode(io.BytesIO(cut)))
+            continue
+        assert decoded == items[:len(decoded)]
+        assert list(snapshot_codec.iter_decode(io.BytesIO(cut))) == decoded
+        whole_blocks[length] = decoded
+    # only the end of the magic and the end of the first block decode
+    assert sorted(len(decoded) for decoded in whole_blocks.values()) == [0, snapshot_codec.BLOCK_ITEMS, len(items)]
+
+def test_nul_in_string():
+    with pytest.raises(TypeError):
+        snapshot_codec.encode([{'Title': 'a\x00b'}])
+
+def test_not_binary():
+    with pytest.raises(SnapshotFormatError):
+        snapshot_codec.decode(json.dumps([{}]).encode())
+    with pytest.raises(SnapshotFormatError):
+        list(snapshot_codec.iter_decode(io.BytesIO(b'')))
+
+# Snapshots written in either format are read back the same
+@pytest.mark.parametrize('snapshot_format', ['json', 'binary'])
+def test_storage_reads_either_format(monkeypatch, snapshot_format):
+    monkeypatch.setattr(config, 'SNAPSHOT_FORMAT', snapshot_format)
+    projects = list(make_projects(10, 3, 2, 5))
+    storage.save_json_projects(projects)
+    with open('projects.json', 'rb') as file:
+        assert snapshot_codec.is_binary(file.read()) == (snapshot_format == 'binary')
+    assert storage.load_json_projects() == projects
+    assert list(storage.iter_snapshot('projects.json')) == projects
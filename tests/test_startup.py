@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+from benchmarks.startup import DEFERRED_MODULES, ROOT, TARGETS, _median_ms
+
+BUDGET_MS = 150
+
+# Importing core, as the scripts and manager.py do, leaves rich and logging
+# for when something is printed or logged
+def test_import_core_defers_modules():
+    code = 'import sys, core; print(" ".join(sorted(sys.modules)))'
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True, text=True)
+    loaded = set(result.stdout.split())
+    assert 'core' in loaded
+    assert loaded.isdisjoint(DEFERRED_MODULES)
+    assert 'logging.handlers' not in loaded
+
+# The entry points start within BUDGET_MS of a bare interpreter
+def test_startup_budget():
+    baseline = _median_ms(['-c', 'pass'], 5)
+    for name, arguments in TARGETS.items():
+        assert _median_ms(arguments, 5) - baseline < BUDGET_MS, name
@@ -0,0 +1,79 @@
+import pytest
+
+import core
+from conftest import reopen, seed
+
+WRITES = ('update_duty', 'assign_duty', 'unassign_duty')
+
+# The (method, project ID, duty ID, fields) of every duty write
+@pytest.fixture
+def writes(repo, monkeypatch):
+    calls = []
+    for name in WRITES:
+        write = getattr(repo, name)
+
+        def spy(project_id, duty_id, fields, name=name, write=write):
+            calls.append((name, project_id, duty_id, dict(fields)))
+            write(project_id, duty_id, fields)
+        monkeypatch.setattr(repo, name, spy)
+    return calls
+
+@pytest.fixture
+def seeded(repo):
+    return seed(repo)
+
+def test_unchanged_commit_writes_nothing(seeded, writes):
+    version = seeded.get_project('p1')['Version']
+    stored = seeded.get_duty('p1', 'd1').copy()
+    work = core.UnitOfWork(seeded)
+    duty = work.duty('p1', 'd1')
+    work.duty('p1', 'd2')
+    # set to what they already hold
+    duty.set_title(duty.get_title())
+    duty.set_status(core.Status.TODO)
+    duty.set_assigned_to(core.intern_user('alice'))
+    assert work.commit() == 0
+    assert writes == []
+    assert seeded.get_project('p1')['Version'] == version
+    assert seeded.get_duty('p1', 'd1') == stored
+    assert [entry['kind'] for entry in seeded.get_changes('p1')] == ['created'] * 3
+
+def test_commit_writes_only_what_changed(seeded, writes):
+    work = core.UnitOfWork(seeded)
+    duty = work.duty('p1', 'd1')
+    duty.set_status(core.Status.DOING)
+    duty.set_priority(core.Priority.HIGH)
+    assert work.commit() == 1
+    assert writes == [('update_duty', 'p1', 'd1', {'Status': 'DOING', 'Priority': 'HIGH'})]
+    # and nothing again once it is written
+    assert work.commit() == 0
+    assert len(writes) == 1
+    stored = reopen().get_duty('p1', 'd1')
+    assert (stored['Status'], stored['Priority']) == ('DOING', 'HIGH')
+    assert (stored['StartTime'], stored['FinishTime']) == ('2030-01-01 00:00:00', '2030-01-02 00:00:00')
+
+def test_assigning_the_assignee_writes_nothing(seeded, writes):
+    core.assign_duty_to_member('p1', 'd1', 'alice')
+    assert writes == []
+    core.assign_duty_to_member('p1', 'd1', 'bob')
+    assert [(name, fields) for name, _, _, fields in writes] == [('assign_duty', {'AssignedTo': 'bob'})]
+    assert reopen().get_duty('p1', 'd1')['AssignedTo'] == 'bob'
+
+# What was loaded is kept per unit of work, so one that changed nothing does
+# not write back what it loaded over another's change
+def test_units_of_work_do_not_share_state(seeded, writes):
+    first = core.UnitOfWork(seeded)
+    second = core.UnitOfWork(seeded)
+    first.duty('p1', 'd1')
+    second.duty('p1', 'd1').set_title('Renamed')
+    assert second.commit() == 1
+    assert first.commit() == 0
+    assert seeded.get_duty('p1', 'd1')['Title'] == 'Renamed'
+
+def test_changed_id_is_refused(seeded, writes):
+    work = core.UnitOfWork(seeded)
+    work.duty('p1', 'd1').set_ID('d9')
+    with pytest.raises(ValueError):
+        work.commit()
+    assert writes == []
+    assert work.duty('p1', 'missing') is None
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+from instrumentation import add_count, measure
+from journal import USER_CREATED, journal_path, read_journal
+from locking import atomic_write
+
+# Username index of the JSON and sharded storage, so a login reads a few
+# pages of one file instead of parsing every account. users.index holds:
+#
+#   a header: MAGIC, the number of slots, the number of users, the size of
+#   the data area, the users files the index describes (see below);
+#   an open addressing hash table of (username hash, record offset) slots,
+#   at most half full;
+#   the data area: each user as a u32 length and its JSON.
+#
+# Lookups map the file read-only and probe the table, so they read the
+# header, a slot or two and one record.
+#
+# The index holds the users of one snapshot (the header has its inode, size
+# and mtime) and of the first journal_offset bytes of the journal after it.
+# Accounts are only ever added, so it is brought up to date by adding the
+# users of the journal records written after that (update(), run by whoever
+# appended them, holding the users lock), and a lookup that misses checks
+# those records too. Any other snapshot makes the index stale: compaction
+# writes a new one, and the first lookup after e.g. SaveUsers raises
+# StaleIndex, upon which the caller loads the users and writes one.
+#
+# update() changes the file in place. It writes the new records, then their
+# slots, then the header, and lookups check that a slot's record holds the
+# username they look for, so a lookup running meanwhile finds the user or
+# falls back to the journal. Growing the table rewrites the whole file.
+
+MAGIC = b'TRLMUIX1'
+# magic, slots, users, data size, snapshot inode, size and mtime, journal
+# inode, journal offset
+_HEADER = struct.Struct('<8s8Q')
+_SLOT = struct.Struct('<QQ')
+_LENGTH = struct.Struct('<I')
+MIN_SLOTS = 1024
+
+class StaleIndex(Exception):
+    pass
+
+def user_index_path(users_path):
+    return os.path.splitext(users_path)[0] + '.index'
+
+def _username_hash(username):
+    # never 0, which marks an empty slot
+    return int.from_bytes(hashlib.blake2b(username.encode(), digest_size=8).digest(), 'little') or 1
+
+def _slots_for(count):
+    slots = MIN_SLOTS
+    while slots < count * 2:
+        slots *= 2
+    return slots
+
+def _encode_user(user):
+    data = json.dumps(user).encode()
+    return _LENGTH.pack(len(data)) + data
+
+# Puts key into the first free slot from its home slot on, in the table held
+# in buffer from position start
+def _insert(buffer, start, slots, key, offset):
+    mask = slots - 1
+    slot = key & mask
+    while _SLOT.unpack_from(buffer, start + slot * _SLOT.size)[0]:
+        slot = (slot + 1) & mask
+    _SLOT.pack_into(buffer, start + slot * _SLOT.size, key, offset)
+
+# The user stored under username in an index mapped or read into buffer, or
+# None
+def _probe(buffer, header, username):
+    slots, data_size = header[1], header[3]
+    data_start = _HEADER.size + slots * _SLOT.size
+    key = _username_hash(username)
+    mask = slots - 1
+    slot = key & mask
+    while True:
+        slot_key, offset = _SLOT.unpack_from(buffer, _HEADER.size + slot * _SLOT.size)
+        if not slot_key:
+            return None
+        if slot_key == key and offset + _LENGTH.size <= data_size:
+            length, = _LENGTH.unpack_from(buffer, data_start + offset)
+            if offset + _LENGTH.size + length <= data_size:
+                start = data_start + offset + _LENGTH.size
+                user = json.loads(buffer[start:start + length])
+                if user.get('username') == username:
+                    return user
+        slot = (slot + 1) & mask
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return (0, 0, 0)
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+# Raises StaleIndex unless header describes the users files as they are now
+def _check(users_path, header):
+    if header[0] != MAGIC or header[1] < MIN_SLOTS or header[1] & (header[1] - 1):
+        raise StaleIndex("Not a username index.")
+    if tuple(header[4:7]) != _signature(users_path):
+        raise StaleIndex("The username index is of another users snapshot.")
+    journal_ino, journal_size, _ = _signature(journal_path(users_path))
+    journal_offset = header[8]
+    if journal_offset and (journal_ino != header[7] or journal_size < journal_offset):
+        raise StaleIndex("The username index is of another users journal.")
+
+# The user in journal records after offset, or None
+def _find_in_journal(users_path, username, offset):
+    for record, _ in read_journal(journal_path(users_path), offset):
+        if record['type'] == USER_CREATED and record['user']['username'] == username:
+            return record['user']
+    return None
+
+def lookup(users_path, username):
+    try:
+        file = open(user_index_path(users_path), 'rb')
+    except FileNotFoundError:
+        raise StaleIndex("There is no username index.")
+    with measure('disk'), file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise StaleIndex("The username index is empty.")
+        with data:
+            if len(data) < _HEADER.size:
+                raise StaleIndex("The username index is truncated.")
+            header = _HEADER.unpack_from(data)
+            _check(users_path, header)
+            if len(data) < _HEADER.size + header[1] * _SLOT.size + header[3]:
+                raise StaleIndex("The username index is truncated.")
+            user = _probe(data, header, username)
+    add_count('records_scanned', 1)
+    if user is None:
+        user = _find_in_journal(users_path, username, header[8])
+    return user
+
+def _write(users_path, slots, count, table, data, snapshot_sig, journal_ino, journal_offset):
+    header = _HEADER.pack(MAGIC, slots, count, len(data), *snapshot_sig, journal_ino, journal_offset)
+    with measure('disk'):
+        atomic_write(user_index_path(users_path), lambda file: file.writelines([header, table, data]), 'wb')
+    add_count('bytes_written', len(header) + len(table) + len(data))
+
+# Writes a new index of users, which are the users of the snapshot with
+# signature snapshot_sig (inode, size, mtime) and of the journal with inode
+# journal_ino up to journal_offset. Like replaying the journal, the first
+# user with a username is the one kept.
+def build(users_path, users, snapshot_sig, journal_ino, journal_offset):
+    with measure('serialize'):
+        records = []
+        keys = []
+        seen = set()
+        for user in users:
+            if user['username'] not in seen:
+                seen.add(user['username'])
+                keys.append(_username_hash(user['username']))
+                records.append(_encode_user(user))
+        slots = _slots_for(len(records))
+        table = bytearray(slots * _SLOT.size)
+        offset = 0
+        for key, record in zip(keys, records):
+            _insert(table, 0, slots, key, offset)
+            offset += len(record)
+        data = b''.join(records)
+    _write(users_path, slots, len(records), table, data, snapshot_sig, journal_ino, journal_offset)
+
+# Adds the users created by journal records after the ones the index holds.
+# The caller holds the users lock, so no one else updates it meanwhile.
+def update(users_path):
+    path = user_index_path(users_path)
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        raise StaleIndex("There is no username index.")
+    try:
+        header = _HEADER.unpack(os.pread(fd, _HEADER.size, 0).ljust(_HEADER.size, b'\0'))
+        _check(users_path, header)
+        _, slots, count, data_size, *snapshot_sig, journal_ino, journal_offset = header
+        end = journal_offset
+        users = []
+        for record, end in read_journal(journal_path(users_path), journal_offset):
+            if record['type'] == USER_CREATED:
+                users.append(record['user'])
+        if end == journal_offset:
+            return
+        journal_ino = _signature(journal_path(users_path))[0]
+        table_size = slots * _SLOT.size
+        with mmap.mmap(fd, 0) as index:
+            seen = set()
+            new = []
+            for user in users:
+                if user['username'] not in seen and _probe(index, header, user['username']) is None:
+                    new.append(user)
+                seen.add(user['username'])
+            if (count + len(new)) * 2 > slots:
+                # full enough to grow: copy the slots into a bigger table
+                # (records keep their offsets in the data area) and write a
+                # new file
+                keys = [(key, offset) for key, offset in _SLOT.iter_unpack(index[_HEADER.size:_HEADER.size + table_size]) if key]
+                data = index[_HEADER.size + table_size:_HEADER.size + table_size + data_size]
+                slots = _slots_for(count + len(new))
+                table = bytearray(slots * _SLOT.size)
+                for key, offset in keys:
+                    _insert(table, 0, slots, key, offset)
+                records = []
+                offset = len(data)
+                for user in new:
+                    record = _encode_user(user)
+                    _insert(table, 0, slots, _username_hash(user['username']), offset)
+                    records.append(record)
+                    offset += len(record)
+                _write(users_path, slots, count + len(new), table, data + b''.join(records),
+                       snapshot_sig, journal_ino, end)
+                return
+            records = []
+            offset = data_size
+            for user in new:
+                record = _encode_user(user)
+                records.append((user['username'], offset))
+                offset += len(record)
+                os.pwrite(fd, record, _HEADER.size + table_size + offset - len(record))
+            for username, record_offset in records:
+                _insert(index, _HEADER.size, slots, _username_hash(username), record_offset)
+            _HEADER.pack_into(index, 0, MAGIC, slots, count + len(new), offset, *snapshot_sig, journal_ino, end)
+            index.flush()
+        add_count('bytes_written', offset - data_size)
+    finally:
+        os.close(fd)